@@ -1,67 +1,182 @@
 # --- ai_analysis.py ---
-import re
+# The pipeline's stages overlap: while LLM triage runs, the synthesis log
+# reduction is prepared and the KB is searched for the rule engine's candidate
+# codes, so an analysis waits for roughly its slowest stage rather than the sum
+# of them. Branches for codes triage did not pick are canceled. Each stage has a
+# deadline; past it the analysis degrades (rule triage, no KB context, or the
+# KB hits alone) instead of hanging, and the degraded result is not cached.
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from dataclasses import dataclass
+from typing import Iterator
+
 import psycopg2
-import google.generativeai as genai
-from sentence_transformers import SentenceTransformer
 from config import GEMINI_API_KEY
+import analysis_cache
+import kb_search
+import log_reducer
+import telemetry
+import triage_rules
+from triage_rules import Finding
+
+LLM_NOT_CONFIGURED = "Gemini AI model not configured."
+SYNTHESIS_FAILED = "An error occurred while generating the final AI analysis."
+SYNTHESIS_INTERRUPTED = "_The AI analysis was interrupted before it finished._"
+SYNTHESIS_TIMED_OUT = "_The AI analysis did not finish in time._"
+KB_ERROR_PREFIX = "Database connection error"
+KB_TIMED_OUT = "Knowledge base lookup timed out; no work instructions are available."
+TRIAGE_TOKEN_BUDGET = 1000
+SYNTHESIS_TOKEN_BUDGET = log_reducer.TOKEN_BUDGET
+
+# Stage deadlines in seconds. A call still running past its deadline is abandoned, not interrupted.
+# LLM deadlines run from when the call starts; waiting for a free LLM worker has an allowance of the same length.
+TRIAGE_DEADLINE = 20.0                  # LLM triage; past it the rule engine's primary finding is used
+KB_DEADLINE = 10.0                      # KB hits, once the error code is known; past it synthesis runs without them
+SYNTHESIS_FIRST_TOKEN_DEADLINE = 30.0   # past it the answer is the KB hits alone
+SYNTHESIS_DEADLINE = 180.0              # whole synthesis; past it the partial answer is closed with the KB hits
+REDUCTION_DEADLINE = 5.0                # prefetched synthesis log reduction, from the start of the analysis;
+                                        # past it the log is reduced inline
+SPECULATIVE_KB_CANDIDATES = 3           # rule candidates searched in the KB while LLM triage runs
+STAGE_WORKERS = 16                      # KB searches and log reductions
+LLM_WORKERS = 32                        # blocking Gemini calls, including abandoned ones still waiting for an answer
+
+_pools: dict[str, ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+def _get_pool(name: str) -> ThreadPoolExecutor:
+    """The process-wide "stage" or "llm" pool, created on first use."""
+    if name not in _pools:
+        with _pools_lock:
+            if name not in _pools:
+                _pools[name] = ThreadPoolExecutor(max_workers=LLM_WORKERS if name == "llm" else STAGE_WORKERS,
+                                                  thread_name_prefix=f"analysis-{name}")
+    return _pools[name]
+
+def _submit(fn, *args, pool: str = "stage") -> Future:
+    """Runs fn in a pipeline pool with the caller's telemetry span and tags."""
+    return _get_pool(pool).submit(contextvars.copy_context().run, fn, *args)
+
+def _llm_result(fn, *args, deadline: float):
+    """Runs a blocking LLM call in the LLM pool and returns its result.
+
+    Raises FutureTimeout if the call has not started within deadline (it is then
+    canceled and never reaches the model) or not returned within deadline of starting.
+    """
+    started = threading.Event()
+
+    def call():
+        started.set()
+        return fn(*args)
 
-# --- Configuration ---
-DB_NAME = "amai_knowledge_db"
-DB_USER = "amai_user"
-DB_PASSWORD = "Amazone@9" # <-- SET YOUR DB PASSWORD
-DB_HOST = "192.168.2.226"
-DB_PORT = "5432"
-
-try:
-    genai.configure(api_key=GEMINI_API_KEY)
-    llm = genai.GenerativeModel('gemini-2.0-flash')
-except Exception as e:
-    print(f"Error configuring Gemini: {e}")
-    llm = None
-
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-
-def _extract_error_from_log(sysout_text: str) -> str | None:
-    if not llm: return "Gemini AI model not configured."
-    abend_match = re.search(r"(S[0-9A-F]{3}|U\d{4})", sysout_text)
-    if abend_match: return abend_match.group(1)
-    prompt = f"Find the most important error code or abend code from this mainframe log. Examples: S0C7, U4088, RC=08. If the job is successful (RC=0000), return 'RC=0000'. Return ONLY the code. LOG:\n{sysout_text[:4000]}"
+    future = _submit(call, pool="llm")
+    if not started.wait(deadline) and future.cancel():
+        raise FutureTimeout(f"no LLM worker free within {deadline:g}s")
     try:
-        response = llm.generate_content(prompt)
-        error_code = response.text.strip()
+        return future.result(timeout=deadline)
+    except FutureTimeout:
+        future.cancel()
+        raise
+
+# The Gemini client is created by get_llm() on first use, since importing
+# google.generativeai alone takes about half a second. Assigning llm directly
+# (e.g. an llm_stub.StubLLM) replaces it.
+llm = None
+_llm_configured = False
+_llm_lock = threading.Lock()
+
+def get_llm():
+    """Returns the Gemini model, configuring it on first call, or None if it could not be configured."""
+    global llm, _llm_configured
+    if llm is None and not _llm_configured:
+        with _llm_lock:
+            if llm is None and not _llm_configured:
+                try:
+                    with telemetry.span("llm.configure"):
+                        import google.generativeai as genai
+                        genai.configure(api_key=GEMINI_API_KEY)
+                        llm = genai.GenerativeModel('gemini-2.0-flash')
+                except Exception as e:
+                    print(f"Error configuring Gemini: {e}")
+                _llm_configured = True
+    return llm
+
+def _record_tokens(span: telemetry.Span, stage: str, prompt: str, answer: str, usage=None):
+    """Puts prompt/response token counts on the span and the token counters, estimated when the model reports none."""
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    response_tokens = getattr(usage, "candidates_token_count", None)
+    estimated = prompt_tokens is None or response_tokens is None
+    if prompt_tokens is None: prompt_tokens = log_reducer.estimate_tokens(prompt)
+    if response_tokens is None: response_tokens = log_reducer.estimate_tokens(answer)
+    span.set(prompt_tokens=prompt_tokens, response_tokens=response_tokens, tokens_estimated=estimated)
+    telemetry.count("llm_tokens", prompt_tokens, stage=stage, kind="prompt")
+    telemetry.count("llm_tokens", response_tokens, stage=stage, kind="response")
+
+def _extract_error_from_log(sysout_text: str, triage: triage_rules.TriageResult | None = None) -> tuple[str | None, Finding | None, bool]:
+    """Returns the primary error code, where it occurred when the rule engine found it, and whether LLM triage timed out."""
+    with telemetry.span("triage") as span:
+        error_code, finding = _triage(sysout_text, span, triage or triage_rules.triage(sysout_text))
+        span.set(error_code=error_code)
+        return error_code, finding, bool(span.attributes.get("timed_out"))
+
+def _triage(sysout_text: str, span: telemetry.Span, triage: triage_rules.TriageResult) -> tuple[str | None, Finding | None]:
+    primary = triage.primary
+    if triage.confident:
+        print(f"Rule triage identified: {primary.code} (step {primary.step}, lines {primary.line_start}-{primary.line_end})")
+        span.set(method="rules")
+        return primary.code, primary
+    model = get_llm()
+    if not model:
+        span.set(method="rules_fallback")
+        return (primary.code, primary) if primary else (LLM_NOT_CONFIGURED, None)
+    span.set(method="llm")
+    hint = f" Pattern matching found these candidates: {', '.join(triage.candidate_codes())}." if triage.findings else ""
+    prompt = f"Find the most important error code or abend code from this mainframe log. Examples: S0C7, U4088, RC=08. If the job is successful (RC=0000), return 'RC=0000'.{hint} Return ONLY the code. LOG:\n{log_reducer.reduce_sysout(sysout_text, TRIAGE_TOKEN_BUDGET, triage).text}"
+    try:
+        with telemetry.span("llm.triage") as llm_span:
+            response = _llm_result(model.generate_content, prompt, deadline=TRIAGE_DEADLINE)
+            error_code = response.text.strip()
+            _record_tokens(llm_span, "triage", prompt, error_code, getattr(response, "usage_metadata", None))
         print(f"LLM Triage identified: {error_code}")
-        return error_code
+        return error_code, next((f for f in triage.findings if f.code == error_code), None)
+    except FutureTimeout:
+        print(f"LLM Triage did not answer within {TRIAGE_DEADLINE:g}s; using rule triage.")
+        span.set(method="rules_fallback", timed_out=True)
+        telemetry.count("stage_deadline_exceeded", stage="triage")
+        return (primary.code, primary) if primary else (None, None)
     except Exception as e:
         print(f"LLM Triage Error: {e}")
-        return None
+        span.set(method="rules_fallback")
+        return (primary.code, primary) if primary else (None, None)
 
-def _query_vector_db(query_text: str) -> str:
-    if query_text == "RC=0000": return "The job was successful (RC=0000). No knowledge base lookup needed."
-    query_embedding = embedding_model.encode(query_text)
+def _query_vector_db(query_text: str) -> tuple[str, int]:
+    """Returns the KB context for the synthesis prompt and the number of work instructions in it."""
+    if query_text == "RC=0000": return "The job was successful (RC=0000). No knowledge base lookup needed.", 0
     try:
-        conn = psycopg2.connect(dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT)
-    except psycopg2.OperationalError as e:
-        return f"Database connection error: {e}"
+        with telemetry.span("kb.search", query=query_text) as span:
+            results = kb_search.search_work_instructions(query_text)
+            span.set(hits=len(results))
+    except psycopg2.Error as e:
+        return f"{KB_ERROR_PREFIX}: {e}", 0
     results_text = ""
-    with conn.cursor() as cur:
-        # --- THIS IS THE FIX ---
-        cur.execute("SELECT title, resolution_steps FROM work_instructions ORDER BY embedding <=> %s LIMIT 2", (str(query_embedding.tolist()),))
-        results = cur.fetchall()
-    conn.close()
-    if not results: return "No specific work instructions were found for this error in the knowledge base."
+    if not results: return "No specific work instructions were found for this error in the knowledge base.", 0
     results_text += "Relevant Work Instructions Found:\n"
-    for title, resolution_steps in results:
-        results_text += f"- Title: {title}\n  Resolution: {resolution_steps}\n"
+    for doc in results:
+        results_text += f"- Title: {doc.title}\n  Resolution: {doc.resolution_steps}\n"
     print("Found relevant documents in Vector DB.")
-    return results_text
+    return results_text, len(results)
 
-def _synthesize_final_answer(sysout_text: str, kb_results: str) -> str:
-    if not llm: return "Gemini AI model not configured."
-    master_prompt = f"""You are an expert z/OS Mainframe Systems Programmer. Analyze the job log and internal documentation to provide a clear resolution plan.
+def _synthesis_prompt(sysout_text: str, kb_results: str, reduced: log_reducer.ReducedLog | None = None) -> str:
+    reduced = reduced or log_reducer.reduce_sysout(sysout_text, SYNTHESIS_TOKEN_BUDGET)
+    if reduced.reduced:
+        print(f"Sysout reduced for synthesis: {reduced.manifest_summary()}")
+    return f"""You are an expert z/OS Mainframe Systems Programmer. Analyze the job log and internal documentation to provide a clear resolution plan.
     Provide: Executive Summary, Root Cause Analysis, and a Step-by-Step Resolution Plan.
     ---
-    BEGIN Original Job Log:
-    {sysout_text}
+    BEGIN Original Job Log ({reduced.manifest_summary()}):
+    {reduced.text}
     ---
     END Original Job Log.
     ---
@@ -70,19 +185,216 @@ def _synthesize_final_answer(sysout_text: str, kb_results: str) -> str:
     ---
     END Internal Knowledge Base.
     """
+
+def _stream_synthesis(sysout_text: str, kb_results: str, reduced: log_reducer.ReducedLog | None = None) -> Iterator[str]:
+    """Yields the final answer in fragments as the model produces them."""
+    print("Synthesizing final answer with LLM (streaming)...")
+    prompt = _synthesis_prompt(sysout_text, kb_results, reduced)
+    with telemetry.span("llm.synthesis") as span:
+        started = time.perf_counter()
+        parts = []
+        usage = None
+        try:
+            for chunk in get_llm().generate_content(prompt, stream=True):
+                usage = getattr(chunk, "usage_metadata", None) or usage  # Gemini reports usage on the last chunk
+                try:
+                    text = chunk.text
+                except ValueError:
+                    continue  # a chunk with no text parts, e.g. only safety ratings
+                if text:
+                    if not parts:
+                        telemetry.record_span("llm.first_token", time.perf_counter() - started)
+                    parts.append(text)
+                    yield text
+        finally:
+            _record_tokens(span, "synthesis", prompt, "".join(parts), usage)
+
+class SynthesisTimeout(TimeoutError):
+    pass
+
+def _stream_with_deadline(fragments: Iterator[str], first_token_deadline: float, deadline: float) -> Iterator[str]:
+    """Relays fragments produced in the LLM pool. Raises SynthesisTimeout when a deadline passes.
+
+    The deadlines run from when the producer starts; it may wait first_token_deadline
+    for a free worker. Once the relay is abandoned, a producer still queued never
+    calls the model, and a running one stops before asking for the next fragment.
+    """
+    relay: queue.Queue = queue.Queue()
+    stop = threading.Event()
+    begin, end = object(), object()
+
+    def produce():
+        try:
+            if stop.is_set():
+                return
+            relay.put(begin)
+            for fragment in fragments:
+                relay.put(fragment)
+                if stop.is_set():
+                    break
+        except Exception as e:
+            relay.put(e)
+        finally:
+            fragments.close()
+            relay.put(end)
+
+    queued = time.monotonic()
+    future = _submit(produce, pool="llm")
+    started = None
+    first = True
     try:
-        print("Synthesizing final answer with LLM...")
-        response = llm.generate_content(master_prompt)
-        return response.text
-    except Exception as e:
-        print(f"LLM Synthesis Error: {e}")
-        return "An error occurred while generating the final AI analysis."
-
-def hybrid_analysis_pipeline(sysout_text: str) -> str:
-    if not sysout_text: return "Log is empty."
-    error_code = _extract_error_from_log(sysout_text)
-    if not error_code: return "Could not determine the primary error."
-    if error_code == "RC=0000": return "✅ **AI Analysis:** The job log indicates a successful completion (RC=0000)."
-    kb_results = _query_vector_db(error_code)
-    final_analysis = _synthesize_final_answer(sysout_text, kb_results)
-    return f"### 🧠 **AI-Powered Analysis for '{error_code}'**\n\n" + final_analysis
\ No newline at end of file
+        while True:
+            since, limit, waiting_for = ((queued, first_token_deadline, "free LLM worker") if started is None else
+                                         (started, first_token_deadline, "first token") if first else
+                                         (started, deadline, "end of answer"))
+            try:
+                item = relay.get(timeout=max(0.0, limit - (time.monotonic() - since)))
+            except queue.Empty:
+                raise SynthesisTimeout(f"no {waiting_for} within {limit:g}s") from None
+            if item is begin:
+                started = time.monotonic()
+                continue
+            if item is end:
+                return
+            if isinstance(item, Exception):
+                raise item
+            first = False
+            yield item
+    finally:
+        stop.set()
+        future.cancel()
+
+def _kb_only_answer(kb_results: str, hits: int) -> str:
+    """The degraded answer when synthesis times out: the work instructions found, if any."""
+    return f"{SYNTHESIS_TIMED_OUT}\n\n{kb_results}" if hits else SYNTHESIS_TIMED_OUT
+
+@dataclass
+class AnalysisEvent:
+    kind: str                   # triage, kb, token or done
+    text: str = ""              # triage: error code; kb: one-line summary; token: answer fragment; done: full analysis
+    step: str | None = None     # triage: failing step, when known
+    hits: int = 0               # kb: number of work instructions found
+    complete: bool = False      # done: whether the analysis is complete enough to cache
+    cached: bool = False        # done: served from the analysis cache
+
+def _speculative_codes(triage: triage_rules.TriageResult) -> list[str]:
+    """The codes worth a KB search before triage has decided: the rule engine's primary code first."""
+    if triage.primary is None:
+        return []
+    if triage.confident:
+        return [triage.primary.code]
+    return list(dict.fromkeys([triage.primary.code, *triage.candidate_codes(SPECULATIVE_KB_CANDIDATES)]))
+
+def _kb_stage(kb_futures: dict[str, Future], error_code: str) -> tuple[str, int]:
+    """KB context for error_code, from its speculative search when there was one. Cancels the others."""
+    future = kb_futures.pop(error_code, None)
+    telemetry.count("speculative_kb", result="hit" if future else "miss")
+    for stale in kb_futures.values():
+        stale.cancel()
+    kb_futures.clear()
+    future = future or _submit(_query_vector_db, error_code)
+    try:
+        return future.result(timeout=KB_DEADLINE)
+    except FutureTimeout:
+        future.cancel()
+        print(f"KB lookup for {error_code} did not finish within {KB_DEADLINE:g}s; synthesizing without it.")
+        telemetry.count("stage_deadline_exceeded", stage="kb")
+        return KB_TIMED_OUT, 0
+
+def _pipeline_events(sysout_text: str) -> Iterator[AnalysisEvent]:
+    """Runs triage, KB lookup and synthesis, yielding each stage's result as soon as it is known.
+
+    The KB searches for the rule engine's candidates and the synthesis log
+    reduction start before triage, in the stage pool; whatever is still pending
+    when it is no longer needed is canceled.
+    """
+    triage = triage_rules.triage(sysout_text)
+    started = time.monotonic()
+    reduced_future = _submit(log_reducer.reduce_sysout, sysout_text, SYNTHESIS_TOKEN_BUDGET, triage)
+    kb_futures = {code: _submit(_query_vector_db, code) for code in _speculative_codes(triage)}
+    try:
+        yield from _pipeline_stages(sysout_text, triage, reduced_future, kb_futures, started)
+    finally:
+        reduced_future.cancel()
+        for future in kb_futures.values():
+            future.cancel()
+
+def _reduction_stage(sysout_text: str, triage: triage_rules.TriageResult, future: Future,
+                     started: float) -> log_reducer.ReducedLog:
+    """The prefetched synthesis log reduction, or one made inline if the stage pool has not finished it in time."""
+    try:
+        return future.result(timeout=max(0.0, REDUCTION_DEADLINE - (time.monotonic() - started)))
+    except FutureTimeout:
+        future.cancel()
+        telemetry.count("stage_deadline_exceeded", stage="reduction")
+        return log_reducer.reduce_sysout(sysout_text, SYNTHESIS_TOKEN_BUDGET, triage)
+
+def _pipeline_stages(sysout_text: str, triage: triage_rules.TriageResult, reduced_future: Future,
+                     kb_futures: dict[str, Future], started: float) -> Iterator[AnalysisEvent]:
+    error_code, finding, triage_timed_out = _extract_error_from_log(sysout_text, triage)
+    step = finding.step if finding else None
+    yield AnalysisEvent("triage", error_code or "", step=step)
+    if not error_code:
+        yield AnalysisEvent("done", "Could not determine the primary error.")
+        return
+    if error_code == "RC=0000":
+        yield AnalysisEvent("done", "✅ **AI Analysis:** The job log indicates a successful completion (RC=0000).",
+                            complete=not triage_timed_out)
+        return
+    kb_results, hits = _kb_stage(kb_futures, error_code)
+    kb_failed = kb_results.startswith(KB_ERROR_PREFIX) or kb_results == KB_TIMED_OUT
+    yield AnalysisEvent("kb", kb_results if kb_failed else f"{hits} matching work instruction(s) found.", hits=hits)
+
+    location = f" in step `{step}`" if step else ""
+    parts = [f"### 🧠 **AI-Powered Analysis for '{error_code}'{location}**\n\n"]
+    yield AnalysisEvent("token", parts[0])
+    complete = error_code != LLM_NOT_CONFIGURED and not kb_failed and not triage_timed_out
+    if not get_llm():
+        parts.append(LLM_NOT_CONFIGURED)
+        complete = False
+        yield AnalysisEvent("token", parts[-1])
+    else:
+        try:
+            reduced = _reduction_stage(sysout_text, triage, reduced_future, started)
+            fragments = _stream_synthesis(sysout_text, kb_results, reduced)
+            for fragment in _stream_with_deadline(fragments, SYNTHESIS_FIRST_TOKEN_DEADLINE, SYNTHESIS_DEADLINE):
+                parts.append(fragment)
+                yield AnalysisEvent("token", fragment)
+        except SynthesisTimeout as e:
+            print(f"LLM Synthesis timed out: {e}")
+            telemetry.count("stage_deadline_exceeded", stage="synthesis")
+            answer = _kb_only_answer(kb_results, hits)
+            parts.append(f"\n\n{answer}" if len(parts) > 1 else answer)
+            complete = False
+            yield AnalysisEvent("token", parts[-1])
+        except Exception as e:
+            print(f"LLM Synthesis Error: {e}")
+            parts.append(f"\n\n{SYNTHESIS_INTERRUPTED}" if len(parts) > 1 else SYNTHESIS_FAILED)
+            complete = False
+            yield AnalysisEvent("token", parts[-1])
+    yield AnalysisEvent("done", "".join(parts), complete=complete)
+
+def hybrid_analysis_stream(sysout_text: str, use_cache: bool = True) -> Iterator[AnalysisEvent]:
+    """Streaming form of hybrid_analysis_pipeline. The last event is always kind 'done' with the full analysis."""
+    if not sysout_text:
+        yield AnalysisEvent("done", "Log is empty.")
+        return
+    cache = analysis_cache.get_cache() if use_cache else None
+    if cache:
+        fingerprint = analysis_cache.fingerprint(sysout_text)
+        cached = cache.get(fingerprint)
+        telemetry.count("analysis_cache", result="hit" if cached else "miss")
+        if cached:
+            print(f"Analysis cache hit for sysout fingerprint {fingerprint[:12]}.")
+            yield AnalysisEvent("done", cached, complete=True, cached=True)
+            return
+    with telemetry.span("analysis"):
+        for event in _pipeline_events(sysout_text):
+            if event.kind == "done" and cache and event.complete:
+                cache.put(fingerprint, event.text)
+            yield event
+
+def hybrid_analysis_pipeline(sysout_text: str, use_cache: bool = True) -> str:
+    for event in hybrid_analysis_stream(sysout_text, use_cache):
+        if event.kind == "done":
+            return event.text
@@ -0,0 +1,198 @@
+# --- analysis_cache.py ---
+# Cache of finished sysout analyses, keyed by a fingerprint of the sysout with
+# run-specific noise (JES job IDs, dates, times, sequence numbers) removed, so
+# the same abend on tonight's run hits the entry written for last night's.
+#
+# Two tiers: an in-process LRU in front of a SQLite file that survives
+# restarts and is shared by every worker on the host. Entries carry the
+# work_instructions KB version they were built with; after a re-ingest they
+# no longer match and are purged. The version is checked in a background
+# thread, so a lookup never waits on the database.
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import db
+
+CACHE_PATH = "analysis_cache.sqlite3"
+MAX_MEMORY_ENTRIES = 256
+TTL_SECONDS = 24 * 3600
+KB_TABLE = "work_instructions"
+KB_VERSION_CHECK_INTERVAL = 60  # seconds
+
+# --- Normalization ---
+# A multi-line JES message ends its first line with a connecting id that starts
+# each of its continuation lines:
+#   14.22.05 JOB01234  IEA995I SYMPTOM DUMP OUTPUT  085
+#      085             SYSTEM COMPLETION CODE=0C7  REASON CODE=00000007
+# Only those ids are dropped; other numbers at line edges (condition codes,
+# counts, JCL statement numbers) stay in the fingerprint.
+_MULTILINE_MESSAGE = re.compile(
+    r"^( ?\d{1,2}\.\d{2}\.\d{2} +(?:JOB|STC|TSU|J|S|T)\d{5,7} .*?\S) +(\d{3,5})\n((?:[ \t]+\2[ \t].*(?:\n|$))+)", re.M)
+
+
+def _drop_multiline_ids(match: re.Match) -> str:
+    continuation = re.sub(rf"^[ \t]+{match.group(2)}[ \t]", " ", match.group(3), flags=re.M)
+    return f"{match.group(1)}\n{continuation}"
+
+
+_NORMALIZERS = [
+    (_MULTILINE_MESSAGE, _drop_multiline_ids),
+    (re.compile(r"\b(?:JOB|STC|TSU|J|S|T)\d{5,7}\b"), "JOB#"),
+    (re.compile(r"\b(?:MON|TUES|WEDNES|THURS|FRI|SATUR|SUN)DAY\b"), "DAY"),
+    (re.compile(r"\b(?:JANUARY|FEBRUARY|MARCH|APRIL|MAY|JUNE|JULY|AUGUST|SEPTEMBER|OCTOBER|NOVEMBER|DECEMBER) \d{1,2}, \d{4}\b"), "DATE"),
+    (re.compile(r"\b\d{1,2} (?:JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|OCT|NOV|DEC) \d{4}\b"), "DATE"),
+    (re.compile(r"\b\d{4}[-/.]\d{2}[-/.]\d{2}\b|\b\d{2}/\d{2}/\d{2,4}\b"), "DATE"),
+    (re.compile(r"\b\d{7}\.\d{4}\b"), "DATE"),                          # IEF373I 2025196.1422
+    (re.compile(r"\b\d{1,2}[.:]\d{2}[.:]\d{2}(?:[.,]\d+)?\b"), "TIME"),
+    (re.compile(r"\b(SEQ|ASID|TIME|CPU)=\S+"), r"\1=#"),
+    (re.compile(r"\b\d+MIN\s+\d+\.\d+SEC\b"), "CPUTIME"),
+    (re.compile(r"[ \t]+"), " "),
+]
+
+
+def normalize_sysout(sysout_text: str) -> str:
+    text = sysout_text
+    for pattern, replacement in _NORMALIZERS:
+        text = pattern.sub(replacement, text)
+    return text.strip()
+
+
+def fingerprint(sysout_text: str) -> str:
+    return hashlib.sha256(normalize_sysout(sysout_text).encode()).hexdigest()
+
+
+class AnalysisCache:
+    def __init__(self, path: str | None = CACHE_PATH, max_entries: int = MAX_MEMORY_ENTRIES, ttl: float = TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory: OrderedDict[str, tuple[float, str, str]] = OrderedDict()  # fp -> (created, kb_version, analysis)
+        self._lock = threading.Lock()
+        self._kb_version = "unknown"
+        self._kb_checked = 0.0
+        self._kb_refresh_lock = threading.Lock()
+        self._counters = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS analysis_cache ("
+                "fingerprint TEXT PRIMARY KEY, kb_version TEXT NOT NULL, created_at REAL NOT NULL, analysis TEXT NOT NULL)"
+            )
+            self._conn.commit()
+
+    # --- KB version tracking ---
+    def kb_version(self) -> str:
+        """The last known KB version. Starts a background check once KB_VERSION_CHECK_INTERVAL has elapsed."""
+        if time.monotonic() - self._kb_checked >= KB_VERSION_CHECK_INTERVAL:
+            self._kb_checked = time.monotonic()
+            threading.Thread(target=self.refresh_kb_version, name="analysis-cache-kb-version", daemon=True).start()
+        return self._kb_version
+
+    def refresh_kb_version(self) -> str:
+        """Reads the KB version from the database, purging entries of other versions. Returns the current version."""
+        if not self._kb_refresh_lock.acquire(blocking=False):
+            return self._kb_version
+        try:
+            self._kb_checked = time.monotonic()
+            version = db.get_kb_version(KB_TABLE)
+            # Keep the last known version while the DB is unreachable.
+            if version is not None and str(version) != self._kb_version:
+                self._invalidate(str(version))
+            return self._kb_version
+        finally:
+            self._kb_refresh_lock.release()
+
+    def _invalidate(self, new_version: str):
+        with self._lock:
+            if self._kb_version != "unknown":
+                self._counters["invalidations"] += 1
+            self._kb_version = new_version
+            self._memory = OrderedDict((k, v) for k, v in self._memory.items() if v[1] == new_version)
+            if self._conn:
+                self._conn.execute("DELETE FROM analysis_cache WHERE kb_version != ?", (new_version,))
+                self._conn.commit()
+
+    # --- Lookups ---
+    def get(self, fp: str) -> str | None:
+        version = self.kb_version()
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(fp)
+            if entry and entry[1] == version and now - entry[0] < self.ttl:
+                self._memory.move_to_end(fp)
+                self._counters["hits"] += 1
+                self._counters["memory_hits"] += 1
+                return entry[2]
+            if self._conn:
+                row = self._conn.execute(
+                    "SELECT created_at, analysis FROM analysis_cache WHERE fingerprint = ? AND kb_version = ? AND created_at > ?",
+                    (fp, version, now - self.ttl),
+                ).fetchone()
+                if row:
+                    self._remember(fp, (row[0], version, row[1]))
+                    self._counters["hits"] += 1
+                    self._counters["disk_hits"] += 1
+                    return row[1]
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, fp: str, analysis: str):
+        version = self.kb_version()
+        created = time.time()
+        with self._lock:
+            self._remember(fp, (created, version, analysis))
+            self._counters["stores"] += 1
+            if self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO analysis_cache (fingerprint, kb_version, created_at, analysis) VALUES (?, ?, ?, ?)",
+                    (fp, version, created, analysis),
+                )
+                self._conn.execute("DELETE FROM analysis_cache WHERE created_at <= ?", (created - self.ttl,))
+                self._conn.commit()
+
+    def _remember(self, fp: str, entry: tuple[float, str, str]):
+        self._memory[fp] = entry
+        self._memory.move_to_end(fp)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._conn:
+                self._conn.execute("DELETE FROM analysis_cache")
+                self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["kb_version"] = self._kb_version
+        return stats
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_cache() -> AnalysisCache:
+    """The process-wide cache, created on first use."""
+    global _default_cache
+    if _default_cache is None:
+        with _default_lock:
+            if _default_cache is None:
+                try:
+                    _default_cache = AnalysisCache()
+                except sqlite3.Error as e:
+                    print(f"Analysis cache file unavailable ({e}); caching in memory only.")
+                    _default_cache = AnalysisCache(path=None)
+    return _default_cache
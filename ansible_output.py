@@ -0,0 +1,118 @@
+# --- ansible_output.py ---
+# Single-pass parser for AWX job stdout.
+# Chunks are fed in as they arrive from AWX. The parser collects the Ansible
+# play summary lines and the mainframe sysout written between the
+# BEGIN/END MAINFRAME JOB LOG markers in the same pass. It never holds more
+# than the current partial line, so a 200 MB stdout never has to be in memory
+# as one string. Markers may appear mid-line and may be split across chunks.
+
+import re
+from dataclasses import dataclass
+
+BEGIN_MARKER = "--- BEGIN MAINFRAME JOB LOG ---"
+END_MARKER = "--- END MAINFRAME JOB LOG ---"
+# Ansible summary lines: play/task headers, per-host results and the recap.
+# Matched over many lines at once (re.M) instead of line by line.
+SUMMARY_LINES = re.compile(
+    r"^[^\S\n]*(?:PLAY \[|TASK \[|PLAY RECAP|ok:|changed:|fatal:|failed:|skipping:|unreachable:"
+    r"|[^\n]*:[^\S\n]*ok=[^\n]*changed=)[^\n]*",
+    re.M,
+)
+MAX_SUMMARY_LINE = 64 * 1024   # longer lines are never summary lines, so they are not buffered
+
+_OUTSIDE, _IN_LOG, _SKIP_LINE = range(3)
+
+
+@dataclass
+class ParsedOutput:
+    summary: str = ""
+    sysout: str | None = None        # None when no complete BEGIN/END block was found
+    bytes_read: int = 0
+
+
+class AnsibleOutputParser:
+    def __init__(self):
+        self._state = _OUTSIDE
+        self._carry = ""               # unprocessed tail: a partial line, or a possible partial marker
+        self._line_too_long = False
+        self._blocks = 0
+        self._sysout_parts: list[str] = []
+        self._summary: list[str] = []
+        self._bytes = 0
+
+    def feed(self, chunk: str):
+        self._bytes += len(chunk)
+        text = self._carry + chunk if self._carry else chunk
+        self._carry = ""
+        pos = 0
+        while pos < len(text):
+            if self._state == _OUTSIDE:
+                pos = self._scan_outside(text, pos)
+            elif self._state == _IN_LOG:
+                pos = self._scan_log(text, pos)
+            else:
+                newline = text.find("\n", pos)
+                if newline == -1:
+                    return
+                self._state = _OUTSIDE
+                pos = newline + 1
+
+    def _scan_outside(self, text: str, pos: int) -> int:
+        begin = text.find(BEGIN_MARKER, pos)
+        limit = begin if begin != -1 else len(text)
+        # Whole lines before the marker (or the end of the chunk) are candidate summary lines.
+        line_start = pos
+        if self._line_too_long:
+            newline = text.find("\n", pos, limit)
+            if newline != -1:
+                self._line_too_long = False
+                line_start = newline + 1
+        if not self._line_too_long:
+            last_newline = text.rfind("\n", line_start, limit)
+            if last_newline != -1:
+                self._summary.extend(m.group().strip() for m in SUMMARY_LINES.finditer(text, line_start, last_newline))
+                line_start = last_newline + 1
+        if begin != -1:
+            # The marker's line is not a summary line, whatever precedes the marker on it.
+            self._line_too_long = False
+            self._state = _IN_LOG
+            return begin + len(BEGIN_MARKER)
+        tail = text[line_start:]
+        if len(tail) > MAX_SUMMARY_LINE:
+            self._line_too_long = True
+            tail = tail[-(len(BEGIN_MARKER) - 1):]
+        self._carry = tail
+        return len(text)
+
+    def _scan_log(self, text: str, pos: int) -> int:
+        end = text.find(END_MARKER, pos)
+        if end != -1:
+            self._log_text(text[pos:end])
+            self._blocks += 1
+            self._state = _SKIP_LINE
+            return end + len(END_MARKER)
+        # Hold back what could be the start of the end marker or of a split "\n" escape.
+        cut = max(pos, len(text) - (len(END_MARKER) - 1))
+        if cut > pos and text[cut - 1] == "\\":
+            cut -= 1
+        self._log_text(text[pos:cut])
+        self._carry = text[cut:]
+        return len(text)
+
+    def _log_text(self, text: str):
+        if self._blocks == 0 and text:
+            # The playbook prints the sysout as a JSON string, with newlines escaped.
+            self._sysout_parts.append(text.replace("\\n", "\n"))
+
+    def close(self) -> ParsedOutput:
+        if self._state == _OUTSIDE and self._carry and not self._line_too_long:
+            self._summary.extend(m.group().strip() for m in SUMMARY_LINES.finditer(self._carry))
+        self._carry = ""
+        sysout = "".join(self._sysout_parts).strip() if self._blocks else None
+        return ParsedOutput("\n".join(self._summary), sysout, self._bytes)
+
+
+def parse_ansible_output(text: str) -> ParsedOutput:
+    parser = AnsibleOutputParser()
+    parser.feed(text)
+    return parser.close()
@@ -6,20 +6,24 @@ import warnings
 import pyotp
 import base64  # Import the base64 library
 # MODIFIED: Import the new ENABLE_TOTP flag
-from config import VERIFY_SSL, USER_SECRETS, ENABLE_TOTP
-from awx_actions import (
-    launch_job_template,
-    wait_for_job_completion,
-    get_job_output,
-    parse_mainframe_log_from_ansible_output,
-    parse_job_summary
-)
-from ai_analysis import hybrid_analysis_pipeline as analyze_sysout
-from template_selector import find_template_by_similarity
+from config import VERIFY_SSL, USER_SECRETS, ENABLE_TOTP, ADMIN_USERS
+import embedding_cache
+import telemetry
+import warmup
+from job_runner import get_runner
+from log_store import get_store, FULL_LOG, SYSOUT, MAX_SEARCH_HITS
+from ai_analysis import hybrid_analysis_stream as analyze_sysout_stream
+from template_selector import find_template_candidates, best_template, near_misses, template_parameters, extract_parameters
+
+JOB_REFRESH_SECONDS = 3  # how often the running-jobs panel re-reads the job store
+LOG_PAGE_LINES = 500     # lines per page in the log viewers
 
 # --- Page Configuration ---
 # The theme is now controlled by .streamlit/config.toml
 st.set_page_config(page_title="AMAIO", layout="wide")
+# Both run once per process. The models load in the background while the login page renders.
+warmup.start()
+telemetry.start_metrics_server()  # Prometheus scrapes /metrics; /ready is the readiness probe
 
 if not VERIFY_SSL:
     from urllib3.exceptions import InsecureRequestWarning
@@ -39,6 +43,105 @@ def check_login(username, code):
         return totp.verify(code)
     return False
 
+def job_result_message(record):
+    """Builds the chat message for a finished job record."""
+    if record.awx_job_id is None:
+        content = "Job was canceled before it launched." if record.status == "canceled" else record.error
+        return {"role": "assistant", "content": content}
+    header = f"**Job {record.awx_job_id} (`{record.template_name}`) finished: {record.status.upper()}**"
+    if record.status == "timeout":
+        header += f"\n\n⏱️ The job was canceled after exceeding its {int(record.timeout // 60)}-minute time limit."
+
+    # Logs stay in the log store; the message only refers to them by job id.
+    new_message = {"role": "assistant", "content": header, "job_id": record.awx_job_id, "logs": record.logs}
+
+    if record.error:
+        new_message["content"] += f"\n\n⚠️ {record.error}"
+
+    if record.template_name == 'joboutput':
+        if SYSOUT not in record.logs:
+            new_message["content"] += "\n\n⚠️ Could not parse mainframe sysout from the Ansible log."
+    else:
+        if record.summary:
+            new_message["content"] += f"\n\n---\n#### Execution Summary\n```bash\n{record.summary}\n```"
+    return new_message
+
+def show_log(job_id, kind, language):
+    """Paged, tail and search views of a stored log. Nothing is read from the store until the user asks."""
+    store = get_store()
+    info = store.info(job_id, kind)
+    if info is None:
+        st.caption("This log is no longer available.")
+        return
+    key = f"{kind}_{job_id}"
+    st.caption(f"{info.total_lines:,} lines, {info.total_bytes / 1_000_000:.1f} MB")
+    if not st.toggle("Show log", key=f"show_{key}"):
+        return
+    view = st.radio("View", ["Tail", "Page", "Search"], horizontal=True, key=f"view_{key}", label_visibility="collapsed")
+    if view == "Search":
+        needle = st.text_input("Search (case-insensitive)", key=f"search_{key}")
+        if needle:
+            hits = store.search(job_id, kind, needle)
+            st.caption(f"{len(hits)} matching lines" + (" (first matches only)" if len(hits) >= MAX_SEARCH_HITS else ""))
+            st.code("\n".join(f"{n + 1:>7}  {line}" for n, line in hits), language=language)
+    else:
+        if view == "Tail":
+            first, lines = store.tail(job_id, kind, LOG_PAGE_LINES)
+        else:
+            pages = max(1, -(-info.total_lines // LOG_PAGE_LINES))
+            page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, key=f"page_{key}")
+            first = (page - 1) * LOG_PAGE_LINES
+            lines = store.read_lines(job_id, kind, first, LOG_PAGE_LINES)
+        st.caption(f"Lines {first + 1:,}-{first + len(lines):,}")
+        st.code("\n".join(lines), language=language)
+    if st.button("Prepare full download", key=f"prepare_{key}"):
+        st.download_button("⬇️ Download full log", data=store.read_text(job_id, kind).encode(),
+                           file_name=f"job_{job_id}_{kind}.txt", mime="text/plain", key=f"download_{key}")
+
+def show_metrics_panel():
+    """Per-stage latency and counters for this server process, to find the slow stage without a profiler."""
+    rows = telemetry.registry.stage_summary()
+    if not rows:
+        st.caption("No pipeline activity recorded yet.")
+        return
+    ms = lambda seconds: round(seconds * 1000, 1) if seconds is not None else None
+    st.dataframe([{"stage": r["stage"], "count": r["count"], "errors": r["errors"], "p50 ms": ms(r["p50_s"]),
+                   "p95 ms": ms(r["p95_s"]), "max ms": ms(r["max_s"]), "total s": round(r["total_s"], 1)} for r in rows],
+                 hide_index=True)
+    st.markdown("**Slowest recent spans**")
+    slowest = sorted(telemetry.registry.recent_spans(), key=lambda s: s.duration, reverse=True)[:10]
+    st.dataframe([{"stage": s.name, "ms": ms(s.duration), "user": s.attributes.get("user", ""),
+                   "job": s.attributes.get("job_id", ""), "status": s.status} for s in slowest], hide_index=True)
+    st.markdown("**Counters**")
+    st.code("\n".join(f"{name} {value:g}" for name, value in telemetry.registry.counters().items()) or "none", language="text")
+    st.caption(f"Prometheus endpoint: http://{telemetry.METRICS_HOST}:{telemetry.METRICS_PORT}/metrics")
+    steps = warmup.get_warmup().status()["steps"]
+    st.caption("Warm-up: " + ", ".join(f"{name} {s['status']} ({s['seconds']:.1f}s)" for name, s in steps.items()))
+    embeddings = embedding_cache.get_cache().stats()
+    st.caption(f"Embedding cache: {embeddings['hit_rate']:.0%} hits ({embeddings['memory_hits']} memory, "
+               f"{embeddings['disk_hits']} disk, {embeddings['misses']} misses), {embeddings['memory_entries']} in memory")
+
+@st.fragment(run_every=JOB_REFRESH_SECONDS)
+def show_running_jobs():
+    """Shows this session's running jobs and turns finished ones into chat messages."""
+    runner = get_runner()
+    finished = []
+    for record_id in st.session_state.pending_jobs:
+        record = runner.store.get(record_id)
+        if record is None or record.done:
+            if record:
+                st.session_state.messages.append(job_result_message(record))
+            finished.append(record_id)
+            continue
+        job_label = f"Job {record.awx_job_id}" if record.awx_job_id else "Job"
+        status_col, cancel_col = st.columns([6, 1])
+        status_col.info(f"⏳ {job_label} (`{record.template_name}`): {record.status} for {int(record.elapsed)}s")
+        if cancel_col.button("Cancel", key=f"cancel_{record.id}", disabled=record.cancel_requested.is_set()):
+            runner.cancel(record.id)
+    if finished:
+        st.session_state.pending_jobs = [r for r in st.session_state.pending_jobs if r not in finished]
+        st.rerun()
+
 # --- Main Application ---
 if not st.session_state.get("authenticated", False):
     st.title("AMAI - Login")
@@ -81,6 +184,10 @@ else:
         st.link_button("AWX", "https://awx.znext.com")
         st.info("This chatbot Infuses AI into Mainframe Operations.")
 
+        if st.session_state.username in ADMIN_USERS:
+            with st.expander("📈 Pipeline metrics"):
+                show_metrics_panel()
+
         st.write("")
         st.write("")
         st.write("")
@@ -106,76 +213,80 @@ else:
 
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "pending_jobs" not in st.session_state:
+        st.session_state.pending_jobs = []
 
     for index, message in enumerate(st.session_state.messages):
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
 
-            if message.get("sysout"):
+            if SYSOUT in message.get("logs", ()):
                 with st.expander("View Mainframe Job Sysout"):
-                    st.code(message["sysout"], language="text")
+                    show_log(message["job_id"], SYSOUT, "text")
                     if st.button("🤖 Analyze Sysout with AI", key=f"analyze_{message['job_id']}"):
-                        with st.spinner("🧠 Activating AI analysis pipeline..."):
-                            analysis_result = analyze_sysout(message["sysout"])
-                            st.session_state.messages[index]["analysis"] = analysis_result
-                            st.rerun()
+                        # Render each pipeline stage and the answer as they arrive instead of behind a spinner.
+                        status = st.status("🧠 Activating AI analysis pipeline...", expanded=True)
+                        answer = st.empty()
+                        streamed = ""
+                        sysout = get_store().read_text(message["job_id"], SYSOUT) or ""
+                        with telemetry.tags(user=st.session_state.username, job_id=message["job_id"]):
+                            for event in analyze_sysout_stream(sysout):
+                                if event.kind == "triage":
+                                    where = f" in step `{event.step}`" if event.step else ""
+                                    status.write(f"Primary error: **{event.text}**{where}" if event.text else "Primary error could not be determined.")
+                                    status.update(label="📚 Searching the knowledge base...")
+                                elif event.kind == "kb":
+                                    status.write(f"Knowledge base: {event.text}")
+                                    status.update(label="✍️ Writing the analysis...")
+                                elif event.kind == "token":
+                                    streamed += event.text
+                                    answer.markdown(streamed + "▌")
+                                elif event.kind == "done":
+                                    st.session_state.messages[index]["analysis"] = event.text
+                                    label = "Analysis loaded from cache" if event.cached else "Analysis complete"
+                                    status.update(label=label, state="complete", expanded=False)
+                        st.rerun()
 
-            if message.get("full_log"):
+            if FULL_LOG in message.get("logs", ()):
                 with st.expander("View Full Ansible Execution Log"):
-                    st.code(message["full_log"], language="bash")
+                    show_log(message["job_id"], FULL_LOG, "bash")
             
             if message.get("analysis"):
                 st.markdown(message["analysis"])
 
+    show_running_jobs()
+
     if prompt := st.chat_input("What mainframe task would you like to do?"):
         st.session_state.messages.append({"role": "user", "content": prompt})
+        if not warmup.get_warmup().is_finished():
+            with st.spinner("Still starting up: loading the language models..."):
+                warmup.get_warmup().wait()
         
-        template_name, template_id = find_template_by_similarity(prompt)
+        with telemetry.tags(user=st.session_state.username):
+            candidates = find_template_candidates(prompt)
+        template_name, template_id = best_template(candidates)
         extra_vars = None
 
-        if template_name == "joboutput":
-            try:
-                command_parts = prompt.lower().split()
-                jobname_index = command_parts.index("jobname")
-                jobname_param = command_parts[jobname_index + 1]
-                extra_vars = {"jobname": jobname_param}
-            except (ValueError, IndexError):
+        if template_id:
+            extra_vars, problems = extract_parameters(prompt, template_parameters(template_name, template_id))
+            extra_vars = extra_vars or None
+            if problems:
                 template_id = None
-                error_msg = {"role": "assistant", "content": "Could not find a value for the `jobname` parameter. Usage: `... jobname MYJOB01 ...`"}
+                error_msg = {"role": "assistant", "content": "\n\n".join(problems)}
                 st.session_state.messages.append(error_msg)
         
         if not template_id:
             if 'error_msg' not in locals():
-                error_msg = {"role": "assistant", "content": "Sorry, I couldn't find a matching job template for your request."}
+                content = "Sorry, I couldn't find a matching job template for your request."
+                suggestions = near_misses(candidates)
+                if suggestions:
+                    options = ", ".join(f"`{c.template_name}` ({c.similarity:.2f})" for c in suggestions)
+                    content += f"\n\nDid you mean: {options}? Try rephrasing your request with the template's purpose."
+                error_msg = {"role": "assistant", "content": content}
                 st.session_state.messages.append(error_msg)
         else:
-            with st.spinner(f"Found template '{template_name}'. Launching job..."):
-                job_id = launch_job_template(template_id, extra_vars)
-            
-            if job_id:
-                with st.spinner(f"Job {job_id} is running..."):
-                    final_status = wait_for_job_completion(job_id)
-                
-                if final_status:
-                    full_ansible_log = get_job_output(job_id) or ""
-                    header = f"**Job {job_id} (`{template_name}`) finished: {final_status.upper()}**"
-                    
-                    new_message = {"role": "assistant", "content": header, "full_log": full_ansible_log, "job_id": job_id}
-
-                    if template_name == 'joboutput':
-                        mainframe_sysout = parse_mainframe_log_from_ansible_output(full_ansible_log)
-                        if mainframe_sysout:
-                            new_message["sysout"] = mainframe_sysout
-                        else:
-                            new_message["content"] += "\n\n⚠️ Could not parse mainframe sysout from the Ansible log."
-                    else:
-                        summary = parse_job_summary(full_ansible_log)
-                        if summary:
-                            new_message["content"] += f"\n\n---\n#### Execution Summary\n```bash\n{summary}\n```"
-
-                    st.session_state.messages.append(new_message)
-            else:
-                error_msg = {"role": "assistant", "content": "Error launching the job. Check the terminal for details."}
-                st.session_state.messages.append(error_msg)
+            record = get_runner().submit(template_name, template_id, extra_vars, owner=st.session_state.username)
+            st.session_state.pending_jobs.append(record.id)
+            st.session_state.messages.append({"role": "assistant", "content": f"Found template '{template_name}'. The job has been submitted; you can keep chatting while it runs."})
         
         st.rerun()
@@ -1,75 +1,429 @@
 # --- awx_actions.py ---
-import requests
-import time
+# AWX REST API access. AWXClient keeps one pooled, keep-alive requests.Session
+# for all calls, retries transient failures with jittered backoff and applies a
+# timeout to every request. It can also launch one template against many
+# LPARs or inventories at once. The module-level functions wrap a shared
+# default client for existing callers.
+import contextvars
+import random
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
 from config import AWX_HOST, AWX_API_TOKEN_READ, AWX_API_TOKEN_WRITE, VERIFY_SSL
+from ansible_output import parse_ansible_output
+import telemetry
+
+POOL_SIZE = 16             # keep-alive connections to the AWX host
+CONNECT_TIMEOUT = 5        # seconds
+READ_TIMEOUT = 15
+OUTPUT_READ_TIMEOUT = 120  # stdout of a long job can take a while to render
+OUTPUT_CHUNK_SIZE = 1 << 20   # characters per chunk when streaming stdout
+OUTPUT_PAGE_LINES = 5000      # lines per start_line/end_line page
+LIST_PAGE_SIZE = 200          # results per page of list endpoints (AWX caps page_size at 200)
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 0.5     # seconds; doubled per attempt, with full jitter
+RETRY_MAX_DELAY = 10
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+POST_RETRY_STATUSES = (429, 503)  # the request was refused, not processed, so a retried launch can't run twice
+FAN_OUT_WORKERS = 16
+
+POLL_INITIAL_DELAY = 2     # seconds; used again whenever the job changes state
+POLL_MAX_DELAY = 30
+POLL_BACKOFF = 1.5
+MAX_POLL_ERRORS = 5        # consecutive failed status reads before giving up
+TERMINAL_STATUSES = ("successful", "failed", "error", "canceled")
+
+_ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")   # colors in the raw stdout; format=txt drops them the same way
+_TOO_LARGE = "Standard Output too large to display"
+
+
+class OutputTooLarge(Exception):
+    """AWX only offers the stdout as a download (it is over AWX's STDOUT_MAX_BYTES_DISPLAY, 1 MB by default)."""
+
+
+@dataclass
+class LaunchTarget:
+    """One destination of a fan-out launch: an AWX inventory, a host limit (LPAR), extra vars, or a mix."""
+    name: str
+    inventory: int | None = None
+    limit: str | None = None
+    extra_vars: dict | None = None
+
+
+@dataclass
+class JobResult:
+    target: str
+    job_id: int | None
+    status: str
+    output: str = ""
+    elapsed: float = 0.0
+
+
+def lpar_targets(lpars) -> list[LaunchTarget]:
+    """Targets that limit a template's run to one LPAR host each, e.g. lpar_targets(["DCUF", "DCUB"])."""
+    return [LaunchTarget(name=lpar, limit=lpar) for lpar in lpars]
+
+
+class AWXClient:
+    def __init__(self, host=AWX_HOST, read_token=AWX_API_TOKEN_READ, write_token=AWX_API_TOKEN_WRITE,
+                 verify=VERIFY_SSL, pool_size=POOL_SIZE, max_retries=MAX_RETRIES,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, rate_limiter=None):
+        self.host = host.rstrip("/")
+        self.read_token = read_token
+        self.write_token = write_token
+        self.max_retries = max_retries
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.rate_limiter = rate_limiter   # a rate_limit.RateLimiter; every attempt, retries included, takes a token
+        self.session = requests.Session()
+        self.session.verify = verify
+        # Retries are handled in _request, where the method and status decide what is safe to repeat.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    # --- Transport ---
+    def _request(self, method, path, token, read_timeout=None, **kwargs):
+        """Sends one API call, retrying transient failures. Raises requests.RequestException when retries run out."""
+        url = f"{self.host}{path}"
+        headers = {'Authorization': f'Bearer {token}'}
+        timeout = (self.connect_timeout, read_timeout or self.read_timeout)
+        retry_statuses = RETRY_STATUSES if method == "GET" else POST_RETRY_STATUSES
+        attempt = 0
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            try:
+                response = self.session.request(method, url, headers=headers, timeout=timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                telemetry.count("awx_requests", method=method, status=type(e).__name__)
+                # Only a POST that never reached the server is safe to send again.
+                retryable = method == "GET" or isinstance(e, requests.exceptions.ConnectTimeout)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                telemetry.count("awx_requests", method=method, status=response.status_code)
+                if response.status_code not in retry_statuses or attempt >= self.max_retries:
+                    response.raise_for_status()
+                    return response
+                delay = self._retry_after(response) or self._backoff(attempt)
+                response.close()
+            attempt += 1
+            telemetry.count("awx_retries", method=method)
+            print(f"WARNING: {method} {path} failed transiently; retry {attempt}/{self.max_retries} in {delay:.1f}s.")
+            time.sleep(delay)
+
+    @staticmethod
+    def _backoff(attempt):
+        return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+    @staticmethod
+    def _retry_after(response):
+        try:
+            return min(float(response.headers.get("Retry-After", "")), RETRY_MAX_DELAY)
+        except ValueError:
+            return None
+
+    def _list(self, endpoint, filters):
+        """Yields the results of a list endpoint, by id, following its pages. Raises requests.RequestException on failure."""
+        params = {"order_by": "id", "page_size": LIST_PAGE_SIZE, **filters}
+        path = f"{endpoint}?{urlencode(params)}"
+        while path:
+            page = self._request("GET", path, self.read_token).json()
+            yield from page.get("results", [])
+            path = page.get("next")   # relative to the host, e.g. /api/v2/jobs/?page=2&...
+            if path and path.startswith(self.host):
+                path = path[len(self.host):]
+
+    def count(self, endpoint, **filters):
+        """The number of objects a list endpoint holds. Raises requests.RequestException on failure."""
+        return self._request("GET", f"{endpoint}?{urlencode({**filters, 'page_size': 1})}", self.read_token).json()["count"]
+
+    # --- Job templates ---
+    def list_job_templates(self, **filters):
+        """Yields the job templates matching AWX list filters (e.g. modified__gt=...). Raises requests.RequestException."""
+        return self._list("/api/v2/job_templates/", filters)
+
+    def get_survey_spec(self, template_id):
+        """Returns the survey questions of a template ([] without a survey). Raises requests.RequestException."""
+        return self._request("GET", f"/api/v2/job_templates/{template_id}/survey_spec/", self.read_token).json().get("spec") or []
+
+    # --- Jobs ---
+    def list_jobs(self, **filters):
+        """Yields the jobs matching AWX list filters (e.g. id__gte=100, status="failed"), oldest first, page by page.
+
+        Raises requests.RequestException on failure.
+        """
+        return self._list("/api/v2/jobs/", filters)
+
+    def launch_job_template(self, template_id, extra_vars=None, inventory=None, limit=None):
+        payload = {'extra_vars': extra_vars} if extra_vars else {}
+        if inventory is not None:
+            payload['inventory'] = inventory
+        if limit:
+            payload['limit'] = limit
+        try:
+            with telemetry.span("awx.launch", template_id=template_id, limit=limit) as span:
+                response = self._request("POST", f"/api/v2/job_templates/{template_id}/launch/", self.write_token, json=payload)
+                body = response.json()
+                span.set(awx_job_id=body.get("job"))
+            if body.get("ignored_fields"):
+                print(f"WARNING: Template {template_id} ignored {sorted(body['ignored_fields'])}; enable 'Prompt on launch' for them.")
+            return body.get("job")
+        except requests.exceptions.RequestException as e:
+            print(f"ERROR: Failed to launch job {template_id}. Details: {e}")
+            return None
+
+    def get_job_status(self, job_id):
+        """Returns the AWX status of a job, or None if it could not be read."""
+        try:
+            return self._request("GET", f"/api/v2/jobs/{job_id}/", self.read_token).json().get("status")
+        except requests.exceptions.RequestException as e:
+            print(f"WARNING: Could not read status of job {job_id}. Details: {e}")
+            return None
+
+    def get_job_artifacts(self, job_id):
+        """Returns the set_stats artifacts of a finished job. Raises requests.RequestException on failure."""
+        return self._request("GET", f"/api/v2/jobs/{job_id}/", self.read_token,
+                             read_timeout=OUTPUT_READ_TIMEOUT).json().get("artifacts") or {}
+
+    def cancel_job(self, job_id):
+        try:
+            self._request("POST", f"/api/v2/jobs/{job_id}/cancel/", self.write_token)
+            return True
+        except requests.exceptions.RequestException as e:
+            print(f"ERROR: Failed to cancel job {job_id}. Details: {e}")
+            return False
 
-# (All functions: launch_job_template, wait_for_job_completion, get_job_output, parse_job_summary, parse_mainframe_log_from_ansible_output are identical to the previous version and remain correct)
-# ...
-def launch_job_template(template_id, extra_vars=None):
-    url = f"{AWX_HOST}/api/v2/job_templates/{template_id}/launch/"
-    headers = {'Authorization': f'Bearer {AWX_API_TOKEN_WRITE}', 'Content-Type': 'application/json'}
-    payload = {'extra_vars': extra_vars} if extra_vars else {}
-    try:
-        response = requests.post(url, headers=headers, json=payload, timeout=15, verify=VERIFY_SSL)
-        response.raise_for_status()
-        return response.json().get("job")
-    except requests.exceptions.RequestException as e:
-        print(f"ERROR: Failed to launch job {template_id}. Details: {e}")
-        return None
-
-def wait_for_job_completion(job_id):
-    url = f"{AWX_HOST}/api/v2/jobs/{job_id}/"
-    headers = {'Authorization': f'Bearer {AWX_API_TOKEN_READ}'}
-    while True:
+    def iter_job_output(self, job_id, chunk_size=OUTPUT_CHUNK_SIZE):
+        """Streams a job's whole stdout in text chunks. Raises requests.RequestException on failure.
+
+        Uses format=txt_download, which AWX serves at any size; format=txt is replaced
+        by a "too large" notice above STDOUT_MAX_BYTES_DISPLAY.
+        """
+        with self._request("GET", f"/api/v2/jobs/{job_id}/stdout/?format=txt_download", self.read_token,
+                           read_timeout=OUTPUT_READ_TIMEOUT, stream=True) as response:
+            response.encoding = response.encoding or "utf-8"
+            yield from response.iter_content(chunk_size=chunk_size, decode_unicode=True)
+
+    def get_job_output(self, job_id):
         try:
-            response = requests.get(url, headers=headers, verify=VERIFY_SSL)
-            response.raise_for_status()
-            status = response.json().get("status")
-            if status in ["successful", "failed", "error", "canceled"]:
-                return status
-            time.sleep(10)
+            return "".join(self.iter_job_output(job_id))
         except requests.exceptions.RequestException:
-            return "error"
+            return "Error fetching job stdout."
+
+    def get_job_output_page(self, job_id, start_line, end_line):
+        """Returns stdout lines [start_line, end_line) as (text, end, absolute_end).
+
+        end is the line after the last one returned and absolute_end the number of
+        lines so far. AWX applies start_line/end_line only to the json, api and html
+        renderers; format=txt always returns the whole stdout. Raises OutputTooLarge
+        once the stdout is over AWX's display limit, requests.RequestException on failure.
+        """
+        with telemetry.span("awx.stdout_page", awx_job_id=job_id, start_line=start_line) as span:
+            page = self._request("GET", f"/api/v2/jobs/{job_id}/stdout/?format=json&content_format=ansi"
+                                        f"&start_line={start_line}&end_line={end_line}",
+                                 self.read_token, read_timeout=OUTPUT_READ_TIMEOUT).json()
+            text = _ANSI_ESCAPE.sub("", page.get("content") or "")
+            line_range = page.get("range") or {}
+            if text.startswith(_TOO_LARGE) and line_range.get("absolute_end") == 1:
+                span.set(too_large=True)
+                raise OutputTooLarge(text.strip())
+            end = line_range.get("end", start_line)
+            span.set(bytes=len(text), end_line=end)
+            return text, end, line_range.get("absolute_end", end)
+
+    def wait_for_job_completion(self, job_id, timeout=None, stop=None, on_status=None, on_poll=None):
+        """Polls a job until it finishes and returns its final status.
+
+        Polling starts every POLL_INITIAL_DELAY seconds and backs off to POLL_MAX_DELAY
+        while the status stays the same. Returns "timeout" once timeout seconds have
+        passed, and None as soon as the stop event is set. on_status is called with
+        every new status, on_poll with the status after every successful poll.
+        """
+        with telemetry.span("awx.wait", awx_job_id=job_id) as span:
+            status, polls = self._poll_until_done(job_id, timeout, stop, on_status, on_poll)
+            span.set(final_status=status, polls=polls)
+        return status
+
+    def _poll_until_done(self, job_id, timeout, stop, on_status, on_poll):
+        deadline = time.monotonic() + timeout if timeout else None
+        delay = POLL_INITIAL_DELAY
+        last_status = None
+        errors = 0
+        polls = 0
+        while True:
+            polls += 1
+            status = self.get_job_status(job_id)
+            if status is None:
+                errors += 1
+                if errors >= MAX_POLL_ERRORS:
+                    return "error", polls
+            else:
+                errors = 0
+                if status != last_status:
+                    last_status = status
+                    delay = POLL_INITIAL_DELAY
+                    if on_status:
+                        on_status(status)
+                if on_poll and status not in TERMINAL_STATUSES:
+                    on_poll(status)
+                if status in TERMINAL_STATUSES:
+                    return status, polls
+            wait = delay
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return "timeout", polls
+                wait = min(wait, remaining)
+            if stop is not None:
+                if stop.wait(wait):
+                    return None, polls
+            else:
+                time.sleep(wait)
+            delay = min(delay * POLL_BACKOFF, POLL_MAX_DELAY)
+
+    def run_job(self, template_id, target=None, extra_vars=None, timeout=None, stop=None):
+        """Launches a template, waits for it and returns a JobResult with the job's stdout."""
+        target = target or LaunchTarget(name=str(template_id))
+        started = time.monotonic()
+        merged_vars = {**(extra_vars or {}), **(target.extra_vars or {})} or None
+        job_id = self.launch_job_template(template_id, merged_vars, target.inventory, target.limit)
+        if not job_id:
+            return JobResult(target.name, None, "error", "Error launching the job.", time.monotonic() - started)
+        status = self.wait_for_job_completion(job_id, timeout=timeout, stop=stop)
+        if status is None or status == "timeout":
+            self.cancel_job(job_id)
+            status = status or "canceled"
+        return JobResult(target.name, job_id, status, self.get_job_output(job_id) or "", time.monotonic() - started)
+
+    def fan_out(self, template_id, targets, extra_vars=None, timeout=None, max_workers=FAN_OUT_WORKERS, stop=None):
+        """Runs a template against every target concurrently and yields JobResults in completion order."""
+        if not targets:
+            return
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(targets)), thread_name_prefix="awx-fanout") as pool:
+            # Each run keeps the caller's telemetry tags (user, job) on its spans.
+            futures = {pool.submit(contextvars.copy_context().run, self.run_job, template_id, target, extra_vars, timeout, stop): target
+                       for target in targets}
+            for future in as_completed(futures):
+                try:
+                    yield future.result()
+                except Exception as e:
+                    yield JobResult(futures[future].name, None, "error", f"Fan-out worker failed: {e}")
+
+
+class JobOutputReader:
+    """Reads a job's stdout in start_line/end_line pages, each call picking up where the last one stopped.
+
+    Pages are read until AWX's range stops advancing or reaches the end of the
+    stdout. While the job runs, read_new() returns only complete lines; a partial
+    last line is fetched again next time. Call it with final=True once the job
+    has finished.
+
+    Past AWX's display limit pages are no longer served. Reading then pauses
+    until final=True, which downloads the whole stdout once and yields what
+    follows the lines already read.
+    """
+
+    def __init__(self, client, job_id, page_lines=OUTPUT_PAGE_LINES):
+        self.client = client
+        self.job_id = job_id
+        self.page_lines = page_lines
+        self.next_line = 0
+
+    def read_new(self, final=False):
+        """Yields text pages. Raises requests.RequestException on failure; the next call resumes at the same line."""
+        while True:
+            try:
+                text, end, absolute_end = self.client.get_job_output_page(self.job_id, self.next_line,
+                                                                          self.next_line + self.page_lines)
+            except OutputTooLarge:
+                if final:
+                    yield from self._download_rest()
+                return
+            if not final and text and not text.endswith("\n"):
+                text = text[:text.rfind("\n") + 1]
+                end -= 1
+            if end <= self.next_line:
+                return
+            self.next_line = end
+            if text:
+                yield text
+            if end >= absolute_end:
+                return
+
+    def _download_rest(self):
+        skip = self.next_line
+        for chunk in self.client.iter_job_output(self.job_id):
+            while skip and chunk:
+                newline = chunk.find("\n")
+                if newline < 0:
+                    chunk = ""
+                    break
+                chunk = chunk[newline + 1:]
+                skip -= 1
+            if chunk:
+                self.next_line += chunk.count("\n")
+                yield chunk
+
+
+_default_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> AWXClient:
+    """The process-wide client, created on first use."""
+    global _default_client
+    if _default_client is None:
+        with _client_lock:
+            if _default_client is None:
+                _default_client = AWXClient()
+    return _default_client
+
+
+def configure_client(**kwargs) -> AWXClient:
+    """Replaces the default client, e.g. to point at another AWX host or change pool size and timeouts."""
+    global _default_client
+    with _client_lock:
+        old, _default_client = _default_client, AWXClient(**kwargs)
+    if old:
+        old.close()
+    return _default_client
+
+
+# --- Module-level API, backed by the default client ---
+def launch_job_template(template_id, extra_vars=None, inventory=None, limit=None):
+    return get_client().launch_job_template(template_id, extra_vars, inventory, limit)
+
+def get_job_status(job_id):
+    return get_client().get_job_status(job_id)
+
+def cancel_job(job_id):
+    return get_client().cancel_job(job_id)
+
+def wait_for_job_completion(job_id, timeout=None, stop=None, on_status=None, on_poll=None):
+    return get_client().wait_for_job_completion(job_id, timeout, stop, on_status, on_poll)
 
 def get_job_output(job_id):
-    url = f"{AWX_HOST}/api/v2/jobs/{job_id}/stdout/?format=txt"
-    headers = {'Authorization': f'Bearer {AWX_API_TOKEN_READ}'}
-    try:
-        response = requests.get(url, headers=headers, verify=VERIFY_SSL)
-        response.raise_for_status()
-        return response.text
-    except requests.exceptions.RequestException:
-        return "Error fetching job stdout."
+    return get_client().get_job_output(job_id)
+
+def fan_out(template_id, targets, extra_vars=None, timeout=None, max_workers=FAN_OUT_WORKERS, stop=None):
+    return get_client().fan_out(template_id, targets, extra_vars, timeout, max_workers, stop)
 
 def parse_job_summary(raw_output):
     if not raw_output: return ""
-    summary_lines = []
-    in_mainframe_log = False
-    pattern = re.compile(r"^(PLAY \[|TASK \[|PLAY RECAP|ok:|changed:|fatal:|failed:|skipping:|unreachable:|.*\s*:\s*ok=.*changed=.*)")
-    for line in raw_output.splitlines():
-        if "--- BEGIN MAINFRAME JOB LOG ---" in line:
-            in_mainframe_log = True
-            continue
-        if "--- END MAINFRAME JOB LOG ---" in line:
-            in_mainframe_log = False
-            continue
-        if not in_mainframe_log and pattern.match(line.strip()):
-            summary_lines.append(line.strip())
-    return "\n".join(summary_lines)
+    return parse_ansible_output(raw_output).summary
 
 def parse_mainframe_log_from_ansible_output(ansible_log):
-    try:
-        start_marker = "--- BEGIN MAINFRAME JOB LOG ---"
-        end_marker = "--- END MAINFRAME JOB LOG ---"
-        start_index = ansible_log.find(start_marker)
-        if start_index == -1: return None
-        end_index = ansible_log.find(end_marker, start_index)
-        if end_index == -1: return None
-        content_start = start_index + len(start_marker)
-        log_content = ansible_log[content_start:end_index]
-        formatted_log = log_content.replace('\\n', '\n')
-        return formatted_log.strip()
-    except Exception as e:
-        print(f"Error parsing mainframe log: {e}")
-        return None
\ No newline at end of file
+    if not ansible_log: return None
+    return parse_ansible_output(ansible_log).sysout
@@ -0,0 +1,410 @@
+# --- batch_triage.py ---
+# Offline triage of a whole batch window. Collects the sysouts of many jobs,
+# either files in a directory or the stdout of finished AWX joboutput jobs,
+# groups them by failure fingerprint (analysis_cache.fingerprint) and runs the
+# AI pipeline once per group, so a hundred jobs failing the same way cost one
+# analysis. The result is a Markdown or JSON report, largest group first.
+#
+#   python batch_triage.py --dir /data/sysouts/0715 --report night-0715.md
+#   python batch_triage.py --jobs 41200-41350 41402 --report night-0715.json
+#   python batch_triage.py --template 15 --since 2025-07-15T20:00 --until 2025-07-16T06:00
+#
+# Progress is checkpointed in a SQLite file after every job and every group.
+# Running the same command again after an interruption skips what is done;
+# --fresh starts over. Requests to AWX and Gemini are rate limited
+# (--awx-rate, --llm-rate) so a large window doesn't crowd out the app.
+
+import argparse
+import contextvars
+import json
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+import requests
+
+import ai_analysis
+import analysis_cache
+import telemetry
+import triage_rules
+from ansible_output import AnsibleOutputParser, parse_ansible_output
+from awx_actions import TERMINAL_STATUSES, AWXClient
+from config import JOBOUTPUT_TEMPLATE_ID
+from rate_limit import RateLimiter
+
+CHECKPOINT_PATH = "batch_triage.sqlite3"
+DEFAULT_WORKERS = 8
+AWX_RATE = 5.0        # requests per second
+LLM_RATE = 1.0        # generate_content calls per second
+MAX_JOBS_LISTED = 5000
+
+
+@dataclass
+class Source:
+    key: str                        # "file:<path>" or "awx:<job id>"
+    label: str
+    load: Callable[[], str]         # returns the sysout; raises on failure
+    final: bool = True              # False for an AWX job still running; its partial stdout is not checkpointed
+
+
+class NoSysoutError(Exception):
+    pass
+
+
+class RateLimitedLLM:
+    """Wraps a Gemini model so every generate_content call, triage and synthesis alike, waits for the limiter."""
+
+    def __init__(self, model, limiter: RateLimiter):
+        self.model = model
+        self.limiter = limiter
+
+    def generate_content(self, *args, **kwargs):
+        self.limiter.acquire()
+        return self.model.generate_content(*args, **kwargs)
+
+
+# --- Sources ---
+def _sysout_of(text: str) -> str:
+    """The mainframe log in a saved Ansible stdout, or the text itself when it is a bare sysout."""
+    return parse_ansible_output(text).sysout or text
+
+
+def file_sources(directory: Path, pattern: str) -> list[Source]:
+    paths = sorted(p for p in directory.glob(pattern) if p.is_file())
+    return [Source(f"file:{p}", p.name, lambda p=p: _sysout_of(p.read_text(errors="replace"))) for p in paths]
+
+
+def parse_job_ids(specs: list[str]) -> tuple[list[tuple[int, int]], list[int]]:
+    """Splits "41200-41350" ranges from single job ids."""
+    ranges, singles = [], []
+    for spec in specs:
+        for part in spec.split(","):
+            low, sep, high = part.strip().partition("-")
+            try:
+                if sep:
+                    ranges.append((int(low), int(high)))
+                elif low:
+                    singles.append(int(low))
+            except ValueError:
+                raise argparse.ArgumentTypeError(f"'{part}' is not a job id or an id range like 41200-41350")
+    return ranges, singles
+
+
+def job_spec(text: str) -> str:
+    """argparse type of --jobs values, so a malformed one is a usage error."""
+    parse_job_ids([text])
+    return text
+
+
+def _job_sysout(client: AWXClient, job_id: int) -> str:
+    parser = AnsibleOutputParser()
+    for chunk in client.iter_job_output(job_id):
+        parser.feed(chunk)
+    sysout = parser.close().sysout
+    if not sysout:
+        raise NoSysoutError("no mainframe job log in the job's stdout")
+    return sysout
+
+
+def awx_sources(client: AWXClient, job_specs: list[str], filters: dict) -> list[Source]:
+    """Lists the jobs matching job_specs and the AWX filters. Raises requests.RequestException if AWX can't be read."""
+    ranges, singles = parse_job_ids(job_specs)
+    queries = [{"id__gte": low, "id__lte": high} for low, high in ranges]
+    if singles:
+        queries.append({"id__in": ",".join(map(str, singles))})
+    jobs = {}
+    for query in queries or [{}]:
+        for job in client.list_jobs(**query, **filters):
+            jobs[job["id"]] = job
+            if len(jobs) > MAX_JOBS_LISTED:
+                raise SystemExit(f"More than {MAX_JOBS_LISTED} jobs match; narrow the selection.")
+    return [Source(f"awx:{job_id}", f"job {job_id} {job.get('name', '')} ({job.get('finished') or job.get('status')})".strip(),
+                   lambda job_id=job_id: _job_sysout(client, job_id), final=job.get("status") in TERMINAL_STATUSES)
+            for job_id, job in sorted(jobs.items())]
+
+
+# --- Checkpoint ---
+class Checkpoint:
+    """Per-source sysouts and per-fingerprint analyses of a run, in a SQLite file."""
+
+    def __init__(self, path: str = CHECKPOINT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sources ("
+            "key TEXT PRIMARY KEY, label TEXT NOT NULL, fingerprint TEXT, sysout BLOB, error TEXT, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS groups ("
+            "fingerprint TEXT PRIMARY KEY, error_code TEXT, step TEXT, kb_hits INTEGER NOT NULL, analysis TEXT NOT NULL, "
+            "complete INTEGER NOT NULL, cached INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def fetched(self) -> set[str]:
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT key FROM sources WHERE fingerprint IS NOT NULL")}
+
+    def put_source(self, key: str, label: str, sysout: str | None = None, error: str | None = None):
+        fp = analysis_cache.fingerprint(sysout) if sysout is not None else None
+        data = zlib.compress(sysout.encode()) if sysout is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sources (key, label, fingerprint, sysout, error, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, label, fp, data, error, time.time()),
+            )
+            self._conn.commit()
+
+    def pending_groups(self, keys: list[str]) -> list[tuple[str, str]]:
+        """(fingerprint, sysout of one member) for every group of these sources without a complete analysis."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT s.key, s.fingerprint, s.sysout FROM sources s LEFT JOIN groups g ON g.fingerprint = s.fingerprint "
+                "WHERE s.fingerprint IS NOT NULL AND (g.complete IS NULL OR g.complete = 0) ORDER BY s.key"
+            ).fetchall()
+        wanted, pending = set(keys), {}
+        for key, fp, data in rows:
+            if key in wanted and fp not in pending:
+                pending[fp] = zlib.decompress(data).decode()
+        return list(pending.items())
+
+    def put_group(self, fp: str, error_code: str | None, step: str | None, kb_hits: int, analysis: str,
+                  complete: bool, cached: bool):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO groups (fingerprint, error_code, step, kb_hits, analysis, complete, cached, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (fp, error_code, step, kb_hits, analysis, int(complete), int(cached), time.time()),
+            )
+            self._conn.commit()
+
+    def results(self, keys: list[str]) -> tuple[list[dict], list[dict]]:
+        """The groups of these sources, largest first, and the sources that could not be read."""
+        with self._lock:
+            sources = self._conn.execute("SELECT key, label, fingerprint, error FROM sources").fetchall()
+            groups = {row[0]: row for row in self._conn.execute(
+                "SELECT fingerprint, error_code, step, kb_hits, analysis, complete, cached FROM groups")}
+        wanted = set(keys)
+        members, failed = {}, []
+        for key, label, fp, error in sources:
+            if key not in wanted:
+                continue
+            if fp is None:
+                failed.append({"source": key, "label": label, "error": error})
+            else:
+                members.setdefault(fp, []).append({"source": key, "label": label})
+        report = []
+        for fp, jobs in members.items():
+            _, code, step, hits, analysis, complete, cached = groups.get(fp, (fp, None, None, 0, "", 0, 0))
+            report.append({"fingerprint": fp, "error_code": code, "step": step, "jobs": sorted(jobs, key=lambda j: j["source"]),
+                           "kb_hits": hits, "analysis": analysis, "complete": bool(complete), "cached": bool(cached)})
+        # Failures before successes, then by size.
+        report.sort(key=lambda g: (g["error_code"] == triage_rules.SUCCESS_CODE, -len(g["jobs"]), g["error_code"] or ""))
+        return report, sorted(failed, key=lambda f: f["source"])
+
+
+# --- Stages ---
+def _run_in_pool(fn, items, workers: int):
+    """Calls fn on every item from a thread pool, keeping the caller's telemetry tags. Yields (item, result)."""
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(items))), thread_name_prefix="batch-triage") as pool:
+        futures = {pool.submit(contextvars.copy_context().run, fn, item): item for item in items}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def fetch(sources: list[Source], checkpoint: Checkpoint, workers: int) -> int:
+    """Loads every source not yet in the checkpoint. Returns how many could not be read."""
+    done = checkpoint.fetched()
+    todo = [s for s in sources if s.key not in done]
+    print(f"Fetching {len(todo)} of {len(sources)} sysouts ({len(sources) - len(todo)} already in the checkpoint).")
+
+    def load(source: Source):
+        with telemetry.span("batch.fetch", source=source.key) as span:
+            if not source.final:
+                # Recorded as unreadable, so the next run reads it again instead of keeping a partial log.
+                checkpoint.put_source(source.key, source.label, error="job has not finished yet")
+                return False
+            try:
+                sysout = source.load()
+            except (OSError, requests.exceptions.RequestException, NoSysoutError) as e:
+                span.set(error=str(e))
+                checkpoint.put_source(source.key, source.label, error=str(e))
+                return False
+            checkpoint.put_source(source.key, source.label, sysout)
+            return True
+
+    failures = 0
+    for n, (source, ok) in enumerate(_run_in_pool(load, todo, workers), 1):
+        failures += not ok
+        if not ok or n % 50 == 0 or n == len(todo):
+            print(f"  [{n}/{len(todo)}] {source.label}{'' if ok else ': FAILED'}")
+    return failures
+
+
+def _analyze(sysout: str, use_cache: bool) -> dict:
+    result = {"error_code": None, "step": None, "kb_hits": 0}
+    for event in ai_analysis.hybrid_analysis_stream(sysout, use_cache):
+        if event.kind == "triage":
+            result.update(error_code=event.text or None, step=event.step)
+        elif event.kind == "kb":
+            result["kb_hits"] = event.hits
+        elif event.kind == "done":
+            result.update(analysis=event.text, complete=event.complete, cached=event.cached)
+    if result["cached"]:
+        # A cached analysis skips triage; the rule engine is enough to label the group.
+        primary = triage_rules.triage(sysout).primary
+        if primary:
+            result.update(error_code=primary.code, step=primary.step)
+    return result
+
+
+def analyze(keys: list[str], checkpoint: Checkpoint, workers: int, use_cache: bool) -> int:
+    """Analyzes one sysout per fingerprint group that has no complete analysis yet. Returns the groups analyzed."""
+    pending = checkpoint.pending_groups(keys)
+    print(f"Analyzing {len(pending)} distinct failure group(s).")
+
+    def run(group: tuple[str, str]):
+        fp, sysout = group
+        with telemetry.span("batch.analyze", fingerprint=fp[:12]):
+            result = _analyze(sysout, use_cache)
+        checkpoint.put_group(fp, **result)
+        return result
+
+    for n, ((fp, _), result) in enumerate(_run_in_pool(run, pending, workers), 1):
+        location = f" in {result['step']}" if result["step"] else ""
+        state = "" if result["complete"] else " (incomplete, retried on the next run)"
+        print(f"  [{n}/{len(pending)}] {result['error_code'] or 'unknown'}{location} [{fp[:12]}]{state}")
+    return len(pending)
+
+
+# --- Reports ---
+def build_report(keys: list[str], checkpoint: Checkpoint, selection: str) -> dict:
+    groups, failed = checkpoint.results(keys)
+    return {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "selection": selection,
+        "sources": len(keys),
+        "analyzed": sum(len(g["jobs"]) for g in groups),
+        "failed_jobs": sum(len(g["jobs"]) for g in groups if g["error_code"] != triage_rules.SUCCESS_CODE),
+        "groups": groups,
+        "unreadable": failed,
+    }
+
+
+def render_markdown(report: dict) -> str:
+    groups = [g for g in report["groups"] if g["error_code"] != triage_rules.SUCCESS_CODE]
+    succeeded = sum(len(g["jobs"]) for g in report["groups"]) - report["failed_jobs"]
+    lines = [
+        "# Batch triage report", "",
+        f"Selection: {report['selection']}  ",
+        f"Generated: {report['generated_at']}", "",
+        f"{report['sources']} job(s): {report['failed_jobs']} failed in {len(groups)} distinct way(s), "
+        f"{succeeded} ended RC=0000, {len(report['unreadable'])} could not be read.", "",
+    ]
+    if groups:
+        lines += ["| # | Error | Step | Jobs | Work instructions |", "|---|---|---|---|---|"]
+        for n, g in enumerate(groups, 1):
+            lines.append(f"| {n} | {g['error_code'] or 'unknown'} | {g['step'] or ''} | {len(g['jobs'])} | {g['kb_hits']} |")
+        lines.append("")
+    for n, g in enumerate(groups, 1):
+        location = f" in step {g['step']}" if g["step"] else ""
+        lines += [f"## {n}. {g['error_code'] or 'Unknown error'}{location} ({len(g['jobs'])} job(s))", "",
+                  f"Fingerprint `{g['fingerprint'][:12]}`. Jobs: " + ", ".join(j["label"] for j in g["jobs"]), ""]
+        lines += [g["analysis"] or "_Not analyzed yet; run the command again to resume._", ""]
+        if g["analysis"] and not g["complete"]:
+            lines += ["_This analysis is incomplete; running the command again retries it._", ""]
+    if report["unreadable"]:
+        lines += ["## Could not be read", ""]
+        lines += [f"- {f['label']}: {f['error']}" for f in report["unreadable"]]
+        lines.append("")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Triage a batch window offline and write a grouped report.")
+    source = parser.add_argument_group("what to triage (a directory, or AWX jobs by id and/or filter)")
+    source.add_argument("--dir", type=Path, help="directory of sysout files (bare sysouts or saved AWX stdout)")
+    source.add_argument("--glob", default="*", help="file pattern within --dir")
+    source.add_argument("--jobs", nargs="+", type=job_spec, default=[], help="AWX job ids and ranges, e.g. 41200-41350 41402")
+    source.add_argument("--template", type=int,
+                        help=f"only jobs of this AWX job template (default: the joboutput template, {JOBOUTPUT_TEMPLATE_ID})")
+    source.add_argument("--since", help="only jobs finished at or after this time, e.g. 2025-07-15T20:00")
+    source.add_argument("--until", help="only jobs finished before this time")
+    source.add_argument("--status", nargs="+",
+                        help=f"only jobs in these AWX states (default: the finished ones, {' '.join(TERMINAL_STATUSES)})")
+    parser.add_argument("--report", type=Path, help="write the report here; .json for JSON, Markdown otherwise")
+    parser.add_argument("--format", choices=["md", "json"], help="report format (default: from --report, else md)")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="SQLite file recording progress")
+    parser.add_argument("--fresh", action="store_true", help="discard the checkpoint and start over")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="fetches and analyses in flight at once")
+    parser.add_argument("--awx-rate", type=float, default=AWX_RATE, help="AWX requests per second")
+    parser.add_argument("--llm-rate", type=float, default=LLM_RATE, help="Gemini calls per second")
+    parser.add_argument("--no-cache", action="store_true", help="ignore the analysis cache and analyze every group afresh")
+    args = parser.parse_args()
+
+    awx_filters = {k: v for k, v in (("job_template", args.template), ("finished__gte", args.since),
+                                     ("finished__lt", args.until)) if v is not None}
+    if args.status:
+        awx_filters["status__in"] = ",".join(args.status)
+    if bool(args.dir) == bool(args.jobs or awx_filters):
+        parser.error("give either --dir, or AWX --jobs and/or filters (--template, --since, --until, --status)")
+    if not args.dir:
+        if args.template is None and JOBOUTPUT_TEMPLATE_ID is None:
+            parser.error("--template is required while JOBOUTPUT_TEMPLATE_ID is not set in config.py")
+        awx_filters.setdefault("job_template", JOBOUTPUT_TEMPLATE_ID)
+        awx_filters.setdefault("status__in", ",".join(TERMINAL_STATUSES))
+    if args.fresh:
+        for suffix in ("", "-wal", "-shm"):
+            Path(args.checkpoint + suffix).unlink(missing_ok=True)
+
+    if args.dir:
+        selection = f"{args.dir}/{args.glob}"
+        sources = file_sources(args.dir, args.glob)
+    else:
+        selection = " ".join([f"jobs {' '.join(args.jobs)}"] * bool(args.jobs) + [f"{k}={v}" for k, v in awx_filters.items()])
+        client = AWXClient(pool_size=args.workers, rate_limiter=RateLimiter(args.awx_rate, burst=max(1, int(args.awx_rate))))
+        try:
+            sources = awx_sources(client, args.jobs, awx_filters)
+        except requests.exceptions.RequestException as e:
+            sys.exit(f"Could not list AWX jobs: {e}")
+    if not sources:
+        sys.exit(f"Nothing matches {selection}.")
+
+    model = ai_analysis.get_llm()
+    if model:
+        ai_analysis.llm = RateLimitedLLM(model, RateLimiter(args.llm_rate, burst=max(1, int(args.llm_rate))))
+    checkpoint = Checkpoint(args.checkpoint)
+    keys = [s.key for s in sources]
+    with telemetry.tags(user="batch_triage"):
+        fetch(sources, checkpoint, args.workers)
+        analyze(keys, checkpoint, args.workers, use_cache=not args.no_cache)
+    report = build_report(keys, checkpoint, selection)
+    checkpoint.close()
+
+    fmt = args.format or ("json" if args.report and args.report.suffix == ".json" else "md")
+    text = json.dumps(report, indent=2) if fmt == "json" else render_markdown(report)
+    if args.report:
+        args.report.write_text(text)
+        print(f"Report written to {args.report}.")
+    else:
+        print(text)
+    unreadable = len(report["unreadable"])
+    incomplete = sum(not g["complete"] for g in report["groups"])
+    if unreadable or incomplete:
+        print(f"{unreadable} job(s) unreadable, {incomplete} group(s) incomplete; run the same command again to retry them.")
+    sys.exit(1 if unreadable or incomplete else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# --- benchmarks/bench_cold_start.py ---
+# How long a new worker takes to become useful. Every measurement runs in a
+# fresh interpreter:
+#   imports - importing the modules app.py needs to render the login page; fails if a
+#             heavy dependency (Gemini SDK, sentence-transformers, torch) is imported eagerly
+#   warmup  - warmup.start() until every step has finished, with per-step times
+#   server  - with --server: `python serve.py` until Streamlit answers its health check
+#             and serves the page shell, and until /ready returns 200
+#
+# Run from the repository root:
+#   python benchmarks/bench_cold_start.py
+#   python benchmarks/bench_cold_start.py --server --steps embedding_model llm
+# The exit status is 1 if the import check fails or an import takes longer than --max-import-seconds.
+
+import argparse
+import json
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+APP_MODULES = ["config", "telemetry", "warmup", "job_runner", "log_store", "ai_analysis", "template_selector"]
+HEAVY_MODULES = ["google.generativeai", "sentence_transformers", "torch"]
+
+IMPORT_PROBE = """
+import json, sys, time, warnings
+warnings.simplefilter("ignore")
+started = time.perf_counter()
+import streamlit
+streamlit_s = time.perf_counter() - started
+started = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+print(json.dumps({{"streamlit_s": streamlit_s, "app_modules_s": time.perf_counter() - started,
+                  "eager": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+WARMUP_PROBE = """
+import json, time, warnings
+warnings.simplefilter("ignore")
+started = time.perf_counter()
+import warmup
+steps = [s for s in warmup.default_steps() if {steps!r} is None or s.name in {steps!r}]
+w = warmup.Warmup(steps)
+w.start()
+finished = w.wait({timeout!r})
+print(json.dumps({{"seconds": time.perf_counter() - started, "finished": finished, "status": w.status()}}))
+"""
+
+
+def _run_probe(code: str, timeout: float) -> dict:
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True, timeout=timeout)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "probe failed")
+    data = json.loads(result.stdout.strip().splitlines()[-1])
+    data["process_s"] = wall
+    return data
+
+
+def measure_imports(runs: int) -> dict:
+    samples = [_run_probe(IMPORT_PROBE.format(modules=APP_MODULES, heavy=HEAVY_MODULES), 120) for _ in range(runs)]
+    return {
+        "runs": runs,
+        "process_s": statistics.median(s["process_s"] for s in samples),
+        "streamlit_s": statistics.median(s["streamlit_s"] for s in samples),
+        "app_modules_s": statistics.median(s["app_modules_s"] for s in samples),
+        "eager": sorted({m for s in samples for m in s["eager"]}),
+    }
+
+
+def measure_warmup(steps: list[str] | None, timeout: float) -> dict:
+    return _run_probe(WARMUP_PROBE.format(steps=steps, timeout=timeout), timeout + 60)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(url: str, deadline: float, expect_status: int = 200) -> tuple[float | None, str]:
+    """Polls url until it answers expect_status. Returns (seconds since the call, last body) or (None, last body)."""
+    started = time.perf_counter()
+    body = ""
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                body = response.read().decode(errors="replace")
+                if response.status == expect_status:
+                    return time.perf_counter() - started, body
+        except urllib.error.HTTPError as e:
+            body = e.read().decode(errors="replace")
+        except OSError:
+            pass
+        time.sleep(0.05)
+    return None, body
+
+
+def measure_server(timeout: float) -> dict:
+    app_port, metrics_port = _free_port(), _free_port()
+    launcher = (f"import sys, telemetry; telemetry.METRICS_PORT = {metrics_port}; "
+                f"sys.argv = ['serve.py', '--server.headless', 'true', '--server.port', '{app_port}']; "
+                "import serve; serve.main()")
+    started = time.perf_counter()
+    deadline = time.monotonic() + timeout
+    process = subprocess.Popen([sys.executable, "-W", "ignore", "-c", launcher], cwd=REPO_ROOT,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        health, _ = _wait_for(f"http://127.0.0.1:{app_port}/_stcore/health", deadline)
+        health_s = time.perf_counter() - started if health is not None else None
+        page, _ = _wait_for(f"http://127.0.0.1:{app_port}/", deadline)
+        page_s = time.perf_counter() - started if page is not None else None
+        ready, body = _wait_for(f"http://127.0.0.1:{metrics_port}/ready", deadline)
+        ready_s = time.perf_counter() - started if ready is not None else None
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    try:
+        detail = json.loads(body)
+    except ValueError:
+        detail = None
+    return {"health_s": health_s, "page_s": page_s, "ready_s": ready_s, "ready_detail": detail}
+
+
+def _fmt(seconds) -> str:
+    return f"{seconds:8.2f}s" if seconds is not None else "   never"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start benchmark.")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters for the import measurement")
+    parser.add_argument("--steps", nargs="+", help="warm-up steps to run (default: all)")
+    parser.add_argument("--timeout", type=float, default=180, help="seconds to wait for warm-up or readiness")
+    parser.add_argument("--server", action="store_true", help="also boot serve.py and time the probes")
+    parser.add_argument("--max-import-seconds", type=float, default=2.0, help="fail if app imports take longer")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    result = {"imports": measure_imports(args.runs), "warmup": measure_warmup(args.steps, args.timeout)}
+    if args.server:
+        result["server"] = measure_server(args.timeout)
+    imports = result["imports"]
+    failures = []
+    if imports["eager"]:
+        failures.append(f"heavy modules imported eagerly: {', '.join(imports['eager'])}")
+    if imports["app_modules_s"] > args.max_import_seconds:
+        failures.append(f"app imports took {imports['app_modules_s']:.2f}s (limit {args.max_import_seconds:.2f}s)")
+
+    if args.json:
+        print(json.dumps({"result": result, "failures": failures}, indent=2))
+    else:
+        print(f"Imports (median of {imports['runs']} fresh interpreters)")
+        print(f"  interpreter + imports {_fmt(imports['process_s'])}")
+        print(f"  streamlit             {_fmt(imports['streamlit_s'])}")
+        print(f"  app modules           {_fmt(imports['app_modules_s'])}")
+        warm = result["warmup"]
+        print(f"Warm-up: {'finished' if warm['finished'] else 'NOT finished'} in {warm['seconds']:.2f}s, "
+              f"ready: {warm['status']['ready']}")
+        for name, step in warm["status"]["steps"].items():
+            error = f"  {step['error'].splitlines()[0]}" if step["error"] else ""
+            print(f"  {name:<21} {_fmt(step['seconds'])}  {step['status']}{error}")
+        if "server" in result:
+            server = result["server"]
+            print("serve.py boot")
+            print(f"  health check          {_fmt(server['health_s'])}")
+            print(f"  page shell            {_fmt(server['page_s'])}")
+            print(f"  /ready == 200         {_fmt(server['ready_s'])}")
+        for failure in failures:
+            print(f"  FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+# --- benchmarks/bench_e2e.py ---
+# End-to-end latency of the chat flow against local stand-ins (see standins.py):
+#   prompt -> template match -> AWX launch/poll/paged stdout -> log store -> AI analysis
+# Sessions run concurrently. The report gives p50/p95/p99 per stage, throughput
+# and peak memory, compared with the stored baseline. The exit status is 1 if
+# any stage regressed.
+#
+# Run from the repository root:
+#   python benchmarks/bench_e2e.py                  # compare with baseline_e2e.json
+#   python benchmarks/bench_e2e.py --save-baseline  # record a new baseline
+# Baselines are machine-specific; record one on the machine that runs the comparison.
+
+import argparse
+import contextlib
+import io
+import json
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import ai_analysis
+import awx_actions
+import llm_stub
+import log_store
+import template_selector
+from ansible_output import AnsibleOutputParser
+
+import standins
+from bench_triage import load_corpus
+
+BASELINE_PATH = Path(__file__).with_name("baseline_e2e.json")
+STAGES = ["template_match", "awx_launch", "awx_wait", "awx_output", "triage", "kb_lookup",
+          "first_token", "synthesis", "analysis_total", "session_total"]
+# Worded close to the joboutput template's description, so the hashing encoder matches it too.
+PROMPTS = [
+    "download the job output sysout from the mainframe for jobname PAYROLL1",
+    "download the job output log for a specific job name NIGHTLY2",
+    "see the job output sysout log from the DCUF LPAR for jobname BKUP0001",
+]
+MIN_REGRESSION_SECONDS = 0.02    # ignore p95 changes smaller than this; thread scheduling jitter alone reaches ~10 ms
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile; q in 0..100."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def setup(args) -> tuple[standins.FakeAWX, log_store.LogStore]:
+    if not args.real_embeddings:
+        standins.install_encoder(standins.HashingEncoder(latency=args.embed_latency))
+    index = template_selector.template_index
+    index.refresh_interval = float("inf")       # never poll Postgres for a newer version
+    index.load_rows(standins.load_template_rows(), version=1)
+    standins.InMemoryKnowledgeBase(query_latency=args.kb_latency).install()
+    ai_analysis.llm = llm_stub.StubLLM(first_token_latency=args.llm_latency, chunk_delay=args.llm_chunk_delay)
+
+    awx = standins.FakeAWX([case["sysout"] for case in load_corpus()], stdout_bytes=int(args.stdout_mb * 1_000_000),
+                           pending_seconds=args.job_pending, run_seconds=args.job_seconds,
+                           error_rate=args.error_rate,
+                           # More than one stdout page, so a reader that never reaches the end would show up.
+                           min_lines=awx_actions.OUTPUT_PAGE_LINES + 1).start()
+    awx_actions.POLL_INITIAL_DELAY = args.poll_delay
+    awx_actions.POLL_MAX_DELAY = args.poll_delay * 4
+    awx_actions.RETRY_BASE_DELAY = 0.01
+    awx_actions.configure_client(host=awx.url, pool_size=max(16, args.concurrency * 2))
+    store = log_store.LogStore(str(Path(tempfile.mkdtemp(prefix="bench_e2e_")) / "job_logs.sqlite3"))
+    return awx, store
+
+
+def run_session(n: int, awx: standins.FakeAWX, store: log_store.LogStore, use_cache: bool) -> dict[str, float]:
+    timings = {}
+    start = time.perf_counter()
+
+    mark = time.perf_counter()
+    template_name, template_id = template_selector.find_template_by_similarity(PROMPTS[n % len(PROMPTS)])
+    timings["template_match"] = time.perf_counter() - mark
+    if template_id is None:
+        raise RuntimeError(f"no template matched prompt {n}")
+
+    # Same sequence as job_runner: launch, poll while paging stdout, final read.
+    mark = time.perf_counter()
+    job_id = awx_actions.launch_job_template(template_id, {"jobname": f"JOB{n:05d}"})
+    timings["awx_launch"] = time.perf_counter() - mark
+    if not job_id:
+        raise RuntimeError(f"launch failed in session {n}")
+
+    mark = time.perf_counter()
+    reader = awx_actions.JobOutputReader(awx_actions.get_client(), job_id)
+    parser = AnsibleOutputParser()
+    writer = store.writer(job_id, log_store.FULL_LOG)
+
+    expected_lines = len(awx.fixtures[awx.fixture_of(job_id)])
+    max_pages = expected_lines // reader.page_lines + 2
+
+    def read_output(final=False):
+        for pages, page in enumerate(reader.read_new(final), 1):
+            if pages > max_pages:
+                raise RuntimeError(f"stdout of job {job_id} did not end after {max_pages} pages")
+            parser.feed(page)
+            writer.write(page)
+
+    status = awx_actions.wait_for_job_completion(job_id, timeout=120, on_poll=lambda s: s == "running" and read_output())
+    timings["awx_wait"] = time.perf_counter() - mark
+    if status != "successful":
+        raise RuntimeError(f"job {job_id} ended {status}")
+
+    mark = time.perf_counter()
+    read_output(final=True)
+    info = writer.close()
+    if info.total_lines != expected_lines:
+        raise RuntimeError(f"stdout of job {job_id} stored as {info.total_lines} lines, expected {expected_lines}")
+    parsed = parser.close()
+    store.put(job_id, log_store.SYSOUT, parsed.sysout or "")
+    timings["awx_output"] = time.perf_counter() - mark
+
+    mark = last = time.perf_counter()
+    sysout = store.read_text(job_id, log_store.SYSOUT)
+    for event in ai_analysis.hybrid_analysis_stream(sysout, use_cache=use_cache):
+        now = time.perf_counter()
+        if event.kind == "triage":
+            timings["triage"] = now - last
+            last = now
+        elif event.kind == "kb":
+            timings["kb_lookup"] = now - last
+            last = now
+        elif event.kind == "token" and "first_token" not in timings:
+            timings["first_token"] = now - mark
+        elif event.kind == "done":
+            timings["synthesis"] = now - last
+    timings["analysis_total"] = time.perf_counter() - mark
+    timings["session_total"] = time.perf_counter() - start
+    return timings
+
+
+def run(args) -> dict:
+    awx, store = setup(args)
+    if args.tracemalloc:
+        tracemalloc.start()
+    samples: dict[str, list[float]] = defaultdict(list)
+    errors = []
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [pool.submit(run_session, n, awx, store, args.cache) for n in range(args.sessions)]
+        for future in futures:
+            try:
+                for stage, seconds in future.result().items():
+                    samples[stage].append(seconds)
+            except Exception as e:
+                errors.append(str(e))
+    elapsed = time.perf_counter() - started
+    awx.stop()
+
+    result = {
+        "params": {k: v for k, v in vars(args).items() if k not in ("json", "save_baseline", "baseline", "tolerance", "verbose")},
+        "sessions_ok": args.sessions - len(errors),
+        "errors": errors[:10],
+        "seconds": elapsed,
+        "throughput_sessions_per_s": (args.sessions - len(errors)) / elapsed,
+        "awx_requests": awx.requests,
+        # ru_maxrss is in KiB on Linux; it is the process peak, including imports.
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "rss_growth_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024,
+        "stages": {
+            stage: {"n": len(samples[stage]), "p50": percentile(samples[stage], 50),
+                    "p95": percentile(samples[stage], 95), "p99": percentile(samples[stage], 99)}
+            for stage in STAGES if samples[stage]
+        },
+    }
+    if args.tracemalloc:
+        result["python_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1_000_000
+        tracemalloc.stop()
+    return result
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Returns a description of every p95 or throughput regression beyond tolerance."""
+    regressions = []
+    for stage, current in result["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if not before:
+            continue
+        limit = before["p95"] * (1 + tolerance)
+        if current["p95"] > limit and current["p95"] - before["p95"] > MIN_REGRESSION_SECONDS:
+            regressions.append(f"{stage}: p95 {current['p95'] * 1000:.1f} ms vs baseline {before['p95'] * 1000:.1f} ms")
+    before_tp = baseline.get("throughput_sessions_per_s")
+    if before_tp and result["throughput_sessions_per_s"] < before_tp / (1 + tolerance):
+        regressions.append(f"throughput: {result['throughput_sessions_per_s']:.2f}/s vs baseline {before_tp:.2f}/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark against local stand-ins.")
+    parser.add_argument("--sessions", type=int, default=48)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--stdout-mb", type=float, default=2.0, help="size of each job's stdout fixture")
+    parser.add_argument("--job-pending", type=float, default=0.1, help="seconds a fake job stays pending")
+    parser.add_argument("--job-seconds", type=float, default=0.5, help="seconds a fake job runs")
+    parser.add_argument("--poll-delay", type=float, default=0.1, help="initial AWX poll interval")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake AWX requests that fail")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="fake LLM time to first chunk")
+    parser.add_argument("--llm-chunk-delay", type=float, default=0.01, help="fake LLM delay between chunks")
+    parser.add_argument("--kb-latency", type=float, default=0.002, help="simulated round trip per KB query")
+    parser.add_argument("--embed-latency", type=float, default=0.005, help="simulated cost per encode call")
+    parser.add_argument("--real-embeddings", action="store_true", help="use the sentence-transformers model")
+    parser.add_argument("--cache", action="store_true", help="let repeated sysouts hit the analysis cache")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report peak Python heap (slower)")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative p95 slowdown")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    parser.add_argument("--verbose", action="store_true", help="show the application's own log output")
+    args = parser.parse_args()
+
+    # The app logs with print(); keep the report readable unless asked for the chatter.
+    with contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO()):
+        result = run(args)
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(result, indent=2) + "\n")
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() and not args.save_baseline else None
+    regressions = compare(result, baseline, args.tolerance) if baseline else []
+    if baseline and baseline.get("params") != result["params"]:
+        print("WARNING: baseline was recorded with different parameters; the comparison is indicative only.")
+
+    if args.json:
+        print(json.dumps({"result": result, "regressions": regressions}, indent=2))
+    else:
+        print(f"{result['sessions_ok']}/{args.sessions} sessions in {result['seconds']:.2f}s at concurrency "
+              f"{args.concurrency}: {result['throughput_sessions_per_s']:.2f} sessions/s, "
+              f"{result['awx_requests']} AWX requests, peak RSS {result['peak_rss_mb']:.0f} MB")
+        if "python_peak_mb" in result:
+            print(f"Peak Python heap: {result['python_peak_mb']:.1f} MB")
+        print(f"{'stage':<16}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'base p95':>10}")
+        for stage, s in result["stages"].items():
+            base = baseline["stages"].get(stage, {}).get("p95") if baseline else None
+            base_text = f"{base * 1000:10.1f}" if base is not None else f"{'-':>10}"
+            print(f"{stage:<16}{s['p50'] * 1000:10.1f}{s['p95'] * 1000:10.1f}{s['p99'] * 1000:10.1f}{base_text}")
+        for error in result["errors"]:
+            print(f"  ERROR {error}")
+        for regression in regressions:
+            print(f"  REGRESSION {regression}")
+        if args.save_baseline:
+            print(f"Baseline saved to {args.baseline}.")
+    sys.exit(1 if regressions or result["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+# --- benchmarks/bench_embeddings.py ---
+# Parity, throughput and memory of the embedding backends (see embedding_service).
+#
+# Parity: both backends route the same prompts to the same template of
+# awx_templates_kb.csv and return the same top-k work instructions of
+# work_instructions.csv. Two cases are checked:
+#   own   - the knowledge base is embedded by the same backend as the query (after a re-ingest)
+#   mixed - rows embedded by torch, queries by onnx (switching backend without re-ingesting)
+# Throughput and memory: each backend runs in a fresh interpreter. The report gives
+# RSS after loading, single-query latency and batched texts/s.
+#
+# Run from the repository root, after export_onnx_model.py:
+#   python benchmarks/bench_embeddings.py
+# The exit status is 1 if parity falls below the thresholds.
+
+import argparse
+import csv
+import json
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import embedding_service
+import template_selector
+from ingest_templates import TEMPLATES_SPEC
+from ingest_work_instructions import WORK_INSTRUCTIONS_SPEC
+
+from bench_triage import load_corpus
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+# Prompts phrased the way operators type them, on top of the template descriptions themselves.
+TEMPLATE_PROMPTS = [
+    "download the job output sysout from the mainframe for jobname PAYROLL1",
+    "show me the log of job NIGHTLY2",
+    "get the sysout for jobname BKUP0001 on DCUF",
+    "run a SID check on DCUF",
+    "health check of the system id in the DCUF LPAR",
+    "is the DCUF system healthy",
+    "restart the CICS region",
+    "what is the weather today",
+]
+
+
+def _read_csv(path: Path) -> list[dict]:
+    with path.open(newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def load_backend(name: str, torch_model: str, onnx_dir: Path):
+    if name == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(torch_model)
+    return embedding_service.OnnxEncoder(onnx_dir)
+
+
+def _encode(model, texts: list[str]) -> np.ndarray:
+    return np.asarray(model.encode(texts, batch_size=embedding_service.DEFAULT_BATCH_SIZE, show_progress_bar=False),
+                      dtype=np.float32)
+
+
+def _routes(rows: np.ndarray, queries: np.ndarray, names: list[str]) -> list[str | None]:
+    """The template each query is routed to, or None when the best match is below the similarity threshold."""
+    scores = queries @ rows.T
+    best = scores.argmax(axis=1)
+    return [names[b] if scores[q, b] >= template_selector.SIMILARITY_THRESHOLD else None for q, b in enumerate(best)]
+
+
+def _top_k(rows: np.ndarray, queries: np.ndarray, k: int) -> list[list[int]]:
+    return [list(np.argsort(-scores, kind="stable")[:k]) for scores in queries @ rows.T]
+
+
+def parity(args) -> dict:
+    templates = _read_csv(args.templates_csv)
+    instructions = _read_csv(args.instructions_csv)
+    template_texts = [TEMPLATES_SPEC.embed_text(r) for r in templates]
+    template_queries = [r["description"] for r in templates] + TEMPLATE_PROMPTS
+    instruction_texts = [WORK_INSTRUCTIONS_SPEC.embed_text(r) for r in instructions]
+    codes = {r["error_code"].strip().upper() for r in instructions if r["error_code"].strip()}
+    codes |= {case["expected_code"] for case in load_corpus() if case["expected_code"]}
+    instruction_queries = sorted(codes) + [r["title"] for r in instructions]
+    names = [r["template_name"] for r in templates]
+    k = min(args.k, len(instructions))
+
+    vectors = {}
+    for backend in ("torch", "onnx"):
+        model = load_backend(backend, args.torch_model, args.onnx_dir)
+        vectors[backend] = {key: _encode(model, texts) for key, texts in
+                            [("templates", template_texts), ("template_queries", template_queries),
+                             ("instructions", instruction_texts), ("instruction_queries", instruction_queries)]}
+        del model
+    torch_v, onnx_v = vectors["torch"], vectors["onnx"]
+
+    reference_routes = _routes(torch_v["templates"], torch_v["template_queries"], names)
+    reference_top = _top_k(torch_v["instructions"], torch_v["instruction_queries"], k)
+    result = {"k": k, "template_queries": len(template_queries), "instruction_queries": len(instruction_queries)}
+    for case, rows in (("own", onnx_v), ("mixed", torch_v)):
+        routes = _routes(rows["templates"], onnx_v["template_queries"], names)
+        top = _top_k(rows["instructions"], onnx_v["instruction_queries"], k)
+        result[case] = {
+            "template_agreement": float(np.mean([a == b for a, b in zip(routes, reference_routes)])),
+            "template_mismatches": [(q, a, b) for q, a, b in zip(template_queries, reference_routes, routes) if a != b],
+            "topk_exact": float(np.mean([a == b for a, b in zip(top, reference_top)])),
+            "topk_overlap": float(np.mean([len(set(a) & set(b)) / k for a, b in zip(top, reference_top)])),
+        }
+    similarities = np.concatenate([np.sum(torch_v[key] * onnx_v[key], axis=1) for key in torch_v])
+    result["cosine_min"] = float(similarities.min())
+    result["cosine_mean"] = float(similarities.mean())
+    return result
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 1_000_000
+
+
+def measure(args) -> dict:
+    """Run in a fresh interpreter per backend, so one backend's imports don't inflate the other's memory."""
+    before = _rss_mb()
+    started = time.perf_counter()
+    model = load_backend(args.measure, args.torch_model, args.onnx_dir)
+    load_s = time.perf_counter() - started
+    loaded = _rss_mb()
+    instructions = _read_csv(args.instructions_csv)
+    corpus = [WORK_INSTRUCTIONS_SPEC.embed_text(r) for r in instructions] + [c["sysout"][:2000] for c in load_corpus()]
+    queries = TEMPLATE_PROMPTS * max(1, args.queries // len(TEMPLATE_PROMPTS))
+    model.encode(queries[0], show_progress_bar=False)          # first-call setup is not part of the steady state
+
+    started = time.perf_counter()
+    for query in queries:
+        model.encode(query, show_progress_bar=False)
+    single_ms = (time.perf_counter() - started) / len(queries) * 1000
+    batch = (corpus * (args.batch_texts // len(corpus) + 1))[:args.batch_texts]
+    started = time.perf_counter()
+    model.encode(batch, batch_size=embedding_service.DEFAULT_BATCH_SIZE, show_progress_bar=False)
+    batch_rate = len(batch) / (time.perf_counter() - started)
+    return {"backend": args.measure, "load_s": load_s, "rss_before_mb": before, "rss_loaded_mb": loaded,
+            "model_mb": loaded - before, "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "single_query_ms": single_ms, "batch_texts_per_s": batch_rate}
+
+
+def _measure_in_subprocess(backend: str, args) -> dict:
+    command = [sys.executable, "-W", "ignore", __file__, "--measure", backend, "--torch-model", args.torch_model,
+               "--onnx-dir", str(args.onnx_dir), "--queries", str(args.queries), "--batch-texts", str(args.batch_texts),
+               "--instructions-csv", str(args.instructions_csv)]
+    result = subprocess.run(command, capture_output=True, text=True, timeout=900)
+    if result.returncode != 0:
+        return {"backend": backend, "error": (result.stderr.strip().splitlines() or ["failed"])[-1]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding backend parity and performance.")
+    parser.add_argument("--torch-model", default=embedding_service.MODEL_NAME)
+    parser.add_argument("--onnx-dir", type=Path, default=embedding_service.ONNX_MODEL_DIR)
+    parser.add_argument("--templates-csv", type=Path, default=REPO_ROOT / "awx_templates_kb.csv")
+    parser.add_argument("--instructions-csv", type=Path, default=REPO_ROOT / "work_instructions.csv")
+    parser.add_argument("--k", type=int, default=5, help="top-k work instructions compared")
+    parser.add_argument("--min-template-agreement", type=float, default=1.0)
+    parser.add_argument("--min-topk-overlap", type=float, default=0.9)
+    parser.add_argument("--queries", type=int, default=200, help="single-text encodes timed per backend")
+    parser.add_argument("--batch-texts", type=int, default=1024, help="texts in the batched encode")
+    parser.add_argument("--skip-performance", action="store_true")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    parser.add_argument("--measure", choices=embedding_service.BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args)))
+        return
+
+    result = {"parity": parity(args)}
+    if not args.skip_performance:
+        result["performance"] = [_measure_in_subprocess(b, args) for b in embedding_service.BACKENDS]
+    failures = []
+    for case in ("own", "mixed"):
+        p = result["parity"][case]
+        if p["template_agreement"] < args.min_template_agreement:
+            failures.append(f"{case}: template agreement {p['template_agreement']:.2%}")
+        if p["topk_overlap"] < args.min_topk_overlap:
+            failures.append(f"{case}: top-{result['parity']['k']} overlap {p['topk_overlap']:.2%}")
+
+    if args.json:
+        print(json.dumps({"result": result, "failures": failures}, indent=2))
+    else:
+        p = result["parity"]
+        print(f"Parity onnx vs torch: {p['template_queries']} routing prompts, {p['instruction_queries']} KB queries, "
+              f"cosine min {p['cosine_min']:.4f} mean {p['cosine_mean']:.4f}")
+        for case in ("own", "mixed"):
+            c = p[case]
+            print(f"  {case:<6} templates {c['template_agreement']:7.1%}   top-{p['k']} exact {c['topk_exact']:7.1%}   "
+                  f"overlap {c['topk_overlap']:7.1%}")
+            for query, expected, got in c["template_mismatches"]:
+                print(f"         '{query}': torch {expected}, onnx {got}")
+        for perf in result.get("performance", []):
+            if "error" in perf:
+                print(f"  {perf['backend']:<6} not measured: {perf['error']}")
+                continue
+            print(f"  {perf['backend']:<6} load {perf['load_s']:5.1f}s  model RSS {perf['model_mb']:6.0f} MB  "
+                  f"peak RSS {perf['peak_rss_mb']:6.0f} MB  query {perf['single_query_ms']:6.1f} ms  "
+                  f"batch {perf['batch_texts_per_s']:7.0f} texts/s")
+        for failure in failures:
+            print(f"  FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# --- benchmarks/bench_triage.py ---
+# Accuracy and throughput of the rule-based sysout triage against the
+# labelled corpus in triage_corpus.jsonl. The single-regex triage that used to
+# live in ai_analysis is measured alongside it as a baseline.
+#
+# Run from the repository root:  python benchmarks/bench_triage.py
+
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import triage_rules
+
+CORPUS_PATH = Path(__file__).with_name("triage_corpus.jsonl")
+LEGACY_PATTERN = re.compile(r"(S[0-9A-F]{3}|U\d{4})")
+FILLER_LINE = " PAYR0100I RECORD 000123456 PROCESSED FOR ACCOUNT 0012345678 AMOUNT +000012345.67 BRANCH 0042"
+
+
+def load_corpus(path: Path = CORPUS_PATH) -> list[dict]:
+    with path.open() as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def legacy_triage(sysout: str) -> str | None:
+    match = LEGACY_PATTERN.search(sysout)
+    return match.group(1) if match else None
+
+
+def measure_accuracy(corpus: list[dict]) -> dict:
+    code_hits = step_hits = legacy_hits = confident = 0
+    failures = []
+    for case in corpus:
+        result = triage_rules.triage(case["sysout"])
+        primary = result.primary
+        code = primary.code if primary else None
+        step = primary.step if primary else None
+        if code == case["expected_code"]:
+            code_hits += 1
+        else:
+            failures.append(f"{case['id']}: expected {case['expected_code']}, got {code}")
+        if step == case["expected_step"]:
+            step_hits += 1
+        elif code == case["expected_code"]:
+            failures.append(f"{case['id']}: expected step {case['expected_step']}, got {step}")
+        if result.confident:
+            confident += 1
+        if legacy_triage(case["sysout"]) == case["expected_code"]:
+            legacy_hits += 1
+    n = len(corpus)
+    return {
+        "cases": n,
+        "code_accuracy": code_hits / n,
+        "step_accuracy": step_hits / n,
+        "confident_rate": confident / n,
+        "legacy_code_accuracy": legacy_hits / n,
+        "failures": failures,
+    }
+
+
+def measure_throughput(corpus: list[dict], filler_lines: int, repeats: int) -> dict:
+    # Bury each labelled log in a large block of application output, as in a real
+    # multi-megabyte sysout, so the measurement is dominated by lines that match nothing.
+    filler = "\n".join([FILLER_LINE] * filler_lines)
+    logs = [f"{filler}\n{case['sysout']}\n{filler}" for case in corpus]
+    total_bytes = sum(len(log) for log in logs) * repeats
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for log in logs:
+            triage_rules.triage(log)
+    elapsed = time.perf_counter() - start
+    return {
+        "logs": len(logs) * repeats,
+        "seconds": elapsed,
+        "logs_per_second": len(logs) * repeats / elapsed,
+        "mb_per_second": total_bytes / elapsed / 1_000_000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--filler-lines", type=int, default=20_000, help="noise lines around each corpus log")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    accuracy = measure_accuracy(corpus)
+    throughput = measure_throughput(corpus, args.filler_lines, args.repeats)
+    if args.json:
+        print(json.dumps({"accuracy": accuracy, "throughput": throughput}, indent=2))
+        return
+    print(f"Corpus: {accuracy['cases']} labelled sysouts")
+    print(f"  primary code accuracy : {accuracy['code_accuracy']:.0%}  (legacy regex: {accuracy['legacy_code_accuracy']:.0%})")
+    print(f"  step name accuracy    : {accuracy['step_accuracy']:.0%}")
+    print(f"  resolved without LLM  : {accuracy['confident_rate']:.0%}")
+    for failure in accuracy["failures"]:
+        print(f"  MISS {failure}")
+    print(f"Throughput: {throughput['logs_per_second']:.1f} logs/s, {throughput['mb_per_second']:.1f} MB/s "
+          f"({throughput['logs']} logs in {throughput['seconds']:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+# --- benchmarks/standins.py ---
+# Local stand-ins for the services the app talks to, so the end-to-end
+# benchmark runs on a laptop with no network:
+#   FakeAWX               - HTTP server with canned job lifecycles and large stdout fixtures
+#   HashingEncoder        - deterministic replacement for the sentence-transformers model
+#   InMemoryKnowledgeBase - work_instructions.csv searched in memory with the same fusion as kb_search
+# The fake LLM is llm_stub.StubLLM from the repository root.
+
+import csv
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+
+import embedding_cache
+import embedding_service
+import kb_search
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+TEMPLATES_CSV = REPO_ROOT / "awx_templates_kb.csv"
+WORK_INSTRUCTIONS_CSV = REPO_ROOT / "work_instructions.csv"
+_ANSI_OK = "\x1b[0;32m{}\x1b[0m"   # how Ansible colors "ok:" lines in the raw stdout
+NOISE_LINE = '        "PAYR0100I RECORD 000123456 PROCESSED FOR ACCOUNT 0012345678 AMOUNT +000012345.67 BRANCH 0042",\n'
+
+_WORD = re.compile(r"[A-Za-z0-9$#@=]+")
+
+
+# --- Embeddings ---
+class HashingEncoder:
+    """Embeds text by hashing words and character trigrams into EMBEDDING_DIM buckets.
+
+    Same interface as SentenceTransformer.encode. Similar texts get similar
+    vectors, which is enough to exercise ranking code. latency is charged per call
+    to approximate the real model's cost.
+    """
+
+    def __init__(self, dim: int = embedding_service.EMBEDDING_DIM, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+
+    def _vector(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in _WORD.findall(text.lower()):
+            features = [word] + [word[i:i + 3] for i in range(max(len(word) - 2, 1))]
+            for n, feature in enumerate(features):
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dim
+                sign = 1.0 if digest[4] & 1 else -1.0
+                vector[bucket] += sign * (2.0 if n == 0 else 1.0)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, texts, batch_size=None, show_progress_bar=False):
+        if self.latency:
+            time.sleep(self.latency)
+        if isinstance(texts, str):
+            return self._vector(texts)
+        return np.stack([self._vector(t) for t in texts]) if texts else np.zeros((0, self.dim), dtype=np.float32)
+
+
+def install_encoder(encoder):
+    """Makes embedding_service use encoder instead of loading the real model.
+
+    Its vectors are cached in memory only, so they never reach the real model's shared cache file.
+    """
+    embedding_service._model = encoder
+    embedding_cache._default_cache = embedding_cache.EmbeddingCache(path=None)
+
+
+# --- Knowledge base ---
+def load_template_rows(path: Path = TEMPLATES_CSV) -> list[tuple[int, str, np.ndarray]]:
+    """(template_id, template_name, embedding) rows, embedded the way ingest_templates does."""
+    with path.open(newline="") as f:
+        records = list(csv.DictReader(f))
+    texts = [f"Template Name: {r['template_name']}. Purpose: {r['description']}" for r in records]
+    embeddings = embedding_service.encode(texts)
+    return [(int(r["template_id"]), r["template_name"], e) for r, e in zip(records, embeddings)]
+
+
+class InMemoryKnowledgeBase:
+    """Drop-in for kb_search.search_work_instructions over work_instructions.csv.
+
+    The three sources (error-code prefix, vector nearest neighbours, keyword
+    match) are fused with kb_search._fuse. query_latency is charged per source
+    to model the database round trips.
+    """
+
+    def __init__(self, path: Path = WORK_INSTRUCTIONS_CSV, query_latency: float = 0.0):
+        with path.open(newline="") as f:
+            records = list(csv.DictReader(f))
+        self.rows = [(n + 1, (r["error_code"] or "").strip().upper() or None, r["title"], r["resolution_steps"])
+                     for n, r in enumerate(records)]
+        texts = [f"Title: {title}\nResolution: {steps}" for _, _, title, steps in self.rows]
+        self.matrix = np.asarray(embedding_service.encode(texts), dtype=np.float32)
+        self.terms = [set(_WORD.findall(f"{title} {steps}".lower())) for _, _, title, steps in self.rows]
+        self.query_latency = query_latency
+        self.queries = 0
+
+    def _charge(self):
+        self.queries += 1
+        if self.query_latency:
+            time.sleep(self.query_latency)
+
+    def search(self, query_text: str, limit: int = 2, ef_search: int = kb_search.HNSW_EF_SEARCH):
+        query_text = query_text.strip()
+        code = query_text.upper()
+        k = kb_search.CANDIDATES_PER_SOURCE
+        ranked = {}
+        if kb_search.ERROR_CODE_PATTERN.match(code):
+            self._charge()
+            hits = [r for r in self.rows if r[1] and r[1].startswith(code)]
+            ranked["code"] = sorted(hits, key=lambda r: (r[1] != code, len(r[1]), r[0]))[:k]
+        self._charge()
+        scores = self.matrix @ np.asarray(embedding_service.encode(query_text), dtype=np.float32)
+        ranked["vector"] = [self.rows[i] for i in np.argsort(-scores)[:k]]
+        self._charge()
+        words = set(_WORD.findall(query_text.lower()))
+        overlap = [(len(words & terms), n) for n, terms in enumerate(self.terms) if words & terms]
+        ranked["fulltext"] = [self.rows[n] for _, n in sorted(overlap, key=lambda o: (-o[0], o[1]))[:k]]
+        return kb_search._fuse(ranked, limit)
+
+    def install(self):
+        kb_search.search_work_instructions = self.search
+
+
+# --- AWX ---
+def build_stdout(sysout: str, target_bytes: int, min_lines: int = 0) -> str:
+    """An Ansible joboutput-style stdout of about target_bytes and at least min_lines, with sysout between the log markers."""
+    escaped = json.dumps(sysout)[1:-1]
+    head = "PLAY [DCUF] ********************************************************************\n\n" \
+           "TASK [Fetch job output] ********************************************************\n" \
+           "ok: [DCUF]\n\nTASK [Print job output] ********************************************************\n" \
+           "ok: [DCUF] => {\n    \"stdout_lines\": [\n"
+    tail = f"    ],\n    \"msg\": \"--- BEGIN MAINFRAME JOB LOG ---\\n{escaped}\\n--- END MAINFRAME JOB LOG ---\"\n}}\n\n" \
+           "PLAY RECAP *********************************************************************\n" \
+           "DCUF                       : ok=2    changed=0    unreachable=0    failed=0    skipped=0\n"
+    filler = max(0, (target_bytes - len(head) - len(tail)) // len(NOISE_LINE),
+                 min_lines - head.count("\n") - tail.count("\n"))
+    return head + NOISE_LINE * filler + tail
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128       # the default of 5 drops SYNs under concurrent connects
+
+
+class FakeAWX:
+    """A local AWX API: launch, job list and status, paged stdout and cancel.
+
+    A launched job is "pending" for pending_seconds and then "running" for
+    run_seconds, with its stdout growing as it runs. It then ends "successful".
+    Stdout fixtures cycle through the given sysouts, each at least min_lines
+    long. Like AWX, stdout honours start_line/end_line only with format=json,
+    whose content keeps the ANSI colors; format=txt is always the whole stdout,
+    uncolored. Above max_display_bytes (AWX's STDOUT_MAX_BYTES_DISPLAY) both
+    give a "too large" notice and only format=txt_download has the stdout.
+    A fraction error_rate of requests fail with 502 (GET) or 429 (POST) to
+    exercise client retries.
+    """
+
+    def __init__(self, sysouts: list[str], stdout_bytes: int = 1_000_000, pending_seconds: float = 0.1,
+                 run_seconds: float = 0.5, error_rate: float = 0.0, seed: int = 0, min_lines: int = 0,
+                 max_display_bytes: int = 1_048_576):
+        self.fixtures = [build_stdout(s, stdout_bytes, min_lines).splitlines(keepends=True) for s in sysouts]
+        self.max_display_bytes = max_display_bytes
+        self.pending_seconds = pending_seconds
+        self.run_seconds = run_seconds
+        self.error_rate = error_rate
+        self.jobs: dict[int, dict] = {}
+        self.requests = 0
+        self._ids = itertools.count(1000)
+        self._fixture_cycle = itertools.cycle(range(len(self.fixtures)))
+        self._lock = threading.Lock()
+        self._failures = np.random.default_rng(seed)
+        self._server = _Server(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-awx", daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self) -> "FakeAWX":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def fixture_of(self, job_id: int) -> int:
+        return self.jobs[job_id]["fixture"]
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            return self.error_rate > 0 and self._failures.random() < self.error_rate
+
+    def _launch(self, template_id: int) -> int:
+        with self._lock:
+            job_id = next(self._ids)
+            self.jobs[job_id] = {"launched": time.monotonic(), "fixture": next(self._fixture_cycle), "canceled": False,
+                                 "template": template_id}
+        return job_id
+
+    def _state(self, job_id: int) -> tuple[str, list[str]]:
+        job = self.jobs[job_id]
+        lines = self.fixtures[job["fixture"]]
+        age = time.monotonic() - job["launched"]
+        if job["canceled"]:
+            return "canceled", lines
+        if age < self.pending_seconds:
+            return "pending", []
+        if age < self.pending_seconds + self.run_seconds:
+            done = (age - self.pending_seconds) / self.run_seconds
+            return "running", lines[:int(len(lines) * done)]
+        return "successful", lines
+
+    def _stdout(self, lines: list[str], query: dict) -> tuple[str, str]:
+        """Body and content type of GET /api/v2/jobs/<id>/stdout/."""
+        size = sum(len(line) for line in lines)
+        if size > self.max_display_bytes and query.get("format") != "txt_download":
+            notice = (f"Standard Output too large to display ({size} bytes), only download supported "
+                      f"for sizes over {self.max_display_bytes} bytes.")
+            if query.get("format") != "json":
+                return notice, "text/plain"
+            return json.dumps({"range": {"start": 0, "end": 1, "absolute_end": 1}, "content": notice}), "application/json"
+        if query.get("format") != "json":
+            return "".join(lines), "text/plain"
+        start = min(int(query.get("start_line", 0)), len(lines))
+        end = min(int(query.get("end_line", len(lines))), len(lines))
+        content = "".join(_ANSI_OK.format(line[:-1]) + "\n" if line.startswith("ok:") else line for line in lines[start:end])
+        return json.dumps({"range": {"start": start, "end": max(start, end), "absolute_end": len(lines)},
+                           "content": content}), "application/json"
+
+    def _list(self, query: dict) -> dict:
+        """One page of GET /api/v2/jobs/, honouring the id__gte, id__lte, id__in, job_template and status__in filters."""
+        ids = sorted(self.jobs)
+        if "id__gte" in query:
+            ids = [i for i in ids if i >= int(query["id__gte"])]
+        if "id__lte" in query:
+            ids = [i for i in ids if i <= int(query["id__lte"])]
+        if "id__in" in query:
+            ids = [i for i in ids if str(i) in query["id__in"].split(",")]
+        if "job_template" in query:
+            ids = [i for i in ids if self.jobs[i]["template"] == int(query["job_template"])]
+        if "status__in" in query:
+            ids = [i for i in ids if self._state(i)[0] in query["status__in"].split(",")]
+        size, page = int(query.get("page_size", 25)), int(query.get("page", 1))
+        results = [{"id": i, "name": "joboutput", "status": self._state(i)[0]} for i in ids[(page - 1) * size:page * size]]
+        following = {**query, "page": page + 1}
+        return {"count": len(ids), "results": results,
+                "next": f"/api/v2/jobs/?{urllib.parse.urlencode(following)}" if page * size < len(ids) else None}
+
+    def _handler(self):
+        awx = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, code: int, body: str, content_type: str = "application/json"):
+                data = body.encode()
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if awx._should_fail():
+                    return self._send(429, "{}")
+                parts = self.path.strip("/").split("/")
+                if parts[-1] == "launch":
+                    return self._send(201, json.dumps({"job": awx._launch(int(parts[-2]))}))
+                if parts[-1] == "cancel" and int(parts[-2]) in awx.jobs:
+                    awx.jobs[int(parts[-2])]["canceled"] = True
+                    return self._send(202, "{}")
+                self._send(404, "{}")
+
+            def do_GET(self):
+                if awx._should_fail():
+                    return self._send(502, "{}")
+                url = urllib.parse.urlparse(self.path)
+                parts = url.path.strip("/").split("/")
+                if parts == ["api", "v2", "jobs"]:
+                    return self._send(200, json.dumps(awx._list(dict(urllib.parse.parse_qsl(url.query)))))
+                try:
+                    job_id = int(parts[3])
+                except (IndexError, ValueError):
+                    return self._send(404, "{}")
+                if job_id not in awx.jobs:
+                    return self._send(404, "{}")
+                status, lines = awx._state(job_id)
+                if parts[-1] == "stdout":
+                    return self._send(200, *awx._stdout(lines, dict(urllib.parse.parse_qsl(url.query))))
+                self._send(200, json.dumps({"id": job_id, "status": status}))
+
+        return Handler
@@ -16,4 +16,16 @@ VERIFY_SSL = False
 # --- User Authentication Configuration ---
 USER_SECRETS = {
     "sunil": "JBSWY3DPEHPK3PXP" # This is an example secret.
-}
\ No newline at end of file
+}
+
+# Users who see the pipeline metrics panel in the sidebar.
+ADMIN_USERS = ["sunil"]
+
+# Embedding backend: "torch" (sentence-transformers) or "onnx" (int8 ONNX Runtime; run export_onnx_model.py first).
+EMBEDDING_BACKEND = "torch"
+
+# AWX job template that runs the joboutput playbook; batch_triage.py reads only its jobs unless given --template.
+JOBOUTPUT_TEMPLATE_ID = 15
+
+# AWX job template that runs get_logs.yml, used by console_logs.py (None until the template exists).
+CONSOLE_LOG_TEMPLATE_ID = None
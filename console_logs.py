@@ -0,0 +1,286 @@
+# --- console_logs.py ---
+# The z/OS console log (SYSLOG/OPERLOG) of an LPAR for the last few hours,
+# served from a local store so repeated requests don't pull it again.
+#
+# get_logs.yml runs `pcon -s <start>` on the LPAR and returns everything
+# logged since then as its log_content artifact. ConsoleLogService keeps what
+# it fetched in a SQLite file, as zlib-compressed time-indexed segments, with
+# a cursor per LPAR: the time range covered and the newest line stored. A
+# "last N hours" request launches the template only for what is missing,
+# usually the minutes since the cursor. pcon reads from a start time to the
+# present, so a window reaching back before the stored range refetches that
+# range too; only the lines not already stored are kept.
+#
+#   python console_logs.py DCUF --hours 3 [--grep IEF450I]
+#
+# CONSOLE_LOG_TEMPLATE_ID in config.py names the AWX template running
+# get_logs.yml, which must prompt for Extra Variables on launch.
+
+import argparse
+import re
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+import awx_actions
+import telemetry
+from config import CONSOLE_LOG_TEMPLATE_ID
+
+CONSOLE_LOG_PATH = "console_logs.sqlite3"
+# Zone of the console timestamps; the playbook formats start_epoch for pcon in the
+# AWX execution environment's zone (UTC by default), so the two must agree.
+CONSOLE_TIMEZONE = timezone.utc
+SEGMENT_LINES = 2000
+COMPRESSION_LEVEL = 6
+REFRESH_SECONDS = 60        # a store refreshed this recently answers without launching the template
+FETCH_TIMEOUT = 10 * 60     # seconds
+RETENTION_HOURS = 72
+MAX_HOURS = RETENTION_HOURS
+
+# A SYSLOG record: type, routing codes and system name, then the date (YYDDD) and time (hh:mm:ss.th).
+_TIMESTAMP = re.compile(r"^.{0,40}?\b(\d{2})(\d{3}) (\d{2}):(\d{2}):(\d{2})\.(\d{2})\b")
+
+
+class ConsoleLogError(Exception):
+    pass
+
+
+@dataclass
+class Cursor:
+    covered_from: float         # the store holds every line logged in [covered_from, covered_to]
+    covered_to: float
+    last_line: float | None     # timestamp of the newest stored line
+    tail_lines: int             # stored lines with that timestamp
+
+
+@dataclass
+class ConsoleLog:
+    lpar: str
+    start: float
+    end: float                  # the log is complete up to here
+    lines: list[str]
+    fetched_bytes: int = 0      # pulled from the LPAR to answer this request
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+
+def parse_timestamp(line: str) -> float | None:
+    m = _TIMESTAMP.match(line)
+    if not m:
+        return None
+    yy, ddd, hh, mm, ss, th = map(int, m.groups())
+    moment = datetime(2000 + yy, 1, 1, tzinfo=CONSOLE_TIMEZONE) + timedelta(days=ddd - 1, hours=hh, minutes=mm,
+                                                                            seconds=ss + th / 100)
+    return moment.timestamp()
+
+
+def parse_console(text: str, start: float) -> list[tuple[float, str]]:
+    """(epoch, line) per line. Continuation lines of a multi-line message have no timestamp and take the one before."""
+    current = start
+    lines = []
+    for line in text.splitlines():
+        current = parse_timestamp(line) or current
+        lines.append((current, line))
+    return lines
+
+
+class ConsoleLogService:
+    def __init__(self, path: str = CONSOLE_LOG_PATH, client: awx_actions.AWXClient | None = None,
+                 template_id: int | None = CONSOLE_LOG_TEMPLATE_ID):
+        self.path = path
+        self.client = client
+        self.template_id = template_id
+        self._lock = threading.Lock()
+        self._lpar_locks: dict[str, threading.Lock] = {}
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS console_cursors ("
+            "lpar TEXT PRIMARY KEY, covered_from REAL NOT NULL, covered_to REAL NOT NULL, "
+            "last_line REAL, tail_lines INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS console_segments ("
+            "lpar TEXT NOT NULL, first_line REAL NOT NULL, last_line REAL NOT NULL, "
+            "line_count INTEGER NOT NULL, data BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS console_segments_time ON console_segments (lpar, last_line)")
+        self._conn.commit()
+
+    def _lpar_lock(self, lpar: str) -> threading.Lock:
+        with self._lock:
+            return self._lpar_locks.setdefault(lpar, threading.Lock())
+
+    # --- Queries ---
+    def last_hours(self, lpar: str, hours: float, refresh: bool = True) -> ConsoleLog:
+        """The console log of the last `hours`, fetching only what the store lacks. Raises ConsoleLogError."""
+        lpar = lpar.upper()
+        with self._lpar_lock(lpar):
+            now = time.time()
+            start = now - min(hours, MAX_HOURS) * 3600
+            fetched_bytes = 0
+            if refresh:
+                cursor = self.cursor(lpar)
+                if cursor and cursor.covered_to < start:
+                    self._drop(lpar)      # nothing stored is in the window, and the gap up to it isn't worth fetching
+                    cursor = None
+                if cursor is None or start < cursor.covered_from:
+                    fetch_from = start
+                elif now - cursor.covered_to >= REFRESH_SECONDS:
+                    fetch_from = cursor.last_line if cursor.last_line is not None else cursor.covered_to
+                else:
+                    fetch_from = None
+                telemetry.count("console_log", result="hit" if fetch_from is None else "fetch")
+                if fetch_from is not None:
+                    fetch_from = float(int(fetch_from))      # pcon -s takes whole seconds
+                    fetched, text = self._fetch(lpar, fetch_from)
+                    self._merge(lpar, cursor, fetch_from, fetched, parse_console(text, fetch_from))
+                    fetched_bytes = len(text)
+                    self.prune()
+            cursor = self.cursor(lpar)
+            return ConsoleLog(lpar, start, cursor.covered_to if cursor else start, self._read(lpar, start), fetched_bytes)
+
+    def cursor(self, lpar: str) -> Cursor | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT covered_from, covered_to, last_line, tail_lines FROM console_cursors WHERE lpar = ?", (lpar,)
+            ).fetchone()
+        return Cursor(*row) if row else None
+
+    def _read(self, lpar: str, start: float) -> list[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM console_segments WHERE lpar = ? AND last_line >= ? ORDER BY first_line, rowid", (lpar, start)
+            ).fetchall()
+        lines = []
+        for (data,) in rows:
+            for record in zlib.decompress(data).decode().split("\n"):
+                stamp, _, line = record.partition("\t")
+                if float(stamp) >= start:
+                    lines.append(line)
+        return lines
+
+    # --- Fetching ---
+    def _fetch(self, lpar: str, start: float) -> tuple[float, str]:
+        """Runs get_logs.yml from start. Returns the time up to which the log is complete, and the log."""
+        if self.template_id is None:
+            raise ConsoleLogError("CONSOLE_LOG_TEMPLATE_ID is not set in config.py.")
+        client = self.client or awx_actions.get_client()
+        launched = time.time()
+        with telemetry.span("console.fetch", lpar=lpar, start_epoch=int(start)) as span:
+            job_id = client.launch_job_template(self.template_id, {"lpar": lpar, "start_epoch": int(start)})
+            if not job_id:
+                raise ConsoleLogError(f"Could not launch the console log template for {lpar}.")
+            span.set(awx_job_id=job_id)
+            status = client.wait_for_job_completion(job_id, timeout=FETCH_TIMEOUT)
+            if status != "successful":
+                if status == "timeout":
+                    client.cancel_job(job_id)
+                raise ConsoleLogError(f"Console log job {job_id} for {lpar} ended {status}.")
+            try:
+                artifacts = client.get_job_artifacts(job_id)
+            except requests.exceptions.RequestException as e:
+                raise ConsoleLogError(f"Could not read the console log of job {job_id}. Details: {e}") from e
+            text = artifacts.get("log_content") or ""
+            span.set(bytes=len(text))
+        # fetched_epoch is taken before pcon runs, so everything logged until then is in the text.
+        return float(artifacts.get("fetched_epoch") or launched), text
+
+    def _merge(self, lpar: str, cursor: Cursor | None, start: float, fetched: float, lines: list[tuple[float, str]]):
+        """Stores the fetched lines the store doesn't have yet and moves the cursor."""
+        if cursor is None:
+            older, newer = [], lines
+            cursor = Cursor(start, fetched, None, 0)
+        else:
+            older = [(ts, line) for ts, line in lines if ts < cursor.covered_from]
+            newer, skip = [], cursor.tail_lines
+            for ts, line in lines:
+                if ts < cursor.covered_from or (cursor.last_line is not None and ts < cursor.last_line):
+                    continue
+                if ts == cursor.last_line and skip:
+                    skip -= 1                 # stored by the previous fetch, which ended in this same hundredth
+                    continue
+                newer.append((ts, line))
+            cursor = Cursor(min(cursor.covered_from, start), max(cursor.covered_to, fetched), cursor.last_line, cursor.tail_lines)
+        if newer:
+            last = newer[-1][0]
+            tail = sum(1 for ts, _ in newer if ts == last)
+            cursor.tail_lines = tail + (cursor.tail_lines if last == cursor.last_line else 0)
+            cursor.last_line = last
+        with self._lock:
+            for part in (older, newer):
+                for i in range(0, len(part), SEGMENT_LINES):
+                    segment = part[i:i + SEGMENT_LINES]
+                    data = zlib.compress("\n".join(f"{ts:.2f}\t{line}" for ts, line in segment).encode(), COMPRESSION_LEVEL)
+                    self._conn.execute(
+                        "INSERT INTO console_segments (lpar, first_line, last_line, line_count, data, created_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (lpar, segment[0][0], max(ts for ts, _ in segment), len(segment), data, time.time()),
+                    )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO console_cursors (lpar, covered_from, covered_to, last_line, tail_lines) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (lpar, cursor.covered_from, cursor.covered_to, cursor.last_line, cursor.tail_lines),
+            )
+            self._conn.commit()
+
+    # --- Housekeeping ---
+    def _drop(self, lpar: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM console_segments WHERE lpar = ?", (lpar,))
+            self._conn.execute("DELETE FROM console_cursors WHERE lpar = ?", (lpar,))
+            self._conn.commit()
+
+    def prune(self, max_age_hours: float = RETENTION_HOURS) -> int:
+        """Deletes segments older than max_age_hours. Returns how many were deleted."""
+        cutoff = time.time() - max_age_hours * 3600
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM console_segments WHERE last_line < ?", (cutoff,)).rowcount
+            if deleted:
+                self._conn.execute("UPDATE console_cursors SET covered_from = MAX(covered_from, ?)", (cutoff,))
+            self._conn.commit()
+        return deleted
+
+
+_default_service = None
+_service_lock = threading.Lock()
+
+
+def get_service() -> ConsoleLogService:
+    """The process-wide service, created on first use."""
+    global _default_service
+    if _default_service is None:
+        with _service_lock:
+            if _default_service is None:
+                _default_service = ConsoleLogService()
+    return _default_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the console log of an LPAR for the last few hours.")
+    parser.add_argument("lpar", help="inventory host name, e.g. DCUF")
+    parser.add_argument("--hours", type=float, default=1.0)
+    parser.add_argument("--grep", help="print only lines containing this text")
+    parser.add_argument("--cached", action="store_true", help="answer from the local store only, without fetching")
+    args = parser.parse_args()
+
+    try:
+        log = get_service().last_hours(args.lpar, args.hours, refresh=not args.cached)
+    except ConsoleLogError as e:
+        sys.exit(f"ERROR: {e}")
+    lines = [line for line in log.lines if args.grep in line] if args.grep else log.lines
+    print("\n".join(lines))
+    print(f"{len(lines)} line(s) of {log.lpar}, complete up to {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(log.end))}; "
+          f"{log.fetched_bytes:,} bytes fetched.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
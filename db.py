@@ -0,0 +1,194 @@
+# --- db.py ---
+# Pooled PostgreSQL access for the pgvector lookups.
+# Connections are checked out of a bounded, thread-safe pool, health-checked
+# before reuse, and keep track of the server-side statements prepared on them.
+
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.pool
+
+# --- Configuration ---
+DB_NAME = "amai_knowledge_db"
+DB_USER = "amai_user"
+DB_PASSWORD = "Amazone@9" # <-- SET YOUR DB PASSWORD
+DB_HOST = "192.168.2.226"
+DB_PORT = "5432"
+
+POOL_MIN_CONN = 1
+POOL_MAX_CONN = 8
+POOL_WAIT_TIMEOUT = 10      # seconds to wait for a free connection
+CONNECT_TIMEOUT = 5         # seconds for TCP + auth on a new connection
+HEALTH_CHECK_AFTER = 30     # ping connections that sat idle longer than this
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """A connection that remembers its prepared statements and when it was last used."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.last_used = time.monotonic()
+
+
+def _adapt_vector(array):
+    # float32 reprs are short, so the literal sent to the server is about half
+    # the size of str(array.tolist()).
+    values = ",".join(map(str, np.asarray(array, dtype=np.float32).ravel()))
+    return psycopg2.extensions.AsIs(f"'[{values}]'::vector")
+
+
+psycopg2.extensions.register_adapter(np.ndarray, _adapt_vector)
+
+
+def _connect_kwargs() -> dict:
+    return {
+        "dbname": DB_NAME, "user": DB_USER, "password": DB_PASSWORD,
+        "host": DB_HOST, "port": DB_PORT, "connect_timeout": CONNECT_TIMEOUT,
+        "keepalives": 1, "keepalives_idle": 60,
+    }
+
+
+def connect():
+    """Opens a standalone (unpooled) connection, for scripts such as the ingesters."""
+    return psycopg2.connect(connection_factory=PooledConnection, **_connect_kwargs())
+
+
+# --- Pool ---
+_pool = None
+_pool_lock = threading.Lock()
+# ThreadedConnectionPool raises instead of blocking when it is exhausted, so a
+# semaphore bounds the number of concurrent checkouts.
+_slots = threading.BoundedSemaphore(POOL_MAX_CONN)
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = psycopg2.pool.ThreadedConnectionPool(
+                    POOL_MIN_CONN, POOL_MAX_CONN, connection_factory=PooledConnection, **_connect_kwargs()
+                )
+    return _pool
+
+
+def _is_healthy(conn) -> bool:
+    if conn.closed:
+        return False
+    if time.monotonic() - conn.last_used < HEALTH_CHECK_AFTER:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _checkout(pool):
+    # A stale connection is discarded and replaced; give up after the pool has
+    # had a chance to hand out a fresh one.
+    for _ in range(POOL_MAX_CONN + 1):
+        conn = pool.getconn()
+        if _is_healthy(conn):
+            return conn
+        pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError("Could not obtain a healthy database connection.")
+
+
+@contextmanager
+def get_connection():
+    """Checks a healthy connection out of the pool and returns it when the block exits."""
+    if not _slots.acquire(timeout=POOL_WAIT_TIMEOUT):
+        raise psycopg2.pool.PoolError("Timed out waiting for a free database connection.")
+    conn = None
+    broken = False
+    try:
+        pool = _get_pool()
+        conn = _checkout(pool)
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        if conn is not None:
+            if not broken and not conn.closed:
+                try:
+                    if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                    conn.last_used = time.monotonic()
+                except psycopg2.Error:
+                    broken = True
+            pool.putconn(conn, close=broken or conn.closed)
+        _slots.release()
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+# --- Prepared statements ---
+_statements = {}
+
+
+def register_statement(name: str, param_types: tuple[str, ...], sql: str):
+    """Declares a statement to be PREPAREd lazily on each pooled connection. Use $1, $2... in sql."""
+    _statements[name] = (param_types, sql)
+
+
+def execute_prepared(cur, name: str, params: tuple):
+    """Runs a registered statement, PREPAREing it first if this connection has not seen it yet."""
+    conn = cur.connection
+    if name not in conn.prepared:
+        param_types, sql = _statements[name]
+        cur.execute(f"PREPARE {name} ({', '.join(param_types)}) AS {sql}")
+        conn.prepared.add(name)
+    placeholders = ", ".join(["%s"] * len(params))
+    cur.execute(f"EXECUTE {name} ({placeholders})", params)
+
+
+# --- Knowledge-base versions ---
+# Each ingest bumps a per-table version so running workers can tell when their
+# in-memory copies (template index, analysis cache) are stale.
+VERSION_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS kb_versions (
+        name TEXT PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+"""
+
+
+def bump_kb_version(cur, name: str):
+    """Increments the version of a KB table inside the caller's transaction."""
+    cur.execute(VERSION_TABLE_DDL)
+    cur.execute(
+        "INSERT INTO kb_versions (name, version) VALUES (%s, 1) "
+        "ON CONFLICT (name) DO UPDATE SET version = kb_versions.version + 1, updated_at = now()",
+        (name,),
+    )
+
+
+def get_kb_version(name: str) -> int | None:
+    """Returns the current version of a KB table, 0 if it was never bumped, or None if the DB is unreachable."""
+    try:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT version FROM kb_versions WHERE name = %s", (name,))
+            row = cur.fetchone()
+    except psycopg2.errors.UndefinedTable:
+        return 0
+    except psycopg2.Error as e:
+        print(f"Could not read KB version for '{name}': {e}")
+        return None
+    return row[0] if row else 0
@@ -0,0 +1,164 @@
+# --- embedding_cache.py ---
+# Cache of query embeddings, so a repeated prompt ("sid check dcuf") or KB
+# query (one of a few dozen abend codes) is not encoded again.
+# all-MiniLM-L6-v2 lowercases its input and splits it on whitespace, so texts
+# that differ only in case or spacing have the same embedding and share an entry.
+#
+# Two tiers, like analysis_cache: a bounded in-process LRU in front of a
+# SQLite file shared by every worker on the host. Keys include
+# embedding_service.model_id(), so a vector is never served to another model
+# or backend. Workers on different backends (e.g. during an onnx rollout)
+# share the file without evicting each other's entries; rows of a model no
+# longer in use age out with the periodic trim.
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import telemetry
+
+CACHE_PATH = "embedding_cache.sqlite3"   # None keeps the cache in memory only
+MAX_MEMORY_ENTRIES = 4096     # a 384-dim float32 vector is 1.5 KB, so about 6 MB
+MAX_DISK_ENTRIES = 50_000
+MAX_TEXT_CHARS = 2000         # longer texts are rarely repeated and not worth a disk write
+MAX_DISK_AGE = 30 * 86400     # seconds; older rows are dropped by the trim
+TRIM_EVERY = 500              # disk writes between trims to MAX_DISK_ENTRIES and MAX_DISK_AGE
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x1f{normalize(text)}".encode()).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str | None = CACHE_PATH, max_entries: int = MAX_MEMORY_ENTRIES,
+                 max_disk_entries: int = MAX_DISK_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._model = None
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._counters = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache ("
+                "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def _use_model(self, model: str):
+        """Drops the memory tier when this process switches models. Called with the lock held.
+
+        The disk rows of the other model stay: another worker may still use it.
+        """
+        if model == self._model:
+            return
+        if self._model is not None:
+            self._counters["invalidations"] += 1
+            self._memory.clear()
+        self._model = model
+
+    # --- Lookups ---
+    def get(self, model: str, text: str) -> np.ndarray | None:
+        """The cached embedding of text, read-only, or None."""
+        if len(text) > MAX_TEXT_CHARS:
+            return None
+        key = cache_key(model, text)
+        with self._lock:
+            self._use_model(model)
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                result = "memory_hit"
+            elif self._conn and (row := self._conn.execute(
+                    "SELECT vector FROM embedding_cache WHERE key = ?", (key,)).fetchone()):
+                vector = np.frombuffer(row[0], dtype=np.float32)
+                self._remember(key, vector)
+                self._counters["disk_hits"] += 1
+                result = "disk_hit"
+            else:
+                self._counters["misses"] += 1
+                result = "miss"
+            if vector is not None:
+                self._counters["hits"] += 1
+        telemetry.count("embedding_cache", result=result)
+        return vector
+
+    def put(self, model: str, text: str, vector: np.ndarray) -> np.ndarray:
+        """Stores an embedding. Returns it as the read-only array the cache keeps."""
+        vector = np.array(vector, dtype=np.float32)
+        vector.flags.writeable = False
+        if len(text) > MAX_TEXT_CHARS:
+            return vector
+        key = cache_key(model, text)
+        with self._lock:
+            self._use_model(model)
+            self._remember(key, vector)
+            self._counters["stores"] += 1
+            if self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO embedding_cache (key, model, vector, created_at) VALUES (?, ?, ?, ?)",
+                    (key, model, vector.tobytes(), time.time()),
+                )
+                self._writes += 1
+                if self._writes % TRIM_EVERY == 0:
+                    self._conn.execute("DELETE FROM embedding_cache WHERE created_at < ?", (time.time() - MAX_DISK_AGE,))
+                    self._conn.execute(
+                        "DELETE FROM embedding_cache WHERE key IN (SELECT key FROM embedding_cache "
+                        "ORDER BY created_at DESC LIMIT -1 OFFSET ?)", (self.max_disk_entries,)
+                    )
+                self._conn.commit()
+        return vector
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._conn:
+                self._conn.execute("DELETE FROM embedding_cache")
+                self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["model"] = self._model
+        return stats
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_cache() -> EmbeddingCache:
+    """The process-wide cache, created on first use."""
+    global _default_cache
+    if _default_cache is None:
+        with _default_lock:
+            if _default_cache is None:
+                try:
+                    _default_cache = EmbeddingCache()
+                except sqlite3.Error as e:
+                    print(f"Embedding cache file unavailable ({e}); caching in memory only.")
+                    _default_cache = EmbeddingCache(path=None)
+    return _default_cache
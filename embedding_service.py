@@ -0,0 +1,148 @@
+# --- embedding_service.py ---
+# One shared sentence-embedding model per process.
+# The model is loaded lazily on first use, under a lock, so importing this
+# module is cheap and concurrent Streamlit sessions never load it twice.
+#
+# Two backends compute the same all-MiniLM-L6-v2 embeddings. EMBEDDING_BACKEND
+# in config.py picks one, and set_backend() switches at runtime:
+#   "torch" - sentence-transformers on PyTorch, the reference implementation
+#   "onnx"  - the int8-quantized export written by export_onnx_model.py, run on ONNX
+#             Runtime. It needs neither torch nor a GPU and uses a fraction of the memory.
+# benchmarks/bench_embeddings.py checks that both pick the same templates and work instructions.
+#
+# Single texts (prompts, KB queries) go through embedding_cache first; batches, as
+# in the ingesters, are always encoded.
+
+import threading
+from pathlib import Path
+
+import numpy as np
+
+import embedding_cache
+import telemetry
+from config import EMBEDDING_BACKEND
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384
+DEFAULT_BATCH_SIZE = 64
+BACKENDS = ("torch", "onnx")
+ONNX_MODEL_DIR = Path(__file__).with_name("models") / f"{MODEL_NAME}-onnx-int8"
+MAX_SEQ_LENGTH = 256   # all-MiniLM-L6-v2 truncates inputs to this many tokens
+ONNX_BATCH_TOKENS = 2048   # padded tokens per ONNX run; bounds the attention buffers to ~100 MB
+
+backend = EMBEDDING_BACKEND
+_model = None
+_model_lock = threading.Lock()
+
+
+class OnnxEncoder:
+    """The sentence-transformers pipeline for this model (tokenize, BERT, mean pooling, L2 normalization) on ONNX Runtime."""
+
+    def __init__(self, model_dir: Path = ONNX_MODEL_DIR, threads: int | None = None):
+        import onnxruntime
+        from tokenizers import Tokenizer
+        model_dir = Path(model_dir)
+        if not (model_dir / "model.onnx").exists():
+            raise FileNotFoundError(f"No ONNX model in {model_dir}; run export_onnx_model.py first.")
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(MAX_SEQ_LENGTH)
+        self.tokenizer.no_padding()          # batches are padded in encode(), to their own longest text
+        options = onnxruntime.SessionOptions()
+        # Without the arena, buffers sized for one large batch are returned instead of kept for the process lifetime.
+        options.enable_cpu_mem_arena = False
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(str(model_dir / "model.onnx"), options,
+                                                    providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def _embed_batch(self, encodings) -> np.ndarray:
+        length = max(len(e.ids) for e in encodings)
+        ids = np.zeros((len(encodings), length), dtype=np.int64)
+        mask = np.zeros((len(encodings), length), dtype=np.int64)
+        for row, encoding in enumerate(encodings):
+            ids[row, :len(encoding.ids)] = encoding.ids
+            mask[row, :len(encoding.ids)] = 1
+        feed = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self._input_names:
+            feed["token_type_ids"] = np.zeros_like(ids)
+        hidden = self.session.run(None, feed)[0]
+        weights = mask[..., None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def encode(self, texts, batch_size: int = DEFAULT_BATCH_SIZE, show_progress_bar: bool = False):
+        single = isinstance(texts, str)
+        encodings = self.tokenizer.encode_batch([texts] if single else list(texts))
+        embeddings = np.zeros((len(encodings), EMBEDDING_DIM), dtype=np.float32)
+        # Texts are batched shortest first, so little compute goes to padding, and a batch of
+        # long texts is cut down to ONNX_BATCH_TOKENS. Memory grows with the padded batch size.
+        order = sorted(range(len(encodings)), key=lambda i: len(encodings[i].ids))
+        batch: list[int] = []
+        for i in order:
+            if batch and (len(batch) >= batch_size or (len(batch) + 1) * len(encodings[i].ids) > ONNX_BATCH_TOKENS):
+                embeddings[batch] = self._embed_batch([encodings[j] for j in batch])
+                batch = []
+            batch.append(i)
+        if batch:
+            embeddings[batch] = self._embed_batch([encodings[j] for j in batch])
+        return embeddings[0] if single else embeddings
+
+
+def _load(name: str):
+    if name == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(MODEL_NAME)
+    if name == "onnx":
+        return OnnxEncoder()
+    raise ValueError(f"Unknown embedding backend '{name}'; expected one of {', '.join(BACKENDS)}.")
+
+
+def get_model():
+    """Returns the process-wide encoder for the configured backend, loading it on first call."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                print(f"Loading embedding model '{MODEL_NAME}' ({backend} backend)...")
+                with telemetry.span("embedding.load", model=MODEL_NAME, backend=backend):
+                    _model = _load(backend)
+                print("Embedding model loaded.")
+    return _model
+
+
+def set_backend(name: str):
+    """Switches the backend. The new model is loaded on next use; the old one is released."""
+    global backend, _model
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{name}'; expected one of {', '.join(BACKENDS)}.")
+    with _model_lock:
+        if name != backend:
+            backend, _model = name, None
+
+
+def model_id() -> str:
+    """Identifies the model and backend that produce the current embeddings."""
+    return MODEL_NAME if backend == "torch" else f"{MODEL_NAME}-{backend}-int8"
+
+
+def is_loaded() -> bool:
+    return _model is not None
+
+
+def encode(texts, batch_size: int = DEFAULT_BATCH_SIZE, use_cache: bool = True):
+    """Embeds a single string (returns a 1-D array) or a list of strings (returns a 2-D array).
+
+    A single string's array may be shared with the cache and is read-only.
+    """
+    single = isinstance(texts, str)
+    cache = embedding_cache.get_cache() if single and use_cache else None
+    if cache:
+        cached = cache.get(model_id(), texts)
+        if cached is not None:
+            return cached
+    with telemetry.span("embedding.encode", texts=1 if single else len(texts)):
+        embeddings = get_model().encode(texts, batch_size=batch_size, show_progress_bar=False)
+    if cache:
+        embeddings = cache.put(model_id(), texts, embeddings)
+    return embeddings
@@ -0,0 +1,83 @@
+# --- export_onnx_model.py ---
+# Builds the model for the "onnx" embedding backend: exports the transformer of
+# all-MiniLM-L6-v2 to ONNX, quantizes its weights to int8 and saves the
+# tokenizer next to it. Pooling and normalization are done by
+# embedding_service.OnnxEncoder.
+#
+# Needs torch, transformers, onnx and onnxruntime on the machine that runs it.
+# The app hosts only need onnxruntime and tokenizers.
+#   python export_onnx_model.py [--model sentence-transformers/all-MiniLM-L6-v2] [--output models/...]
+# Then set EMBEDDING_BACKEND = "onnx" in config.py and run benchmarks/bench_embeddings.py.
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+import embedding_service
+
+SAMPLE_TEXTS = [
+    "download the job output sysout from the mainframe for jobname PAYROLL1",
+    "S0C7 data exception in step STEP020",
+    "Template Name: siddcuf. Purpose: Check the SID status on the DCUF LPAR",
+]
+OPSET = 17
+
+
+def export(model_name: str, output: Path, keep_fp32: bool = False) -> Path:
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    output.mkdir(parents=True, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    sample = tokenizer(SAMPLE_TEXTS, padding=True, return_tensors="pt")
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    axes = {0: "batch", 1: "tokens"}
+    fp32_path = output / "model_fp32.onnx"
+
+    class Encoder(torch.nn.Module):
+        # Fixes the input order for tracing and returns only the token embeddings.
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(names, inputs))).last_hidden_state
+
+    with torch.no_grad():
+        torch.onnx.export(Encoder(), tuple(sample[n] for n in names), str(fp32_path), input_names=names,
+                          output_names=["last_hidden_state"], opset_version=OPSET, dynamo=False,
+                          dynamic_axes={n: axes for n in names + ["last_hidden_state"]})
+    # Dynamic quantization: int8 weights, activations quantized per batch at run time.
+    quantize_dynamic(str(fp32_path), str(output / "model.onnx"), weight_type=QuantType.QInt8)
+    if not keep_fp32:
+        fp32_path.unlink()
+    tokenizer.backend_tokenizer.save(str(output / "tokenizer.json"))
+    return output
+
+
+def check(model_name: str, output: Path) -> float:
+    """Lowest cosine similarity between the sentence-transformers and the exported embeddings of SAMPLE_TEXTS."""
+    from sentence_transformers import SentenceTransformer
+    reference = SentenceTransformer(model_name).encode(SAMPLE_TEXTS)
+    exported = embedding_service.OnnxEncoder(output).encode(SAMPLE_TEXTS)
+    return float(np.min(np.sum(reference * exported, axis=1)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the embedding model to int8 ONNX.")
+    parser.add_argument("--model", default=f"sentence-transformers/{embedding_service.MODEL_NAME}")
+    parser.add_argument("--output", type=Path, default=embedding_service.ONNX_MODEL_DIR)
+    parser.add_argument("--keep-fp32", action="store_true", help="also keep the unquantized export")
+    args = parser.parse_args()
+
+    output = export(args.model, args.output, args.keep_fp32)
+    size = (output / "model.onnx").stat().st_size / 1_000_000
+    print(f"Wrote {output / 'model.onnx'} ({size:.1f} MB) and {output / 'tokenizer.json'}.")
+    print(f"Lowest cosine similarity to sentence-transformers on the sample texts: {check(args.model, output):.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# --- health_checks.py ---
+# Runs one AWX template, typically a SID check such as siddcuf, against many
+# LPARs at once. Results are printed as each run finishes.
+#
+#   python health_checks.py --template 14 --lpars DCUF DCUB COM2
+#
+# The template must allow "Prompt on launch" for Limit, so each run can be
+# restricted to one LPAR host.
+
+import argparse
+import sys
+
+from awx_actions import fan_out, lpar_targets, parse_job_summary
+
+DEFAULT_TIMEOUT = 20 * 60  # seconds per LPAR
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an AWX template on several LPARs concurrently.")
+    parser.add_argument("--template", type=int, required=True, help="AWX job template ID")
+    parser.add_argument("--lpars", nargs="+", required=True, help="inventory host names, one run each")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds before a run is canceled")
+    parser.add_argument("--workers", type=int, default=16, help="runs in flight at once")
+    parser.add_argument("--verbose", action="store_true", help="print each run's play summary")
+    args = parser.parse_args()
+
+    failures = 0
+    for result in fan_out(args.template, lpar_targets(args.lpars), timeout=args.timeout, max_workers=args.workers):
+        ok = result.status == "successful"
+        failures += not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {result.target:<10} job {result.job_id}: {result.status} ({result.elapsed:.0f}s)")
+        if args.verbose or not ok:
+            summary = parse_job_summary(result.output)
+            if summary:
+                print("    " + summary.replace("\n", "\n    "))
+    print(f"{len(args.lpars) - failures} of {len(args.lpars)} LPARs passed.")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
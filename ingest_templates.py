@@ -1,60 +1,60 @@
 # --- ingest_templates.py ---
-import pandas as pd
+# Seeds awx_job_templates from awx_templates_kb.csv. Once sync_templates.py has
+# filled the table from AWX, it owns the table: a CSV ingest would drop the
+# synced parameters and every template missing from the CSV, so it refuses
+# to run.
 import psycopg2
-from sentence_transformers import SentenceTransformer
 
-# --- Configuration ---
-DB_NAME = "amai_knowledge_db"
-DB_USER = "amai_user"
-DB_PASSWORD = "Amazone@9" # <-- SET YOUR DB PASSWORD
-DB_HOST = "192.168.2.226"
-DB_PORT = "5432"
+import db
+from ingestion import IngestSpec, IngestStats, run_ingest
 
-print("Loading embedding model...")
-model = SentenceTransformer('all-MiniLM-L6-v2')
-print("Model loaded.")
+TEMPLATES_SPEC = IngestSpec(
+    table="awx_job_templates",
+    csv_path="awx_templates_kb.csv",
+    columns=["template_id", "template_name", "description"],
+    table_ddl="""
+        CREATE TABLE IF NOT EXISTS {table} (
+            id SERIAL PRIMARY KEY,
+            template_id INT NOT NULL,
+            template_name VARCHAR(255) NOT NULL,
+            description TEXT,
+            embedding VECTOR(384),
+            survey_spec JSONB,          -- these three are filled by sync_templates.py
+            extra_vars JSONB,
+            modified TIMESTAMPTZ
+        );
+    """,
+    embed_text=lambda row: f"Template Name: {row['template_name']}. Purpose: {row['description']}",
+    prepare=lambda row: {**row, "template_id": int(row["template_id"])},
+    # The lookups rank by cosine distance (<=>), so the index must use vector_cosine_ops.
+    indexes={
+        "embedding_hnsw_idx": "CREATE INDEX {name} ON {table} USING hnsw (embedding vector_cosine_ops);",
+    },
+)
 
-def setup_database_table(conn):
-    with conn.cursor() as cur:
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS awx_job_templates (
-                id SERIAL PRIMARY KEY,
-                template_id INT NOT NULL,
-                template_name VARCHAR(255) NOT NULL,
-                description TEXT,
-                embedding VECTOR(384)
-            );
-        """)
-        cur.execute("CREATE INDEX IF NOT EXISTS awx_templates_embedding_idx ON awx_job_templates USING ivfflat (embedding vector_l2_ops) WITH (lists = 100);")
-        conn.commit()
-        print("Database table 'awx_job_templates' is ready.")
+def synced_templates() -> int:
+    """Rows of the table written by sync_templates.py; 0 when the table or its sync columns don't exist yet."""
+    conn = db.connect()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT count(*) FROM {TEMPLATES_SPEC.table} WHERE modified IS NOT NULL;")
+            return cur.fetchone()[0]
+    except (psycopg2.errors.UndefinedTable, psycopg2.errors.UndefinedColumn):
+        return 0
+    finally:
+        conn.close()
 
-def ingest_template_data():
+def ingest_template_data() -> IngestStats | None:
     try:
-        conn = psycopg2.connect(dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT)
+        synced = synced_templates()
     except psycopg2.OperationalError as e:
         print(f"ERROR: Could not connect to PostgreSQL. Check connection settings.\n{e}")
-        return
-
-    setup_database_table(conn)
-    df = pd.read_csv("awx_templates_kb.csv")
-    print(f"Found {len(df)} templates to ingest.")
-    
-    with conn.cursor() as cur:
-        cur.execute("TRUNCATE TABLE awx_job_templates RESTART IDENTITY;")
-        for index, row in df.iterrows():
-            text_to_embed = f"Template Name: {row['template_name']}. Purpose: {row['description']}"
-            embedding = model.encode(text_to_embed)
-            # --- THIS IS THE FIX ---
-            # Convert the list to its string representation before passing it to the driver.
-            cur.execute(
-                "INSERT INTO awx_job_templates (template_id, template_name, description, embedding) VALUES (%s, %s, %s, %s)",
-                (row['template_id'], row['template_name'], row['description'], str(embedding.tolist()))
-            )
-        print(f"Ingested {len(df)} templates.")
-    conn.commit()
-    conn.close()
-    print("\nTemplate ingestion complete.")
+        return None
+    if synced:
+        print(f"'{TEMPLATES_SPEC.table}' holds {synced} templates synchronized from AWX; run sync_templates.py "
+              f"instead of re-seeding it from '{TEMPLATES_SPEC.csv_path}'.")
+        return None
+    return run_ingest(TEMPLATES_SPEC)
 
 if __name__ == "__main__":
-    ingest_template_data()
\ No newline at end of file
+    ingest_template_data()
@@ -0,0 +1,160 @@
+# --- ingestion.py ---
+# Shared, incremental CSV -> pgvector ingestion engine.
+#
+# A run streams the CSV in chunks and hashes every row. Rows whose hash is
+# already in the live table are copied over as-is, with their stored
+# embedding. Only new or changed rows are embedded, in batches, and
+# bulk-loaded with execute_values. Everything is written into a staging table,
+# which replaces the live table in a single transaction, so readers never see
+# an empty or half-loaded table. Rows that disappeared from the source are
+# simply not carried over.
+
+import hashlib
+from dataclasses import dataclass, field
+from typing import Callable
+
+import pandas as pd
+import psycopg2
+from psycopg2.extras import execute_values
+
+import db
+import embedding_service
+
+CHUNK_SIZE = 1000
+EMBED_BATCH_SIZE = 64
+SWAP_LOCK_TIMEOUT = "10s"
+
+
+@dataclass
+class IngestSpec:
+    table: str
+    csv_path: str
+    columns: list[str]                  # data columns, in insert order
+    table_ddl: str                      # CREATE TABLE statement with a {table} placeholder
+    embed_text: Callable[[dict], str]
+    prepare: Callable[[dict], dict] = lambda record: record
+    indexes: dict[str, str] = field(default_factory=dict)  # name suffix -> CREATE INDEX with {name} and {table}
+
+
+@dataclass
+class IngestStats:
+    source_rows: int = 0
+    duplicates: int = 0
+    unchanged: int = 0
+    embedded: int = 0
+    deleted: int = 0
+
+
+def content_hash(spec: IngestSpec, record: dict) -> str:
+    digest = hashlib.sha256(embedding_service.MODEL_NAME.encode())
+    for column in spec.columns:
+        digest.update(b"\x1f" + str(record.get(column)).encode())
+    digest.update(b"\x1e" + spec.embed_text(record).encode())
+    return digest.hexdigest()
+
+
+def _prepare_tables(cur, spec: IngestSpec, staging: str) -> set[str]:
+    cur.execute(spec.table_ddl.format(table=spec.table))
+    cur.execute(f"ALTER TABLE {spec.table} ADD COLUMN IF NOT EXISTS content_hash CHAR(64);")
+    cur.execute(f"SELECT DISTINCT content_hash FROM {spec.table} WHERE content_hash IS NOT NULL;")
+    existing = {row[0] for row in cur.fetchall()}
+    cur.execute(f"DROP TABLE IF EXISTS {staging};")
+    cur.execute(spec.table_ddl.format(table=staging))
+    cur.execute(f"ALTER TABLE {staging} ADD COLUMN IF NOT EXISTS content_hash CHAR(64);")
+    return existing
+
+
+def _load_new_rows(cur, spec: IngestSpec, staging: str, rows: list[tuple[dict, str]], batch_size: int):
+    insert_sql = f"INSERT INTO {staging} ({', '.join(spec.columns)}, content_hash, embedding) VALUES %s"
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        embeddings = embedding_service.encode([spec.embed_text(record) for record, _ in batch], batch_size=batch_size)
+        values = [tuple(record[c] for c in spec.columns) + (h, embedding) for (record, h), embedding in zip(batch, embeddings)]
+        execute_values(cur, insert_sql, values, page_size=batch_size)
+
+
+def _copy_unchanged_rows(cur, spec: IngestSpec, staging: str, hashes: set[str]):
+    if not hashes:
+        return
+    columns = ", ".join(spec.columns + ["content_hash", "embedding"])
+    cur.execute(
+        f"INSERT INTO {staging} ({columns}) SELECT DISTINCT ON (content_hash) {columns} "
+        f"FROM {spec.table} WHERE content_hash = ANY(%s);",
+        (list(hashes),),
+    )
+
+
+def _swap_tables(cur, spec: IngestSpec, staging: str):
+    old = f"{spec.table}_old"
+    cur.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}';")
+    cur.execute(f"DROP TABLE IF EXISTS {old};")
+    cur.execute(f"ALTER TABLE {spec.table} RENAME TO {old};")
+    cur.execute(f"ALTER TABLE {staging} RENAME TO {spec.table};")
+    cur.execute(f"DROP TABLE {old};")
+    for suffix in spec.indexes:
+        cur.execute(f"ALTER INDEX IF EXISTS {staging}_{suffix} RENAME TO {spec.table}_{suffix};")
+    db.bump_kb_version(cur, spec.table)
+
+
+def run_ingest(spec: IngestSpec, chunk_size: int = CHUNK_SIZE, batch_size: int = EMBED_BATCH_SIZE,
+               allow_empty: bool = False) -> IngestStats | None:
+    """Synchronizes spec.table with spec.csv_path. Returns run statistics, or None if nothing was swapped in."""
+    try:
+        conn = db.connect()
+    except psycopg2.OperationalError as e:
+        print(f"ERROR: Could not connect to PostgreSQL. Check connection settings.\n{e}")
+        return None
+
+    staging = f"{spec.table}_staging"
+    stats = IngestStats()
+    seen: set[str] = set()
+    try:
+        with conn.cursor() as cur:
+            existing = _prepare_tables(cur, spec, staging)
+        conn.commit()
+        print(f"Table '{spec.table}' has {len(existing)} distinct rows; streaming '{spec.csv_path}'...")
+
+        for chunk in pd.read_csv(spec.csv_path, chunksize=chunk_size, dtype=str, keep_default_na=False):
+            new_rows = []
+            for record in chunk.to_dict("records"):
+                record = spec.prepare(record)
+                stats.source_rows += 1
+                h = content_hash(spec, record)
+                if h in seen:
+                    stats.duplicates += 1
+                    continue
+                seen.add(h)
+                if h in existing:
+                    stats.unchanged += 1
+                else:
+                    new_rows.append((record, h))
+            with conn.cursor() as cur:
+                _load_new_rows(cur, spec, staging, new_rows, batch_size)
+            conn.commit()
+            stats.embedded += len(new_rows)
+            print(f"  {stats.source_rows} rows read, {stats.embedded} embedded so far.")
+
+        if not seen and not allow_empty:
+            print(f"ERROR: '{spec.csv_path}' has no rows; refusing to replace '{spec.table}' with an empty table.")
+            with conn.cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {staging};")
+            conn.commit()
+            return None
+
+        with conn.cursor() as cur:
+            _copy_unchanged_rows(cur, spec, staging, existing & seen)
+            for suffix, ddl in spec.indexes.items():
+                cur.execute(ddl.format(name=f"{staging}_{suffix}", table=staging))
+            _swap_tables(cur, spec, staging)
+        conn.commit()
+        stats.deleted = len(existing - seen)
+    except (psycopg2.Error, OSError) as e:
+        conn.rollback()
+        print(f"ERROR: Ingestion into '{spec.table}' failed; the live table was left untouched.\n{e}")
+        return None
+    finally:
+        conn.close()
+
+    print(f"Ingestion into '{spec.table}' complete: {stats.source_rows} source rows, {stats.unchanged} unchanged, "
+          f"{stats.embedded} embedded, {stats.deleted} deleted, {stats.duplicates} duplicates skipped.")
+    return stats
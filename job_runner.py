@@ -0,0 +1,189 @@
+# --- job_runner.py ---
+# Runs AWX jobs off the Streamlit script thread.
+# A submitted job becomes a JobRecord in a process-wide JobStore. A worker from
+# a small thread pool launches it, polls it with backoff until it finishes,
+# times out or is canceled. Every browser session shares the store. The UI only
+# reads records, so a user can start several jobs and keep chatting while they
+# run. Stdout is read page by page while the job runs. Each page is parsed and
+# written to the log store in the same pass, so a huge log is never fetched or
+# held in memory in one piece.
+
+import dataclasses
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import requests
+
+import awx_actions
+import log_store
+import telemetry
+from ansible_output import AnsibleOutputParser
+
+MAX_WORKERS = 8                  # jobs tracked concurrently; more wait in the queue
+DEFAULT_JOB_TIMEOUT = 2 * 3600   # seconds from launch before the job is canceled
+RETENTION_SECONDS = 3600         # finished records are dropped after this long
+
+FINAL_STATUSES = ("successful", "failed", "error", "canceled", "timeout")
+
+
+@dataclass
+class JobRecord:
+    template_name: str
+    template_id: int
+    extra_vars: dict | None = None
+    owner: str = ""
+    timeout: float = DEFAULT_JOB_TIMEOUT
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    status: str = "queued"       # queued, launching, then AWX's status, then one of FINAL_STATUSES
+    awx_job_id: int | None = None
+    logs: tuple[str, ...] = ()   # log kinds saved in the log store under awx_job_id
+    summary: str = ""            # Ansible play summary lines
+    error: str | None = None
+    submitted_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    cancel_requested: threading.Event = field(default_factory=threading.Event, repr=False, compare=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINAL_STATUSES
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.time()) - self.submitted_at
+
+
+class JobStore:
+    """Thread-safe registry of job records. Readers get copies, so a record never changes under them."""
+
+    def __init__(self):
+        self._records: dict[str, JobRecord] = {}
+        self._lock = threading.Lock()
+
+    def add(self, record: JobRecord):
+        with self._lock:
+            self._records[record.id] = record
+
+    def get(self, record_id: str) -> JobRecord | None:
+        with self._lock:
+            record = self._records.get(record_id)
+            return dataclasses.replace(record) if record else None
+
+    def update(self, record_id: str, **changes):
+        with self._lock:
+            record = self._records[record_id]
+            for name, value in changes.items():
+                setattr(record, name, value)
+            if record.done and record.finished_at is None:
+                record.finished_at = time.time()
+
+    def prune(self, max_age: float = RETENTION_SECONDS):
+        cutoff = time.time() - max_age
+        with self._lock:
+            for record_id in [i for i, r in self._records.items() if r.done and r.finished_at < cutoff]:
+                del self._records[record_id]
+
+
+class JobRunner:
+    def __init__(self, store: JobStore | None = None, max_workers: int = MAX_WORKERS):
+        self.store = store or JobStore()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="awx-job")
+
+    def submit(self, template_name: str, template_id: int, extra_vars: dict | None = None,
+               owner: str = "", timeout: float = DEFAULT_JOB_TIMEOUT) -> JobRecord:
+        record = JobRecord(template_name, template_id, extra_vars, owner, timeout)
+        self.store.prune()
+        self.store.add(record)
+        self._executor.submit(self._run, record.id)
+        return self.store.get(record.id)
+
+    def cancel(self, record_id: str) -> bool:
+        """Asks the worker to cancel the job. Returns False if it has already finished."""
+        record = self.store.get(record_id)
+        if record is None or record.done:
+            return False
+        record.cancel_requested.set()
+        self.store.update(record_id, status="canceling")
+        return True
+
+    def _run(self, record_id: str):
+        record = self.store.get(record_id)
+        try:
+            with telemetry.tags(user=record.owner, record_id=record_id), \
+                    telemetry.span("job", template=record.template_name) as span:
+                self._track(record_id)
+                status = self.store.get(record_id).status
+                span.set(final_status=status)
+                telemetry.count("jobs", status=status)
+        except Exception as e:
+            print(f"ERROR: Job tracker for {record_id} failed. Details: {e}")
+            self.store.update(record_id, status="error", error=str(e))
+
+    def _track(self, record_id: str):
+        record = self.store.get(record_id)
+        if record.cancel_requested.is_set():
+            self.store.update(record_id, status="canceled")
+            return
+        self.store.update(record_id, status="launching")
+        job_id = awx_actions.launch_job_template(record.template_id, record.extra_vars)
+        if not job_id:
+            self.store.update(record_id, status="error", error="Error launching the job. Check the terminal for details.")
+            return
+        self.store.update(record_id, awx_job_id=job_id, status="pending")
+        with telemetry.tags(job_id=job_id):
+            self._follow(record, job_id)
+
+    def _follow(self, record: JobRecord, job_id: int):
+        record_id = record.id
+        reader = awx_actions.JobOutputReader(awx_actions.get_client(), job_id)
+        parser = AnsibleOutputParser()
+        store = log_store.get_store()
+        writer = store.writer(job_id, log_store.FULL_LOG)
+
+        def read_output(final=False):
+            try:
+                for page in reader.read_new(final):
+                    with telemetry.span("awx.parse", bytes=len(page)):
+                        parser.feed(page)
+                    with telemetry.span("log_store.write", bytes=len(page)):
+                        writer.write(page)
+                return True
+            except requests.exceptions.RequestException as e:
+                print(f"WARNING: Could not read stdout of job {job_id} from line {reader.next_line}. Details: {e}")
+                return False
+
+        def on_status(status):
+            if not record.cancel_requested.is_set():
+                self.store.update(record_id, status=status)
+
+        status = awx_actions.wait_for_job_completion(job_id, timeout=record.timeout, stop=record.cancel_requested,
+                                                     on_status=on_status,
+                                                     on_poll=lambda status: status == "running" and read_output())
+        if status is None or status == "timeout":
+            awx_actions.cancel_job(job_id)
+            status = status or "canceled"
+        complete = read_output(final=True)
+        writer.close()
+        parsed = parser.close()
+        logs = [log_store.FULL_LOG]
+        if parsed.sysout:
+            store.put(job_id, log_store.SYSOUT, parsed.sysout)
+            logs.append(log_store.SYSOUT)
+        self.store.update(record_id, status=status, logs=tuple(logs), summary=parsed.summary,
+                          error=None if complete else "The job output could not be fully retrieved.")
+
+
+_default_runner = None
+_default_lock = threading.Lock()
+
+
+def get_runner() -> JobRunner:
+    """The process-wide runner, created on first use."""
+    global _default_runner
+    if _default_runner is None:
+        with _default_lock:
+            if _default_runner is None:
+                _default_runner = JobRunner()
+    return _default_runner
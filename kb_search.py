@@ -0,0 +1,91 @@
+# --- kb_search.py ---
+# Hybrid retrieval over the work_instructions knowledge base.
+# Three sources are queried on one pooled connection and fused with
+# reciprocal-rank fusion:
+#   1. exact / prefix error_code match through the B-tree (text_pattern_ops) index,
+#   2. nearest neighbours through the HNSW cosine index,
+#   3. Postgres full-text match on title and resolution.
+
+import re
+from dataclasses import dataclass, field
+
+import psycopg2
+import psycopg2.errors
+
+import db
+import embedding_service
+
+HNSW_EF_SEARCH = 40        # candidate list size for HNSW scans; higher = better recall, slower
+CANDIDATES_PER_SOURCE = 10
+RRF_K = 60
+# An exact error-code hit is the strongest signal we have, so it outranks the fuzzy sources.
+SOURCE_WEIGHTS = {"code": 3.0, "vector": 1.0, "fulltext": 1.0}
+
+ERROR_CODE_PATTERN = re.compile(r"^[A-Z$#@][A-Z0-9$#@=]{1,9}$")
+
+_COLUMNS = "id, error_code, title, resolution_steps"
+
+db.register_statement(
+    "wi_by_code",
+    ("text", "text", "int"),
+    f"SELECT {_COLUMNS} FROM work_instructions WHERE error_code ~>=~ $1 AND error_code ~<~ $2 "
+    "ORDER BY (error_code = $1) DESC, length(error_code), id LIMIT $3",
+)
+db.register_statement(
+    "wi_nearest",
+    ("vector", "int"),
+    f"SELECT {_COLUMNS} FROM work_instructions ORDER BY embedding <=> $1 LIMIT $2",
+)
+db.register_statement(
+    "wi_fulltext",
+    ("text", "int"),
+    f"SELECT {_COLUMNS} FROM work_instructions, websearch_to_tsquery('english', $1) AS q "
+    "WHERE search_tsv @@ q ORDER BY ts_rank_cd(search_tsv, q) DESC LIMIT $2",
+)
+
+
+@dataclass
+class WorkInstruction:
+    id: int
+    error_code: str | None
+    title: str
+    resolution_steps: str
+    score: float = 0.0
+    sources: list[str] = field(default_factory=list)
+
+
+def _prefix_upper_bound(prefix: str) -> str:
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _fuse(ranked_lists: dict[str, list[tuple]], limit: int) -> list[WorkInstruction]:
+    fused: dict[int, WorkInstruction] = {}
+    for source, rows in ranked_lists.items():
+        weight = SOURCE_WEIGHTS.get(source, 1.0)
+        for rank, (row_id, error_code, title, resolution_steps) in enumerate(rows):
+            doc = fused.setdefault(row_id, WorkInstruction(row_id, error_code, title, resolution_steps))
+            doc.score += weight / (RRF_K + rank + 1)
+            doc.sources.append(source)
+    return sorted(fused.values(), key=lambda d: d.score, reverse=True)[:limit]
+
+
+def search_work_instructions(query_text: str, limit: int = 2, ef_search: int = HNSW_EF_SEARCH) -> list[WorkInstruction]:
+    """Returns the best work instructions for an error code or free-text query. Raises psycopg2.Error on DB failure."""
+    query_text = query_text.strip()
+    code = query_text.upper()
+    query_embedding = embedding_service.encode(query_text)
+    ranked = {}
+    with db.get_connection() as conn, conn.cursor() as cur:
+        if ERROR_CODE_PATTERN.match(code):
+            db.execute_prepared(cur, "wi_by_code", (code, _prefix_upper_bound(code), CANDIDATES_PER_SOURCE))
+            ranked["code"] = cur.fetchall()
+        cur.execute("SET LOCAL hnsw.ef_search = %s", (int(ef_search),))
+        db.execute_prepared(cur, "wi_nearest", (query_embedding, CANDIDATES_PER_SOURCE))
+        ranked["vector"] = cur.fetchall()
+        try:
+            db.execute_prepared(cur, "wi_fulltext", (query_text, CANDIDATES_PER_SOURCE))
+            ranked["fulltext"] = cur.fetchall()
+        except psycopg2.errors.UndefinedColumn:
+            # Table predates the search_tsv column; re-run ingest_work_instructions.py to add it.
+            conn.rollback()
+    return _fuse(ranked, limit)
@@ -0,0 +1,70 @@
+# --- llm_stub.py ---
+# Local stand-in for the Gemini GenerativeModel, so the analysis pipeline and
+# the streaming chat UI can be exercised without an API key or network access.
+# It implements the one method ai_analysis uses, generate_content(prompt,
+# stream=False), with configurable latency and chunking:
+#
+#   import ai_analysis, llm_stub
+#   ai_analysis.llm = llm_stub.StubLLM(first_token_latency=0.5)
+
+import re
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+DEFAULT_ANSWER = """**Executive Summary**
+The job ended abnormally in the failing step reported above.
+
+**Root Cause Analysis**
+The abend and the messages around it point to invalid input data reaching the program.
+
+**Step-by-Step Resolution Plan**
+1. Review the work instructions from the knowledge base listed in the prompt.
+2. Correct the input data or the JCL as described there.
+3. Restart the job from the failing step.
+"""
+_CANDIDATES = re.compile(r"candidates: ([^,.\s]+)")
+
+
+@dataclass
+class StubChunk:
+    text: str
+
+
+def default_responder(prompt: str) -> str:
+    # Triage prompts ask for a bare code; answer with the first rule candidate.
+    if "Return ONLY the code" in prompt:
+        match = _CANDIDATES.search(prompt)
+        return match.group(1) if match else "RC=0000"
+    return DEFAULT_ANSWER
+
+
+class StubLLM:
+    def __init__(self, responder: Callable[[str], str] | str = default_responder, first_token_latency: float = 0.0,
+                 chunk_delay: float = 0.0, chunk_size: int = 24, fail_after_chunks: int | None = None):
+        self.responder = responder
+        self.first_token_latency = first_token_latency
+        self.chunk_delay = chunk_delay
+        self.chunk_size = chunk_size
+        self.fail_after_chunks = fail_after_chunks   # raise mid-stream, like a dropped connection
+        self.prompts: list[str] = []
+
+    def _answer(self, prompt: str) -> str:
+        return self.responder if isinstance(self.responder, str) else self.responder(prompt)
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        self.prompts.append(prompt)
+        answer = self._answer(prompt)
+        if stream:
+            return self._stream(answer)
+        time.sleep(self.first_token_latency + self.chunk_delay * (len(answer) // self.chunk_size))
+        return StubChunk(answer)
+
+    def _stream(self, answer: str):
+        time.sleep(self.first_token_latency)
+        for n, start in enumerate(range(0, len(answer), self.chunk_size)):
+            if self.fail_after_chunks is not None and n >= self.fail_after_chunks:
+                raise ConnectionError("stub stream interrupted")
+            if n:
+                time.sleep(self.chunk_delay)
+            yield StubChunk(answer[start:start + self.chunk_size])
@@ -0,0 +1,237 @@
+# --- log_reducer.py ---
+# Shrinks a sysout to a token budget before it goes into an LLM prompt.
+# The log is split into its JES sections (JESMSGLG, JESJCL, JESYSMSG and the
+# program SYSOUT/SYSPRINT DDs). Repeated lines are collapsed, and windows
+# around error lines and step-end messages are scored. The best windows are
+# kept in log order until the budget is spent. A manifest records what was
+# kept and why, so the model and the operator both know what was left out.
+
+import bisect
+import re
+from dataclasses import dataclass, field
+
+import triage_rules
+
+TOKEN_BUDGET = 6000            # budget for the sysout part of the synthesis prompt
+CHARS_PER_TOKEN = 4            # rough estimate for English/EBCDIC-ish log text
+CONTEXT_BEFORE = 5
+CONTEXT_AFTER = 10
+HEADER_LINES = 12              # top of JESMSGLG: job name, start time, $HASP373
+
+_DD_HEADER = re.compile(
+    r"^[ \t]*(?:-{2,}[ \t]*(?:DDNAME[ \t]*[:=][ \t]*)?(?P<dd>[A-Z$#@][A-Z0-9$#@]{0,7})(?:[ \t]+\S+)?[ \t]*-{2,}"
+    r"|(?P<bare>JESMSGLG|JESJCL|JESYSMSG|SYSOUT|SYSPRINT|SYSUDUMP|CEEDUMP|SYSDBOUT))[ \t]*$",
+    re.M,
+)
+_JOB_LOG_BANNER = re.compile(r"J\s?E\s?S\s?2\s+J\s?O\s?B\s+L\s?O\s?G")
+_JCL_LINE = re.compile(r"^[ \t]*\d+[ \t]+(?://|XX|\+\+)", re.M)
+_SYSMSG_LINE = re.compile(r"^[ \t]*(?:IEF|IEC|IGD|IEA|ICH|IRR)\d{3}", re.M)
+_SYSMSG_END = re.compile(r"\bIEF376I\b")
+_STEP_END = re.compile(r"\b(?:IEF142I|IEF472I|IEF450I|IEF404I|IEF453I|\$HASP395)\b")
+_ERROR_WORDS = re.compile(r"(?:IEF142I|IEF472I|IEF450I|IEF404I|IEF453I|\$HASP395|ERROR|INVALID|NOT FOUND|FAILED|EXCEPTION)")
+# Application error/severe message IDs such as PAYR0017E or DSNU016S. The bare
+# [ES] with a lookbehind scans much faster than a pattern starting with [A-Z].
+_ERROR_MESSAGE_ID = re.compile(r"[ES](?<=\d[ES])\b")
+_APP_MESSAGE_ID = re.compile(r"\b[A-Z]{3,5}\d{3,5}[ES]\b")
+
+STEP_END_SCORE = 15
+APP_ERROR_SCORE = 20
+HEADER_SCORE = 1000            # always keep the job header if anything fits
+
+
+@dataclass
+class Section:
+    name: str
+    start: int                 # index of the first line in the whole log
+    end: int                   # exclusive
+
+
+@dataclass
+class KeptWindow:
+    section: str
+    line_start: int            # 1-based, inclusive, in the original log
+    line_end: int
+    reason: str
+    score: int
+
+
+@dataclass
+class ReducedLog:
+    text: str
+    manifest: list[KeptWindow] = field(default_factory=list)
+    original_lines: int = 0
+    kept_lines: int = 0
+    collapsed_repeats: int = 0
+    estimated_tokens: int = 0
+    reduced: bool = False
+
+    def manifest_summary(self) -> str:
+        if not self.reduced:
+            return f"Full log included ({self.original_lines} lines, ~{self.estimated_tokens} tokens)."
+        parts = [f"{w.section} {w.line_start}-{w.line_end} ({w.reason})" for w in self.manifest]
+        return (f"Kept {self.kept_lines} of {self.original_lines} lines (~{self.estimated_tokens} tokens), "
+                f"{self.collapsed_repeats} repeated lines collapsed. Kept: " + "; ".join(parts))
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _line_locator(text: str):
+    newlines = [m.start() for m in re.finditer("\n", text)]
+    return lambda pos: bisect.bisect_left(newlines, pos)
+
+
+def split_sections(text: str) -> list[Section]:
+    """Splits the log into JES sections, by explicit DD headers when present, else by content."""
+    line_at = _line_locator(text)
+    total_lines = text.count("\n") + 1
+    boundaries = [(line_at(m.start()), m["dd"] or m["bare"]) for m in _DD_HEADER.finditer(text)
+                  if not m.group(0).strip().startswith("------ JES2")]
+    if not boundaries:
+        boundaries = _infer_boundaries(text, line_at)
+    if not boundaries or boundaries[0][0] != 0:
+        first = "JESMSGLG" if _JOB_LOG_BANNER.search(text[:2000]) else "LOG"
+        boundaries.insert(0, (0, first))
+    sections = []
+    for n, (start, name) in enumerate(boundaries):
+        end = boundaries[n + 1][0] if n + 1 < len(boundaries) else total_lines
+        if end > start:
+            sections.append(Section(name, start, end))
+    return sections
+
+
+def _infer_boundaries(text: str, line_at) -> list[tuple[int, str]]:
+    # Without DD headers the sections still come in a fixed order:
+    # job log, JCL listing, system messages (ending with IEF376I), program output.
+    boundaries = []
+    jcl = _JCL_LINE.search(text)
+    if not jcl:
+        return boundaries
+    boundaries.append((line_at(jcl.start()), "JESJCL"))
+    sysmsg = _SYSMSG_LINE.search(text, jcl.end())
+    if not sysmsg:
+        return boundaries
+    boundaries.append((line_at(sysmsg.start()), "JESYSMSG"))
+    sysmsg_end = _SYSMSG_END.search(text, sysmsg.end())
+    if sysmsg_end:
+        next_line = line_at(sysmsg_end.start()) + 1
+        if next_line <= text.count("\n"):
+            boundaries.append((next_line, "SYSOUT"))
+    return boundaries
+
+
+def _collapse_repeats(lines: list[str]) -> tuple[list[str], list[int], int]:
+    """Collapses runs of identical lines. Returns kept lines, their original indexes and the number dropped."""
+    kept, origin = [], []
+    dropped = 0
+    run = 0
+    for i, line in enumerate(lines):
+        if kept and line == kept[-1] and line.strip():
+            run += 1
+            dropped += 1
+            continue
+        if run:
+            kept.append(f"    [previous line repeated {run} more times]")
+            origin.append(i - 1)
+            run = 0
+        kept.append(line)
+        origin.append(i)
+    if run:
+        kept.append(f"    [previous line repeated {run} more times]")
+        origin.append(len(lines) - 1)
+    return kept, origin, dropped
+
+
+def _section_of(sections: list[Section], index: int) -> str:
+    for section in sections:
+        if section.start <= index < section.end:
+            return section.name
+    return "LOG"
+
+
+def _anchors(text: str, triage: triage_rules.TriageResult) -> dict[int, tuple[int, str]]:
+    """Scores individual lines (by index into lines) that deserve context around them."""
+    anchors: dict[int, tuple[int, str]] = {}
+
+    def add(index: int, score: int, reason: str):
+        if index not in anchors or anchors[index][0] < score:
+            anchors[index] = (score, reason)
+
+    for finding in triage.findings:
+        where = f" in {finding.step}" if finding.step else ""
+        add(finding.line_start - 1, max(finding.severity, 1), f"{finding.code}{where}")
+    # Two separate single-purpose scans are faster than one combined alternation.
+    for line_no, line in triage_rules.iter_matching_lines(text, _ERROR_WORDS):
+        if _STEP_END.search(line):
+            add(line_no - 1, STEP_END_SCORE, "step end")
+        else:
+            add(line_no - 1, APP_ERROR_SCORE, "error message")
+    for line_no, line in triage_rules.iter_matching_lines(text, _ERROR_MESSAGE_ID):
+        if _APP_MESSAGE_ID.search(line):
+            add(line_no - 1, APP_ERROR_SCORE, "error message")
+    return anchors
+
+
+def reduce_sysout(sysout_text: str, token_budget: int = TOKEN_BUDGET,
+                  triage: triage_rules.TriageResult | None = None) -> ReducedLog:
+    original = [line.rstrip("\r") for line in sysout_text.split("\n")]
+    lines, origin, collapsed = _collapse_repeats(original)
+    collapsed_text = "\n".join(lines)
+    if estimate_tokens(collapsed_text) <= token_budget:
+        return ReducedLog(collapsed_text, original_lines=len(original), kept_lines=len(lines),
+                          collapsed_repeats=collapsed, estimated_tokens=estimate_tokens(collapsed_text),
+                          reduced=collapsed > 0)
+
+    triage = triage or triage_rules.triage(sysout_text)
+    sections = split_sections(sysout_text)
+    # Triage line numbers refer to the original log; map them onto the collapsed lines.
+    position = {orig: i for i, orig in enumerate(origin)}
+    anchors = {}
+    for orig_index, (score, reason) in _anchors(sysout_text, triage).items():
+        if orig_index in position:
+            anchors[position[orig_index]] = (score, reason)
+    anchors.setdefault(0, (HEADER_SCORE, "job header"))
+
+    budget_chars = token_budget * CHARS_PER_TOKEN
+    used = 0
+    keep = [False] * len(lines)
+    windows: list[tuple[int, int, int, str]] = []
+    for index, (score, reason) in sorted(anchors.items(), key=lambda a: (-a[1][0], a[0])):
+        if reason == "job header":
+            start, end = 0, min(len(lines), HEADER_LINES)
+        else:
+            start, end = max(0, index - CONTEXT_BEFORE), min(len(lines), index + CONTEXT_AFTER + 1)
+        cost = sum(len(lines[i]) + 1 for i in range(start, end) if not keep[i])
+        if used + cost > budget_chars:
+            # Fall back to the anchor line alone rather than dropping it.
+            start, end = index, index + 1
+            cost = 0 if keep[index] else len(lines[index]) + 1
+            if used + cost > budget_chars:
+                continue
+        for i in range(start, end):
+            keep[i] = True
+        used += cost
+        windows.append((start, end, score, reason))
+
+    out: list[str] = []
+    current_section = None
+    last_kept = -1
+    for i, line in enumerate(lines):
+        if not keep[i]:
+            continue
+        section = _section_of(sections, origin[i])
+        if i > last_kept + 1:
+            out.append(f"    ... [lines {origin[last_kept] + 2 if last_kept >= 0 else 1}-{origin[i]} omitted] ...")
+        if section != current_section:
+            out.append(f"=== {section} ===")
+            current_section = section
+        out.append(line)
+        last_kept = i
+    text = "\n".join(out)
+    manifest = [
+        KeptWindow(_section_of(sections, origin[start]), origin[start] + 1, origin[end - 1] + 1, reason, score)
+        for start, end, score, reason in sorted(windows)
+    ]
+    return ReducedLog(text, manifest, original_lines=len(original), kept_lines=sum(keep),
+                      collapsed_repeats=collapsed, estimated_tokens=estimate_tokens(text), reduced=True)
@@ -0,0 +1,252 @@
+# --- log_store.py ---
+# On-disk store for job logs, keyed by AWX job id and log kind (the full
+# Ansible stdout, or the mainframe sysout parsed out of it).
+#
+# A finished job's output never changes, so every log is written exactly once,
+# as zlib-compressed chunks of CHUNK_LINES lines in a SQLite file. Chat
+# messages keep only the job id. The UI reads single pages, the tail, or
+# search hits, and decompresses only the chunks those need. The whole text is
+# assembled only when the user downloads it or the AI pipeline needs it.
+
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+
+LOG_STORE_PATH = "job_logs.sqlite3"
+CHUNK_LINES = 2000
+COMPRESSION_LEVEL = 6
+RETENTION_DAYS = 30
+MAX_SEARCH_HITS = 200
+
+FULL_LOG = "full_log"
+SYSOUT = "sysout"
+
+
+@dataclass
+class LogInfo:
+    job_id: int
+    kind: str
+    total_lines: int
+    total_bytes: int           # uncompressed UTF-8 size
+    stored_bytes: int          # compressed size on disk
+    created_at: float
+
+
+def _split_lines(text: str) -> list[str]:
+    # Lines are "\n"-terminated, as counted by the writer; a final partial line counts as one.
+    if not text:
+        return []
+    lines = text.split("\n")
+    if text.endswith("\n"):
+        lines.pop()
+    return lines
+
+
+class LogWriter:
+    """Appends text to one log as it arrives and stores it in compressed chunks. close() publishes it."""
+
+    def __init__(self, store: "LogStore", job_id: int, kind: str):
+        self.store = store
+        self.job_id = job_id
+        self.kind = kind
+        self._pending: list[str] = []
+        self._pending_lines = 0
+        self._chunk_no = 0
+        self._lines = 0
+        self._bytes = 0
+        self._stored = 0
+        self._closed = False
+
+    def write(self, text: str):
+        if not text:
+            return
+        self._pending.append(text)
+        self._pending_lines += text.count("\n")
+        if self._pending_lines >= CHUNK_LINES:
+            self._flush(final=False)
+
+    def _flush(self, final: bool):
+        text = "".join(self._pending)
+        self._pending, self._pending_lines = [], 0
+        pos = 0
+        while pos < len(text):
+            # Cut after the CHUNK_LINES-th newline; keep the rest pending unless this is the end.
+            cut, count = pos, 0
+            while count < CHUNK_LINES:
+                newline = text.find("\n", cut)
+                if newline == -1:
+                    break
+                cut, count = newline + 1, count + 1
+            if count < CHUNK_LINES and not final:
+                self._pending, self._pending_lines = [text[pos:]], count
+                return
+            if count < CHUNK_LINES:
+                cut = len(text)
+                count += not text.endswith("\n")
+            chunk = text[pos:cut]
+            self._stored += self.store._write_chunk(self.job_id, self.kind, self._chunk_no, self._lines, count, chunk)
+            self._chunk_no += 1
+            self._lines += count
+            self._bytes += len(chunk.encode())
+            pos = cut
+
+    def close(self) -> LogInfo:
+        if not self._closed:
+            self._flush(final=True)
+            self.store._publish(self.job_id, self.kind, self._lines, self._bytes, self._stored)
+            self._closed = True
+        return self.store.info(self.job_id, self.kind)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+
+class LogStore:
+    def __init__(self, path: str = LOG_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS log_chunks ("
+            "job_id INTEGER NOT NULL, kind TEXT NOT NULL, chunk_no INTEGER NOT NULL, "
+            "first_line INTEGER NOT NULL, line_count INTEGER NOT NULL, data BLOB NOT NULL, "
+            "PRIMARY KEY (job_id, kind, chunk_no))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS logs ("
+            "job_id INTEGER NOT NULL, kind TEXT NOT NULL, total_lines INTEGER NOT NULL, "
+            "total_bytes INTEGER NOT NULL, stored_bytes INTEGER NOT NULL, created_at REAL NOT NULL, "
+            "PRIMARY KEY (job_id, kind))"
+        )
+        self._conn.commit()
+
+    # --- Writing ---
+    def writer(self, job_id: int, kind: str) -> LogWriter:
+        """Starts a log. Chunks left by an earlier, unfinished write of the same log are discarded."""
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM logs WHERE job_id = ? AND kind = ?", (job_id, kind)).fetchone():
+                raise ValueError(f"Log {kind} of job {job_id} is already stored.")
+            self._conn.execute("DELETE FROM log_chunks WHERE job_id = ? AND kind = ?", (job_id, kind))
+            self._conn.commit()
+        return LogWriter(self, job_id, kind)
+
+    def put(self, job_id: int, kind: str, text: str) -> LogInfo:
+        with self.writer(job_id, kind) as writer:
+            writer.write(text)
+        return writer.close()
+
+    def _write_chunk(self, job_id, kind, chunk_no, first_line, line_count, text) -> int:
+        data = zlib.compress(text.encode(), COMPRESSION_LEVEL)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO log_chunks (job_id, kind, chunk_no, first_line, line_count, data) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, chunk_no, first_line, line_count, data),
+            )
+            self._conn.commit()
+        return len(data)
+
+    def _publish(self, job_id, kind, total_lines, total_bytes, stored_bytes):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO logs (job_id, kind, total_lines, total_bytes, stored_bytes, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, total_lines, total_bytes, stored_bytes, time.time()),
+            )
+            self._conn.commit()
+
+    # --- Reading ---
+    def info(self, job_id: int, kind: str) -> LogInfo | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT total_lines, total_bytes, stored_bytes, created_at FROM logs WHERE job_id = ? AND kind = ?",
+                (job_id, kind),
+            ).fetchone()
+        return LogInfo(job_id, kind, *row) if row else None
+
+    def _chunks(self, job_id, kind, start=0, end=None):
+        """Yields (first_line, text) of the chunks covering lines [start, end), decompressing one at a time."""
+        query = "SELECT first_line, data FROM log_chunks WHERE job_id = ? AND kind = ? AND first_line + line_count > ?"
+        params = [job_id, kind, start]
+        if end is not None:
+            query += " AND first_line < ?"
+            params.append(end)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY chunk_no", params).fetchall()
+        for first_line, data in rows:
+            yield first_line, zlib.decompress(data).decode()
+
+    def read_lines(self, job_id: int, kind: str, start: int, count: int) -> list[str]:
+        """Returns up to count lines starting at 0-based line start."""
+        start = max(start, 0)
+        lines = []
+        for first_line, text in self._chunks(job_id, kind, start, start + count):
+            chunk_lines = _split_lines(text)
+            lines.extend(chunk_lines[max(start - first_line, 0):start + count - first_line])
+        return lines
+
+    def tail(self, job_id: int, kind: str, count: int) -> tuple[int, list[str]]:
+        """Returns the 0-based index of the first returned line and the last count lines."""
+        info = self.info(job_id, kind)
+        if info is None:
+            return 0, []
+        start = max(info.total_lines - count, 0)
+        return start, self.read_lines(job_id, kind, start, count)
+
+    def search(self, job_id: int, kind: str, needle: str, limit: int = MAX_SEARCH_HITS) -> list[tuple[int, str]]:
+        """Case-insensitive substring search. Returns (0-based line index, line) pairs, at most limit of them."""
+        needle = needle.lower()
+        hits = []
+        for first_line, text in self._chunks(job_id, kind):
+            if needle not in text.lower():
+                continue
+            for offset, line in enumerate(_split_lines(text)):
+                if needle in line.lower():
+                    hits.append((first_line + offset, line))
+                    if len(hits) >= limit:
+                        return hits
+        return hits
+
+    def iter_text(self, job_id: int, kind: str):
+        for _, text in self._chunks(job_id, kind):
+            yield text
+
+    def read_text(self, job_id: int, kind: str) -> str | None:
+        if self.info(job_id, kind) is None:
+            return None
+        return "".join(self.iter_text(job_id, kind))
+
+    # --- Housekeeping ---
+    def prune(self, max_age_days: float = RETENTION_DAYS) -> int:
+        cutoff = time.time() - max_age_days * 86400
+        with self._lock:
+            expired = self._conn.execute("SELECT job_id, kind FROM logs WHERE created_at < ?", (cutoff,)).fetchall()
+            for job_id, kind in expired:
+                self._conn.execute("DELETE FROM log_chunks WHERE job_id = ? AND kind = ?", (job_id, kind))
+                self._conn.execute("DELETE FROM logs WHERE job_id = ? AND kind = ?", (job_id, kind))
+            self._conn.commit()
+        return len(expired)
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_store() -> LogStore:
+    """The process-wide store, created (and pruned) on first use."""
+    global _default_store
+    if _default_store is None:
+        with _default_lock:
+            if _default_store is None:
+                try:
+                    _default_store = LogStore()
+                except sqlite3.Error as e:
+                    print(f"Log store file unavailable ({e}); keeping job logs in memory only.")
+                    _default_store = LogStore(":memory:")
+                _default_store.prune()
+    return _default_store
@@ -0,0 +1,32 @@
+# --- rate_limit.py ---
+# Token-bucket rate limiting, shared by callers that fan out many requests to
+# one service (AWX, Gemini) from several threads.
+
+import threading
+import time
+
+
+class RateLimiter:
+    """Allows `rate` acquisitions per second on average, in bursts of up to `burst`. Thread-safe."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Blocks until a request may go out. Returns the seconds waited."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Take the token now, even if that leaves the bucket in debt, so waiting callers queue up in order.
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
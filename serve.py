@@ -0,0 +1,29 @@
+# --- serve.py ---
+# Starts the Streamlit app with warm-up already running.
+# `streamlit run app.py` executes app.py only when the first browser session
+# connects, so a fresh replica would not start loading models until a user
+# arrives. This launcher starts the warm-up and the metrics/readiness
+# endpoint at boot, then hands over to Streamlit in the same process.
+#
+#   python serve.py [streamlit options, e.g. --server.port 8501]
+
+import sys
+from pathlib import Path
+
+from streamlit.web import cli as stcli
+
+import telemetry
+import warmup
+
+APP_PATH = Path(__file__).with_name("app.py")
+
+
+def main():
+    warmup.start()
+    telemetry.start_metrics_server()
+    sys.argv = ["streamlit", "run", str(APP_PATH), *sys.argv[1:]]
+    sys.exit(stcli.main())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+# --- sync_templates.py ---
+# Synchronizes awx_job_templates, the template routing table, with the job
+# templates that exist in AWX, so it no longer drifts from a hand-maintained
+# CSV. (ingest_templates.py can seed an empty table from awx_templates_kb.csv,
+# and refuses to run once a sync has written it.)
+#
+# A run asks AWX only for templates modified since the newest `modified`
+# already stored, and re-embeds a template only when its name or description
+# changed, using the content hash of ingestion.py. Each template's survey
+# questions, and the extra vars it prompts for on launch, are recorded with it;
+# the app reads a template's parameters from the prompt with them. Templates
+# deleted in AWX are noticed when AWX's template count differs from the
+# table's. Any change bumps the table's kb_versions entry in the same
+# transaction, so running workers reload their template index on their next
+# version check.
+#
+#   python sync_templates.py [--full] [--dry-run]
+# Schedule it like the ingesters, e.g. every 15 minutes from cron.
+
+import argparse
+import json
+import re
+import sys
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import psycopg2
+import requests
+from psycopg2.extras import Json, execute_values
+
+import db
+import embedding_service
+import telemetry
+from awx_actions import AWXClient, get_client
+from ingest_templates import TEMPLATES_SPEC
+from ingestion import EMBED_BATCH_SIZE, content_hash
+
+TABLE = TEMPLATES_SPEC.table
+ENDPOINT = "/api/v2/job_templates/"
+# Columns the table may predate; CREATE TABLE in TEMPLATES_SPEC has them for new tables.
+SYNC_COLUMNS = {"survey_spec": "JSONB", "extra_vars": "JSONB", "modified": "TIMESTAMPTZ", "content_hash": "CHAR(64)"}
+
+_YAML_KEY = re.compile(r"^([A-Za-z_]\w*)\s*:(?:\s+(.*?))?\s*$")
+
+
+@dataclass
+class SyncPlan:
+    embed: list[dict] = field(default_factory=list)     # new templates, or with a new name or description
+    update: list[dict] = field(default_factory=list)    # only parameters or modified time changed
+    delete: list[int] = field(default_factory=list)
+    unchanged: int = 0
+
+    @property
+    def changes(self) -> bool:
+        return bool(self.embed or self.delete or any(r["schema_changed"] for r in self.update))
+
+
+# --- AWX side ---
+def parse_extra_vars(text) -> dict:
+    """Top-level variables of a template's extra_vars, which AWX keeps as JSON or YAML text. Nested YAML stays text."""
+    if isinstance(text, dict):
+        return text
+    if not text or not text.strip():
+        return {}
+    try:
+        value = json.loads(text)
+        return value if isinstance(value, dict) else {}
+    except ValueError:
+        pass
+    variables, nested = {}, None
+    for line in text.splitlines():
+        if not line.strip() or line.lstrip().startswith("#") or line.strip() == "---":
+            continue
+        if line[0] in " \t-" and nested:
+            variables[nested] = (variables[nested] + "\n" + line.strip()).strip()
+            continue
+        match = _YAML_KEY.match(line)
+        if not match:
+            continue
+        key, value = match.group(1), match.group(2) or ""
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+            value = value[1:-1]
+        variables[key] = None if value in ("~", "null") else value
+        nested = key if not value else None
+    return variables
+
+
+def _modified(value) -> datetime | None:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")) if value else None
+
+
+def template_record(template: dict, survey: list | None, stored: dict | None) -> dict:
+    """A table row for an AWX job template. Without a description in AWX, the stored one is kept."""
+    record = {
+        "template_id": template["id"],
+        "template_name": template["name"],
+        "description": template.get("description") or (stored or {}).get("description") or "",
+        "survey_spec": survey,
+        # Extra vars passed at launch are ignored unless the template prompts for them.
+        "extra_vars": parse_extra_vars(template.get("extra_vars")) if template.get("ask_variables_on_launch") else None,
+        "modified": _modified(template.get("modified")),
+    }
+    record["content_hash"] = content_hash(TEMPLATES_SPEC, record)
+    return record
+
+
+def fetch_templates(client: AWXClient, since: datetime | None, stored: dict[int, dict]) -> list[dict]:
+    """Records for the templates modified since `since` (all of them when None). Raises requests.RequestException."""
+    filters = {"modified__gte": since.isoformat()} if since else {}
+    records = []
+    for template in client.list_job_templates(**filters):
+        survey = client.get_survey_spec(template["id"]) if template.get("survey_enabled") else None
+        records.append(template_record(template, survey, stored.get(template["id"])))
+    return records
+
+
+# --- Planning ---
+def plan_sync(stored: dict[int, dict], fetched: list[dict], live_ids: set[int] | None) -> SyncPlan:
+    """What to write for the fetched records. live_ids, when known, are all template ids in AWX; others are deleted."""
+    plan = SyncPlan()
+    for record in fetched:
+        old = stored.get(record["template_id"])
+        if old is None or old["content_hash"] != record["content_hash"]:
+            plan.embed.append(record)
+            continue
+        schema_changed = (old["survey_spec"], old["extra_vars"]) != (record["survey_spec"], record["extra_vars"])
+        if schema_changed or old["modified"] != record["modified"]:
+            plan.update.append({**record, "schema_changed": schema_changed})
+        else:
+            plan.unchanged += 1
+    if live_ids is not None:
+        plan.delete = sorted(set(stored) - live_ids)
+    return plan
+
+
+# --- Database side ---
+def _json(value):
+    return Json(value) if value is not None else None
+
+
+def _prepare_table(cur) -> dict[int, dict]:
+    cur.execute(TEMPLATES_SPEC.table_ddl.format(table=TABLE))
+    for column, kind in SYNC_COLUMNS.items():
+        cur.execute(f"ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS {column} {kind};")
+    cur.execute(f"SELECT template_id, template_name, description, content_hash, survey_spec, extra_vars, modified FROM {TABLE};")
+    names = ["template_id", "template_name", "description", "content_hash", "survey_spec", "extra_vars", "modified"]
+    return {row[0]: dict(zip(names, row)) for row in cur.fetchall()}
+
+
+def _apply(cur, plan: SyncPlan, batch_size: int):
+    for start in range(0, len(plan.embed), batch_size):
+        batch = plan.embed[start:start + batch_size]
+        embeddings = embedding_service.encode([TEMPLATES_SPEC.embed_text(r) for r in batch], batch_size=batch_size)
+        # A template can have several rows after a CSV ingest; they are replaced by one.
+        cur.execute(f"DELETE FROM {TABLE} WHERE template_id = ANY(%s);", ([r["template_id"] for r in batch],))
+        execute_values(
+            cur,
+            f"INSERT INTO {TABLE} (template_id, template_name, description, content_hash, embedding, survey_spec, extra_vars, modified) VALUES %s",
+            [(r["template_id"], r["template_name"], r["description"], r["content_hash"], embedding,
+              _json(r["survey_spec"]), _json(r["extra_vars"]), r["modified"]) for r, embedding in zip(batch, embeddings)],
+        )
+    for r in plan.update:
+        cur.execute(f"UPDATE {TABLE} SET survey_spec = %s, extra_vars = %s, modified = %s WHERE template_id = %s;",
+                    (_json(r["survey_spec"]), _json(r["extra_vars"]), r["modified"], r["template_id"]))
+    if plan.delete:
+        cur.execute(f"DELETE FROM {TABLE} WHERE template_id = ANY(%s);", (plan.delete,))
+    if plan.changes:
+        db.bump_kb_version(cur, TABLE)
+
+
+def sync(client: AWXClient, full: bool = False, dry_run: bool = False, batch_size: int = EMBED_BATCH_SIZE) -> SyncPlan | None:
+    """Brings the table in line with AWX. Returns what was (or, with dry_run, would be) written, or None on failure."""
+    try:
+        conn = db.connect()
+    except psycopg2.OperationalError as e:
+        print(f"ERROR: Could not connect to PostgreSQL. Check connection settings.\n{e}")
+        return None
+    try:
+        with conn.cursor() as cur:
+            stored = _prepare_table(cur)
+        conn.commit()
+        since = None if full else max((r["modified"] for r in stored.values() if r["modified"]), default=None)
+        print(f"Table '{TABLE}' has {len(stored)} templates; asking AWX for "
+              f"{'all templates' if since is None else f'templates modified since {since.isoformat()}'}...")
+        with telemetry.span("templates.sync", full=since is None) as span:
+            fetched = fetch_templates(client, since, stored)
+            live_ids = {r["template_id"] for r in fetched} if since is None else None
+            if live_ids is None and client.count(ENDPOINT) != len(set(stored) | {r["template_id"] for r in fetched}):
+                # Something was deleted in AWX; listing every template finds out what.
+                live_ids = {t["id"] for t in client.list_job_templates()}
+            plan = plan_sync(stored, fetched, live_ids)
+            span.set(fetched=len(fetched), embedded=len(plan.embed), updated=len(plan.update), deleted=len(plan.delete))
+            if not dry_run:
+                with conn.cursor() as cur:
+                    _apply(cur, plan, batch_size)
+                conn.commit()
+    except requests.exceptions.RequestException as e:
+        conn.rollback()
+        print(f"ERROR: Could not read job templates from AWX; '{TABLE}' was left untouched.\n{e}")
+        return None
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"ERROR: Template sync failed; '{TABLE}' was left untouched.\n{e}")
+        return None
+    finally:
+        conn.close()
+
+    verb = "would be" if dry_run else "were"
+    print(f"Template sync {'(dry run) ' if dry_run else ''}complete: {len(fetched)} fetched from AWX, {len(plan.embed)} {verb} "
+          f"embedded, {len(plan.update)} updated in place, {len(plan.delete)} deleted, {plan.unchanged} unchanged.")
+    for record in plan.embed:
+        print(f"  embed  {record['template_id']:>5} {record['template_name']}")
+    for template_id in plan.delete:
+        print(f"  delete {template_id:>5} {stored[template_id]['template_name']}")
+    return plan
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synchronize the template routing table with AWX.")
+    parser.add_argument("--full", action="store_true", help="fetch every template, not only those modified since the last run")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing or embedding")
+    args = parser.parse_args()
+    sys.exit(0 if sync(get_client(), full=args.full, dry_run=args.dry_run) is not None else 1)
+
+
+if __name__ == "__main__":
+    main()
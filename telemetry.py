@@ -0,0 +1,311 @@
+# --- telemetry.py ---
+# Timing spans and counters for the request pipeline: template search, AWX
+# launch/poll/stdout, triage, KB lookup and LLM synthesis.
+#
+#   with telemetry.span("kb.search", query=code) as s:
+#       results = ...
+#       s.set(hits=len(results))
+#
+# Every finished span feeds a per-stage duration histogram. Spans also carry the
+# user and job id set with telemetry.tags(), and their parent span, like
+# OpenTelemetry spans do. Metrics are served in the Prometheus text format by
+# start_metrics_server(), which also answers the health probes registered with
+# register_probe(). Spans can also be appended as JSON lines to a local
+# file (configure(trace_file=...)). The app's admin panel reads the recent
+# spans kept in memory. Metric labels never include users or job ids, so the
+# number of series stays bounded.
+
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+METRIC_PREFIX = "amaio"
+# Bind address of the metrics and probe endpoint. Loopback by default; set
+# METRICS_HOST=0.0.0.0 in a container so kubelet probes and Prometheus can reach it on the pod IP.
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9464"))
+TRACE_FILE = None              # path of a JSON-lines span file; None disables the file exporter
+TRACE_FILE_MAX_BYTES = 50_000_000   # the file is rotated to <path>.1 beyond this size
+RECENT_SPANS = 2000            # finished spans kept in memory for the admin panel
+# Upper bounds, in seconds, of the duration histogram buckets.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+
+_tags: contextvars.ContextVar[dict] = contextvars.ContextVar("telemetry_tags", default={})
+_current: contextvars.ContextVar["Span | None"] = contextvars.ContextVar("telemetry_span", default=None)
+
+
+def _new_id(size: int) -> str:
+    return os.urandom(size).hex()
+
+
+@dataclass
+class Span:
+    name: str
+    attributes: dict = field(default_factory=dict)
+    trace_id: str = ""
+    span_id: str = field(default_factory=lambda: _new_id(8))
+    parent_id: str | None = None
+    start: float = field(default_factory=time.time)
+    duration: float = 0.0
+    status: str = "ok"           # ok or error
+    error: str | None = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name, "trace_id": self.trace_id, "span_id": self.span_id, "parent_span_id": self.parent_id,
+            "start_time_unix_nano": int(self.start * 1e9), "end_time_unix_nano": int((self.start + self.duration) * 1e9),
+            "status": self.status, "error": self.error, "attributes": self.attributes,
+        }
+
+
+class _Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        for n, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                self.buckets[n] += 1
+                break
+        self.count += 1
+        self.total += value
+
+
+def _label_text(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+class Registry:
+    """Counters, per-stage histograms and the recent-span buffer. Thread-safe."""
+
+    def __init__(self, recent: int = RECENT_SPANS):
+        self._lock = threading.Lock()
+        self._counters: dict[tuple[str, tuple], float] = defaultdict(float)
+        self._histograms: dict[tuple[str, str], _Histogram] = {}
+        self._recent: deque[Span] = deque(maxlen=recent)
+        self._trace_file = TRACE_FILE
+        self._file_lock = threading.Lock()
+
+    # --- Recording ---
+    def count(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def record(self, span: Span):
+        with self._lock:
+            histogram = self._histograms.get((span.name, span.status))
+            if histogram is None:
+                histogram = self._histograms[(span.name, span.status)] = _Histogram()
+            histogram.observe(span.duration)
+            self._recent.append(span)
+        if self._trace_file:
+            self._export(span)
+
+    def _export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        with self._file_lock:
+            try:
+                if os.path.exists(self._trace_file) and os.path.getsize(self._trace_file) > TRACE_FILE_MAX_BYTES:
+                    os.replace(self._trace_file, self._trace_file + ".1")
+                with open(self._trace_file, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError as e:
+                print(f"WARNING: Could not write span to {self._trace_file}; disabling the trace file. Details: {e}")
+                self._trace_file = None
+
+    def configure(self, trace_file=...):
+        if trace_file is not ...:
+            self._trace_file = trace_file
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._recent.clear()
+
+    # --- Reading ---
+    def recent_spans(self, name: str | None = None) -> list[Span]:
+        with self._lock:
+            return [s for s in self._recent if name is None or s.name == name]
+
+    def stage_summary(self) -> list[dict]:
+        """One row per span name: lifetime count, errors and mean, plus p50/p95/max over the recent spans."""
+        with self._lock:
+            histograms = {key: (h.count, h.total) for key, h in self._histograms.items()}
+            recent = list(self._recent)
+        durations = defaultdict(list)
+        for span in recent:
+            durations[span.name].append(span.duration)
+        rows = []
+        for name in sorted({name for name, _ in histograms}):
+            count = sum(c for (n, _), (c, _) in histograms.items() if n == name)
+            total = sum(t for (n, _), (_, t) in histograms.items() if n == name)
+            values = sorted(durations.get(name, []))
+            rows.append({
+                "stage": name, "count": count, "errors": histograms.get((name, "error"), (0, 0))[0],
+                "mean_s": total / count if count else 0.0, "total_s": total,
+                "p50_s": values[len(values) // 2] if values else None,
+                "p95_s": values[min(len(values) - 1, int(len(values) * 0.95))] if values else None,
+                "max_s": values[-1] if values else None,
+            })
+        return rows
+
+    def counters(self) -> dict[str, float]:
+        with self._lock:
+            return {f"{name}{_label_text(labels)}": value for (name, labels), value in sorted(self._counters.items())}
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(h.buckets), h.count, h.total) for key, h in self._histograms.items())
+        lines = []
+        metric = f"{METRIC_PREFIX}_stage_duration_seconds"
+        lines += [f"# HELP {metric} Duration of pipeline stages.", f"# TYPE {metric} histogram"]
+        for (stage, status), buckets, count, total in histograms:
+            labels = (("stage", stage), ("status", status))
+            cumulative = 0
+            for bound, n in zip(DURATION_BUCKETS, buckets):
+                cumulative += n
+                lines.append(f"{metric}_bucket{_label_text(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{metric}_bucket{_label_text(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{metric}_sum{_label_text(labels)} {total:.6f}")
+            lines.append(f"{metric}_count{_label_text(labels)} {count}")
+        seen = set()
+        for (name, labels), value in counters:
+            full_name = f"{METRIC_PREFIX}_{name}_total"
+            if full_name not in seen:
+                seen.add(full_name)
+                lines.append(f"# TYPE {full_name} counter")
+            lines.append(f"{full_name}{_label_text(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+# --- Instrumentation API ---
+@contextlib.contextmanager
+def tags(**values):
+    """Attaches tags such as user and job_id to every span started inside the block, in this thread."""
+    token = _tags.set({**_tags.get(), **{k: v for k, v in values.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes):
+    """Times the block as one span. An exception marks the span as an error and is re-raised."""
+    parent = _current.get()
+    current = Span(name, {**_tags.get(), **attributes}, trace_id=parent.trace_id if parent else _new_id(16),
+                   parent_id=parent.span_id if parent else None)
+    token = _current.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        # GeneratorExit only means the consumer stopped reading; that is not a failure.
+        if not isinstance(e, GeneratorExit):
+            current.status, current.error = "error", f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration = time.perf_counter() - started
+        try:
+            _current.reset(token)
+        except ValueError:
+            pass  # a generator holding the span was closed from another context
+        registry.record(current)
+
+
+def record_span(name: str, duration: float, **attributes) -> Span:
+    """Records a span that was timed elsewhere, e.g. time to first token."""
+    parent = _current.get()
+    finished = Span(name, {**_tags.get(), **attributes}, trace_id=parent.trace_id if parent else _new_id(16),
+                    parent_id=parent.span_id if parent else None, start=time.time() - duration, duration=duration)
+    registry.record(finished)
+    return finished
+
+
+def count(name: str, value: float = 1, **labels):
+    """Adds to the counter exported as amaio_<name>_total. Keep label values to a small, fixed set."""
+    registry.count(name, value, **labels)
+
+
+def configure(trace_file=...):
+    """Turns the JSON-lines span file on (a path) or off (None)."""
+    registry.configure(trace_file=trace_file)
+
+
+# --- Prometheus endpoint and probes ---
+_probes: dict[str, Callable[[], tuple[bool, dict]]] = {}
+
+
+def register_probe(path: str, check: Callable[[], tuple[bool, dict]]):
+    """Serves check() at path on the metrics endpoint: 200 when it returns True, else 503, with its dict as JSON."""
+    _probes[path] = check
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path in _probes:
+            ok, detail = _probes[path]()
+            self._send(200 if ok else 503, json.dumps(detail, default=str), "application/json")
+        elif path in ("/metrics", "/"):
+            self._send(200, registry.render_prometheus(), "text/plain; version=0.0.4; charset=utf-8")
+        else:
+            self.send_error(404)
+
+    def _send(self, code: int, text: str, content_type: str):
+        body = text.encode()
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(host: str | None = None, port: int | None = None):
+    """Serves /metrics on a daemon thread, once per process. Returns the server, or None if the port is taken."""
+    global _server
+    host = METRICS_HOST if host is None else host
+    port = METRICS_PORT if port is None else port
+    if _server is None:
+        with _server_lock:
+            if _server is None:
+                try:
+                    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+                except OSError as e:
+                    print(f"WARNING: Metrics endpoint not started on {host}:{port}. Details: {e}")
+                    _server = False
+                    return None
+                server.daemon_threads = True
+                threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+                print(f"Metrics endpoint listening on http://{host}:{server.server_port}/metrics")
+                _server = server
+    return _server or None
@@ -0,0 +1,118 @@
+# --- template_index.py ---
+# In-process copy of the awx_job_templates table for template routing.
+# The embeddings live in a normalized float32 matrix, so scoring every
+# template is a single matrix-vector product. The index polls the
+# 'awx_job_templates' entry in kb_versions and reloads itself in a background
+# thread, so lookups never wait on the database once it has loaded. It also
+# keeps the launch parameters sync_templates.py recorded for each template.
+
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import psycopg2
+
+import db
+
+TABLE_NAME = "awx_job_templates"
+REFRESH_INTERVAL = 30  # seconds between version checks
+
+
+@dataclass
+class TemplateMatch:
+    template_name: str
+    template_id: int
+    similarity: float
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class TemplateIndex:
+    def __init__(self, refresh_interval: float = REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self.version = None
+        self._names: list[str] = []
+        self._ids: list[int] = []
+        self._schemas: dict[int, dict] = {}
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._last_check = 0.0
+
+    def is_ready(self) -> bool:
+        return self.version is not None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def load_rows(self, rows, version=None):
+        """Replaces the index contents with (template_id, template_name, embedding[, survey_spec, extra_vars]) rows."""
+        rows = list(rows)
+        ids = [int(r[0]) for r in rows]
+        names = [r[1] for r in rows]
+        # An empty survey and extra vars say nothing about the template's parameters; it keeps its fallback ones.
+        schemas = {int(r[0]): {"survey": r[3], "extra_vars": r[4]} for r in rows if len(r) > 4 and (r[3] or r[4])}
+        if rows:
+            matrix = _normalize(np.asarray([r[2] for r in rows], dtype=np.float32))
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        # Swap everything at once; readers take a consistent snapshot under the lock.
+        with self._lock:
+            self._ids, self._names, self._matrix, self._schemas = ids, names, matrix, schemas
+            self.version = version if version is not None else (self.version or 0)
+        print(f"Template index loaded {len(ids)} templates (version {self.version}).")
+
+    def refresh(self, force: bool = False) -> bool:
+        """Reloads from the database if the table version changed. Returns True if the index was reloaded."""
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            self._last_check = time.monotonic()
+            version = db.get_kb_version(TABLE_NAME)
+            if version is None or (not force and version == self.version):
+                return False
+            try:
+                with db.get_connection() as conn, conn.cursor() as cur:
+                    # Through to_jsonb(t), tables ingested before sync_templates.py added the columns read as NULL.
+                    cur.execute(f"SELECT template_id, template_name, embedding::real[], to_jsonb(t) -> 'survey_spec', "
+                                f"to_jsonb(t) -> 'extra_vars' FROM {TABLE_NAME} t")
+                    rows = cur.fetchall()
+            except psycopg2.Error as e:
+                print(f"Template index refresh failed: {e}")
+                return False
+            self.load_rows(rows, version)
+            return True
+        finally:
+            self._refresh_lock.release()
+
+    def maybe_refresh(self):
+        """Starts a background version check once the refresh interval has elapsed."""
+        if time.monotonic() - self._last_check < self.refresh_interval:
+            return
+        self._last_check = time.monotonic()
+        threading.Thread(target=self.refresh, name="template-index-refresh", daemon=True).start()
+
+    def schema(self, template_id: int) -> dict | None:
+        """{"survey": questions, "extra_vars": prompted defaults} as recorded by sync_templates.py, or None."""
+        with self._lock:
+            return self._schemas.get(template_id)
+
+    def top_k(self, query_embedding, k: int = 3) -> list[TemplateMatch]:
+        with self._lock:
+            ids, names, matrix = self._ids, self._names, self._matrix
+        if not ids:
+            return []
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+        scores = matrix @ query
+        k = min(k, len(ids))
+        if k < len(ids):
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+        else:
+            best = np.argsort(-scores)
+        return [TemplateMatch(names[i], ids[i], float(scores[i])) for i in best]
@@ -1,37 +1,138 @@
 # --- template_selector.py ---
-import psycopg2
-from sentence_transformers import SentenceTransformer
+import re
+from dataclasses import dataclass, field
 
-# --- Configuration ---
-DB_NAME = "amai_knowledge_db"
-DB_USER = "amai_user"
-DB_PASSWORD = "Amazone@9" # <-- SET YOUR DB PASSWORD
-DB_HOST = "192.168.2.226"
-DB_PORT = "5432"
+import psycopg2
+import db
+import embedding_service
+import telemetry
+from template_index import TemplateIndex, TemplateMatch
 
-model = SentenceTransformer('all-MiniLM-L6-v2')
 SIMILARITY_THRESHOLD = 0.5
+SUGGESTION_MARGIN = 0.1  # near misses within this distance of the threshold become "did you mean" options
+TOP_K = 3
 
-def find_template_by_similarity(user_prompt: str) -> tuple[str | None, int | None]:
+template_index = TemplateIndex()
+
+
+@dataclass
+class TemplateParameter:
+    variable: str
+    required: bool = False
+    type: str = "text"          # AWX survey type: text, textarea, password, integer, float, multiplechoice, multiselect
+    choices: list[str] = field(default_factory=list)
+    default: object = None
+
+# Used until sync_templates.py has recorded a template's survey and extra vars.
+FALLBACK_PARAMETERS = {"joboutput": [TemplateParameter("jobname", required=True)]}
+
+db.register_statement(
+    "template_nearest",
+    ("vector", "int"),
+    "SELECT template_name, template_id, 1 - (embedding <=> $1) AS similarity FROM awx_job_templates ORDER BY embedding <=> $1 LIMIT $2",
+)
+
+def _pgvector_candidates(query_embedding, k: int) -> list[TemplateMatch]:
     try:
-        conn = psycopg2.connect(dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT)
-    except psycopg2.OperationalError:
-        return None, None
-
-    query_embedding = model.encode(user_prompt)
-    best_match = None
-    with conn.cursor() as cur:
-        # --- THIS IS THE FIX ---
-        cur.execute(
-            "SELECT template_name, template_id, 1 - (embedding <=> %s) AS similarity FROM awx_job_templates ORDER BY similarity DESC LIMIT 1",
-            (str(query_embedding.tolist()),)
-        )
-        result = cur.fetchone()
-    conn.close()
-
-    if result:
-        template_name, template_id, similarity = result
-        print(f"Semantic Search: Best match '{template_name}' (Similarity: {similarity:.2f})")
-        if similarity >= SIMILARITY_THRESHOLD:
-            return template_name, template_id
-    return None, None
\ No newline at end of file
+        with db.get_connection() as conn, conn.cursor() as cur:
+            db.execute_prepared(cur, "template_nearest", (query_embedding, k))
+            rows = cur.fetchall()
+    except psycopg2.Error as e:
+        print(f"Template lookup failed: {e}")
+        return []
+    return [TemplateMatch(name, template_id, float(similarity)) for name, template_id, similarity in rows]
+
+def find_template_candidates(user_prompt: str, k: int = TOP_K) -> list[TemplateMatch]:
+    """Returns the k most similar templates, best first, with their cosine similarities."""
+    with telemetry.span("template.search") as span:
+        query_embedding = embedding_service.encode(user_prompt)
+        if not template_index.is_ready():
+            template_index.refresh()
+        else:
+            template_index.maybe_refresh()
+        if template_index.is_ready():
+            candidates = template_index.top_k(query_embedding, k)
+            span.set(source="index")
+        else:
+            candidates = _pgvector_candidates(query_embedding, k)
+            span.set(source="pgvector")
+        if candidates:
+            span.set(template=candidates[0].template_name, similarity=round(candidates[0].similarity, 3))
+        return candidates
+
+def best_template(candidates: list[TemplateMatch]) -> tuple[str | None, int | None]:
+    if candidates:
+        best = candidates[0]
+        print(f"Semantic Search: Best match '{best.template_name}' (Similarity: {best.similarity:.2f})")
+        if best.similarity >= SIMILARITY_THRESHOLD:
+            return best.template_name, best.template_id
+    return None, None
+
+def near_misses(candidates: list[TemplateMatch]) -> list[TemplateMatch]:
+    """Candidates just below the threshold, worth offering as 'did you mean' options."""
+    return [c for c in candidates if SIMILARITY_THRESHOLD - SUGGESTION_MARGIN <= c.similarity < SIMILARITY_THRESHOLD]
+
+def find_template_by_similarity(user_prompt: str) -> tuple[str | None, int | None]:
+    return best_template(find_template_candidates(user_prompt, 1))
+
+def _survey_parameter(question: dict) -> TemplateParameter:
+    choices = question.get("choices") or []
+    if isinstance(choices, str):
+        choices = [c.strip() for c in choices.splitlines() if c.strip()]
+    return TemplateParameter(question["variable"], bool(question.get("required")), question.get("type") or "text",
+                             list(choices), question.get("default"))
+
+def template_parameters(template_name: str, template_id: int) -> list[TemplateParameter]:
+    """The launch parameters of a template: its survey questions, then extra vars it prompts for on launch,
+    then any FALLBACK_PARAMETERS of the template that neither defines.
+
+    An extra var whose default is empty has to be given.
+    """
+    schema = template_index.schema(template_id) or {"survey": None, "extra_vars": None}
+    parameters = [_survey_parameter(q) for q in schema["survey"] or [] if q.get("variable")]
+    known = {p.variable for p in parameters}
+    for variable, default in (schema["extra_vars"] or {}).items():
+        if variable not in known:
+            parameters.append(TemplateParameter(variable, required=default in (None, ""), default=default))
+            known.add(variable)
+    return parameters + [p for p in FALLBACK_PARAMETERS.get(template_name, []) if p.variable not in known]
+
+def _coerce(parameter: TemplateParameter, value: str):
+    """The value as the survey type expects it. Raises ValueError with a message for the user."""
+    if parameter.type == "integer":
+        try:
+            return int(value)
+        except ValueError:
+            raise ValueError(f"`{parameter.variable}` must be a whole number, not `{value}`.")
+    if parameter.type == "float":
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError(f"`{parameter.variable}` must be a number, not `{value}`.")
+    if parameter.type == "multiplechoice":
+        for choice in parameter.choices:
+            if choice.lower() == value.lower():
+                return choice
+        raise ValueError(f"`{parameter.variable}` must be one of {', '.join(f'`{c}`' for c in parameter.choices)}.")
+    return value
+
+def extract_parameters(prompt: str, parameters: list[TemplateParameter]) -> tuple[dict, list[str]]:
+    """Reads `name value` or `name=value` pairs for the given parameters from a prompt.
+
+    Returns the extra vars found and one message per required parameter that is missing or value that is invalid.
+    """
+    extra_vars, problems = {}, []
+    for parameter in parameters:
+        match = re.search(rf"(?<![\w-]){re.escape(parameter.variable)}(?:\s*[=:]\s*|\s+)(\"[^\"]*\"|'[^']*'|[^\s,;]+)",
+                          prompt, re.IGNORECASE)
+        if not match:
+            if parameter.required and parameter.default in (None, ""):
+                problems.append(f"Could not find a value for the `{parameter.variable}` parameter. "
+                                f"Usage: `... {parameter.variable} VALUE ...`")
+            continue
+        value = match.group(1).strip("\"'")
+        try:
+            extra_vars[parameter.variable] = _coerce(parameter, value)
+        except ValueError as e:
+            problems.append(str(e))
+    return extra_vars, problems
@@ -0,0 +1,253 @@
+# --- triage_rules.py ---
+# Deterministic z/OS sysout triage.
+# A set of precompiled rules scans the log line by line for system and user
+# abends, JCL errors, step condition codes, $HASP job-end messages and
+# IEF/IEC/IGD/IEA message IDs. Every hit becomes a Finding with a severity,
+# and the primary error is the most severe finding, earliest in the log on ties.
+# The LLM triage in ai_analysis is only needed when nothing here is conclusive.
+
+import re
+from dataclasses import dataclass, field
+from typing import Callable
+
+# --- Severities ---
+SYSTEM_ABEND = 100
+USER_ABEND = 95
+JCL_ERROR = 90
+ABEND_MESSAGE = 85
+ERROR_MESSAGE = 40
+STEP_NOT_RUN = 30
+INFO = 0
+CONFIDENT_SEVERITY = 60  # at or above this, the rule result is trusted without asking the LLM
+
+SUCCESS_CODE = "RC=0000"
+
+
+@dataclass
+class Finding:
+    code: str
+    kind: str                   # system_abend, user_abend, jcl_error, condition_code, message
+    severity: int
+    line_start: int             # 1-based, inclusive
+    line_end: int
+    step: str | None
+    message_id: str | None
+    text: str
+
+
+@dataclass
+class TriageResult:
+    primary: Finding | None
+    findings: list[Finding] = field(default_factory=list)
+
+    @property
+    def confident(self) -> bool:
+        if self.primary is None:
+            return False
+        return self.primary.severity >= CONFIDENT_SEVERITY or self.primary.code == SUCCESS_CODE
+
+    def candidate_codes(self, limit: int = 5) -> list[str]:
+        codes = []
+        for finding in sorted(self.findings, key=_rank_key):
+            if finding.code not in codes:
+                codes.append(finding.code)
+        return codes[:limit]
+
+
+def _rank_key(finding: Finding):
+    return (-finding.severity, finding.line_start)
+
+
+def rc_code(value) -> str:
+    return f"RC={int(value):04d}"
+
+
+def rc_severity(rc: int) -> int:
+    if rc >= 16: return 80
+    if rc >= 12: return 75
+    if rc >= 8: return 65
+    if rc >= 4: return 25
+    return INFO
+
+
+def _step(tokens: str | None) -> str | None:
+    # IEF messages carry "stepname [procstepname]" between the job name and " - ".
+    if not tokens:
+        return None
+    return ".".join(tokens.split())
+
+
+def _abend_finding(system: str | None, user: str | None):
+    # ABEND=S000 U4088 is a user abend; ABEND=S0C7 U0000 a system one.
+    system = (system or "").upper().lstrip("S")
+    if system and system != "000":
+        return f"S{system}", "system_abend", SYSTEM_ABEND
+    if user and int(user.upper().lstrip("U")) != 0:
+        return f"U{int(user.upper().lstrip('U')):04d}", "user_abend", USER_ABEND
+    return None
+
+
+# --- Rules ---
+# Each rule returns (code, kind, severity) and optionally a step name, or None to ignore the match.
+@dataclass
+class Rule:
+    name: str
+    pattern: re.Pattern
+    build: Callable[[re.Match], tuple | None]
+    message_id: str | None = None
+    span_after: int = 0        # continuation lines that belong to the same message
+
+
+def _ief450(m):
+    hit = _abend_finding(m["sys"], m["user"])
+    return hit and hit + (_step(m["step"]),)
+
+
+def _ief472(m):
+    hit = _abend_finding(m["sys"], m["user"])
+    return hit and hit + (_step(m["step"]),)
+
+
+def _ief142(m):
+    rc = int(m["rc"])
+    return rc_code(rc), "condition_code", rc_severity(rc), _step(m["step"])
+
+
+def _hasp395(m):
+    if not (m["abend"] or m["jcl"] or m["rc"]):
+        return None  # older JES2 levels print a bare "ENDED"
+    if m["abend"]:
+        code = m["abend"].upper()
+        return code, "system_abend" if code.startswith("S") else "user_abend", SYSTEM_ABEND if code.startswith("S") else USER_ABEND
+    if m["jcl"]:
+        return "JCL ERROR", "jcl_error", JCL_ERROR
+    rc = int(m["rc"])
+    return rc_code(rc), "condition_code", rc_severity(rc)
+
+
+def _completion_code(m):
+    if m["sys"]:
+        return _abend_finding(m["sys"], None)
+    return _abend_finding(None, m["user"])
+
+
+def _generic_abend(m):
+    code = m["code"].upper()
+    if code.startswith("U"):
+        return _abend_finding(None, code)
+    return _abend_finding(code, None)
+
+
+def _iec_abend(m):
+    return f"S{m['code'].upper()}", "system_abend", ABEND_MESSAGE, m["step"]
+
+
+def _jcl_error(m):
+    return "JCL ERROR", "jcl_error", JCL_ERROR, _step(m.groupdict().get("step"))
+
+
+def _step_not_run(m):
+    return "STEP NOT RUN", "message", STEP_NOT_RUN, _step(m["step"])
+
+
+def _rc(m):
+    rc = int(m["rc"])
+    return rc_code(rc), "condition_code", rc_severity(rc)
+
+
+def _message_id(m):
+    msg_id = m["id"].upper()
+    if msg_id[-1] in "ES" or msg_id.startswith("IGD"):
+        return msg_id, "message", ERROR_MESSAGE
+    return None
+
+
+_STEP = r"(?P<step>\S+(?:\s+\S+)?)"
+RULES = [
+    Rule("ief450_abend", re.compile(rf"\bIEF450I\s+\S+\s+{_STEP}\s+-\s+ABEND=(?P<sys>S[0-9A-F]{{3}})\s+(?P<user>U\d{{4}})"), _ief450, "IEF450I"),
+    Rule("ief472_completion", re.compile(rf"\bIEF472I\s+\S+\s+{_STEP}\s+-\s+COMPLETION CODE\s+-\s+SYSTEM=(?P<sys>[0-9A-F]{{3}})\s+USER=(?P<user>\d{{4}})"), _ief472, "IEF472I"),
+    Rule("ief142_cond_code", re.compile(rf"\bIEF142I\s+\S+\s+{_STEP}\s+-\s+STEP WAS EXECUTED\s+-\s+COND CODE\s+(?P<rc>\d{{1,4}})"), _ief142, "IEF142I"),
+    Rule("ief272_not_run", re.compile(rf"\bIEF272I\s+\S+\s+{_STEP}\s+-\s+STEP WAS NOT EXECUTED"), _step_not_run, "IEF272I"),
+    Rule("hasp395_ended", re.compile(r"\$HASP395\s+\S+\s+ENDED(?:\s+-\s+(?:ABEND=(?P<abend>[SU][0-9A-F]{3,4})|(?P<jcl>JCL ERROR)|RC=(?P<rc>\d{1,4})))?"), _hasp395, "$HASP395"),
+    Rule("hasp396_jcl", re.compile(r"\$HASP396\s+\S+\s+TERMINATED"), lambda m: ("JCL ERROR", "jcl_error", JCL_ERROR), "$HASP396"),
+    Rule("iefc_jcl", re.compile(r"\b(?P<id>IEFC\d{3}I)\b"), _jcl_error, "IEFC"),
+    Rule("ief453_jcl", re.compile(r"\bIEF453I\s+\S+\s+-\s+JOB FAILED\s+-\s+JCL ERROR"), _jcl_error, "IEF453I"),
+    Rule("ief212_dsn_not_found", re.compile(rf"\bIEF212I\s+\S+\s+{_STEP}\s+\S+\s+-\s+DATA SET NOT FOUND"), _jcl_error, "IEF212I"),
+    Rule("jcl_error_text", re.compile(r"\bJCL ERROR\b"), _jcl_error),
+    Rule("iea995_symptom", re.compile(r"\b(?:SYSTEM COMPLETION CODE=(?P<sys>[0-9A-F]{3})|USER COMPLETION CODE=(?P<user>\d{4}))", re.I), _completion_code, "IEA995I", span_after=1),
+    # IEC141I 013-18,IFG0194K,jobname,stepname,ddname,...
+    Rule("iec_abend", re.compile(r"\bIEC\d{3}I\s+(?P<code>[0-9A-F]{3})-[0-9A-F]{2}\b(?:,[^,]*,[^,]*,(?P<step>[^,\s]+))?"), _iec_abend, "IEC"),
+    Rule("generic_abend", re.compile(r"\bABEND(?:\s+CODE)?\s*[=:]?\s*(?P<code>S[0-9A-F]{3}|U\d{4})\b"), _generic_abend),
+    Rule("utility_highest_cc", re.compile(r"(?:HIGHEST|MAXIMUM) (?:CONDITION|RETURN) CODE (?:WAS\s+|=\s*)(?P<rc>\d{1,4})\b"), _rc),
+    Rule("rc_value", re.compile(r"\bRC\s*[=:]\s*(?P<rc>\d{1,4})\b"), _rc),
+    Rule("message_id", re.compile(r"\b(?P<id>IE[ACF]\d{3,4}[AEIDSW]|IGD\d{5}[AEIDSW])\b"), _message_id),
+]
+
+# Cheap screen run over the whole log in one pass, so the rules only see the
+# few lines that can possibly match. A flat, case-sensitive alternation is
+# several times faster than an equivalent re.I pattern; LE's mixed-case
+# "System Completion Code" is listed explicitly.
+_PREFILTER = re.compile(r"(?:IE[ACF]|IGD|\$HASP|ABEND|COMPLETION CODE|ompletion Code|CONDITION CODE|RETURN CODE|JCL ERROR|RC *[=:])")
+_STEP_START = re.compile(r"\bIEF236I ALLOC\. FOR \S+\s+(?P<step>\S+(?:\s+\S+)?)\s*$")
+
+
+def iter_matching_lines(text: str, pattern: re.Pattern = _PREFILTER):
+    """Yields (line_number, line) for each line containing a match of pattern, in order, in one pass over text."""
+    line_no = 1
+    counted_to = 0
+    line_end = -1
+    for match in pattern.finditer(text):
+        if match.start() < line_end:
+            continue  # another hit on a line we already yielded
+        line_start = text.rfind("\n", 0, match.start()) + 1
+        line_end = text.find("\n", match.start())
+        if line_end == -1:
+            line_end = len(text)
+        line_no += text.count("\n", counted_to, line_start)
+        counted_to = line_start
+        yield line_no, text[line_start:line_end].rstrip("\r")
+
+
+def triage(sysout_text: str) -> TriageResult:
+    """Scans a sysout and returns every finding plus the primary error."""
+    findings: dict[tuple[str, str | None], Finding] = {}
+    current_step = None
+    total_lines = sysout_text.count("\n") + 1
+    for line_no, line in iter_matching_lines(sysout_text):
+        step_start = _STEP_START.search(line)
+        if step_start:
+            current_step = _step(step_start["step"])
+            continue
+        for rule in RULES:
+            match = rule.pattern.search(line)
+            if not match:
+                continue
+            hit = rule.build(match)
+            if not hit:
+                continue
+            code, kind, severity = hit[:3]
+            step = hit[3] if len(hit) > 3 and hit[3] else current_step
+            # One finding per (code, step): the first mention marks the position of
+            # the root cause; a later, more authoritative message only raises its severity.
+            existing = findings.get((code, step))
+            if existing is None:
+                findings[(code, step)] = Finding(
+                    code=code, kind=kind, severity=severity,
+                    line_start=line_no, line_end=min(line_no + rule.span_after, total_lines),
+                    step=step, message_id=rule.message_id, text=line.strip(),
+                )
+            elif severity > existing.severity:
+                existing.severity, existing.kind = severity, kind
+            break  # rules are ordered most-specific first; one finding per line
+    found = list(findings.values())
+    # Job-level messages ($HASP395, IEF453I, IEA995I) name no step; borrow it from
+    # a step-level message that reported the same code.
+    # A JCL error is attributed to the first step that reported any problem.
+    for finding in found:
+        if finding.step is None and finding.severity > INFO:
+            finding.step = next((f.step for f in found if f.code == finding.code and f.step), None)
+        if finding.step is None and finding.kind == "jcl_error":
+            finding.step = next((f.step for f in sorted(found, key=lambda f: f.line_start)
+                                 if f.step and f.severity >= STEP_NOT_RUN), None)
+    primary = min(found, key=_rank_key) if found else None
+    return TriageResult(primary=primary, findings=found)
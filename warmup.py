@@ -0,0 +1,156 @@
+# --- warmup.py ---
+# Background warm-up of the heavy pieces a worker needs before it can answer
+# prompts: the embedding model, the database pool, the template index, the
+# analysis cache's KB version and the Gemini client. start() runs every step on its own daemon thread at boot, so
+# the login page renders straight away. Code that needs the pieces calls
+# wait(), which returns as soon as warm-up has finished.
+#
+# The readiness probe is /ready on the telemetry endpoint. It answers 200 once
+# every step has run and the required ones succeeded. Only the embedding model
+# is required: a database or Gemini outage is shared by every replica, and
+# taking them all out of rotation would not help.
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+import telemetry
+
+WARMUP_TIMEOUT = 120   # seconds a prompt waits for warm-up before going ahead anyway
+READY_PATH = "/ready"
+
+
+def _load_embedding_model():
+    import embedding_service
+    embedding_service.get_model()
+    embedding_service.encode("warm-up", use_cache=False)   # the first encode call is much slower than later ones
+
+
+def _open_db_pool():
+    import db
+    with db.get_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT 1")
+
+
+def _load_template_index():
+    import template_selector
+    index = template_selector.template_index
+    index.refresh()
+    if not index.is_ready():
+        raise RuntimeError("awx_job_templates could not be loaded")
+
+
+def _check_analysis_cache():
+    import analysis_cache
+    analysis_cache.get_cache().refresh_kb_version()   # so the first lookups compare against the real KB version
+
+
+def _configure_llm():
+    import ai_analysis
+    if ai_analysis.get_llm() is None:
+        raise RuntimeError(ai_analysis.LLM_NOT_CONFIGURED)
+
+
+@dataclass
+class Step:
+    name: str
+    run: Callable[[], None]
+    required: bool = False
+    status: str = "pending"      # pending, running, done or failed
+    seconds: float = 0.0
+    error: str | None = None
+
+
+def default_steps() -> list[Step]:
+    return [
+        Step("embedding_model", _load_embedding_model, required=True),
+        Step("db_pool", _open_db_pool),
+        Step("template_index", _load_template_index),
+        Step("analysis_cache", _check_analysis_cache),
+        Step("llm", _configure_llm),
+    ]
+
+
+class Warmup:
+    def __init__(self, steps: list[Step] | None = None):
+        self.steps = steps if steps is not None else default_steps()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self._finished = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self) -> bool:
+        """Starts the warm-up threads. Returns False if it was already started."""
+        with self._lock:
+            if self.started_at is not None:
+                return False
+            self.started_at = time.monotonic()
+        threads = [threading.Thread(target=self._run_step, args=(step,), name=f"warmup-{step.name}", daemon=True)
+                   for step in self.steps]
+        for thread in threads:
+            thread.start()
+        threading.Thread(target=self._join, args=(threads,), name="warmup", daemon=True).start()
+        return True
+
+    def _run_step(self, step: Step):
+        step.status = "running"
+        started = time.perf_counter()
+        try:
+            with telemetry.span(f"warmup.{step.name}"):
+                step.run()
+            step.status = "done"
+        except Exception as e:
+            step.status, step.error = "failed", f"{type(e).__name__}: {e}"
+            print(f"WARNING: Warm-up step '{step.name}' failed. Details: {step.error}")
+        step.seconds = time.perf_counter() - started
+
+    def _join(self, threads):
+        for thread in threads:
+            thread.join()
+        self.finished_at = time.monotonic()
+        print(f"Warm-up finished in {self.finished_at - self.started_at:.1f}s: "
+              + ", ".join(f"{s.name} {s.status} ({s.seconds:.1f}s)" for s in self.steps))
+        self._finished.set()
+
+    def is_finished(self) -> bool:
+        return self._finished.is_set()
+
+    def wait(self, timeout: float | None = WARMUP_TIMEOUT) -> bool:
+        """Blocks until warm-up has finished or timeout passes. Returns whether it finished."""
+        return self._finished.wait(timeout)
+
+    def is_ready(self) -> bool:
+        return self.is_finished() and all(s.status == "done" for s in self.steps if s.required)
+
+    def status(self) -> dict:
+        end = self.finished_at or time.monotonic()
+        return {
+            "ready": self.is_ready(),
+            "finished": self.is_finished(),
+            "elapsed_s": round(end - self.started_at, 3) if self.started_at is not None else None,
+            "steps": {s.name: {"status": s.status, "required": s.required, "seconds": round(s.seconds, 3), "error": s.error}
+                      for s in self.steps},
+        }
+
+
+_default_warmup = None
+_default_lock = threading.Lock()
+
+
+def get_warmup() -> Warmup:
+    """The process-wide warm-up, created on first use."""
+    global _default_warmup
+    if _default_warmup is None:
+        with _default_lock:
+            if _default_warmup is None:
+                _default_warmup = Warmup()
+    return _default_warmup
+
+
+def start() -> Warmup:
+    """Starts the process-wide warm-up once and publishes its readiness probe."""
+    warmup = get_warmup()
+    if warmup.start():
+        telemetry.register_probe(READY_PATH, lambda: (warmup.is_ready(), warmup.status()))
+    return warmup